@@ -63,6 +63,50 @@ public class AIService {
         });
     }
     
+    /**
+     * 批量预测碳排放（一次调用预测多个行业/资源组合）
+     */
+    public CompletableFuture<Map<String, Object>> predictEmissionsBatch(List<Map<String, Object>> items) {
+        return CompletableFuture.supplyAsync(() -> {
+            try {
+                String url = pythonServiceUrl + "/api/predict/emissions/batch";
+                
+                List<Map<String, Object>> requestItems = new ArrayList<>();
+                for (Map<String, Object> item : items) {
+                    Map<String, Object> requestItem = new HashMap<>();
+                    requestItem.put("industry", item.get("industry"));
+                    requestItem.put("resource_type", item.getOrDefault("resourceType", item.get("resource_type")));
+                    requestItem.put("time_period", item.getOrDefault("timePeriod", item.getOrDefault("time_period", 12)));
+                    requestItems.add(requestItem);
+                }
+                
+                Map<String, Object> request = new HashMap<>();
+                request.put("items", requestItems);
+                
+                HttpHeaders headers = new HttpHeaders();
+                headers.setContentType(MediaType.APPLICATION_JSON);
+                
+                HttpEntity<Map<String, Object>> entity = new HttpEntity<>(request, headers);
+                
+                ResponseEntity<String> response = restTemplate.exchange(
+                    url, 
+                    HttpMethod.POST, 
+                    entity, 
+                    String.class
+                );
+                
+                if (response.getStatusCode() == HttpStatus.OK) {
+                    return objectMapper.readValue(response.getBody(), new TypeReference<Map<String, Object>>() {});
+                } else {
+                    throw new RuntimeException("AI批量预测服务调用失败: " + response.getStatusCode());
+                }
+                
+            } catch (Exception e) {
+                throw new RuntimeException("AI批量预测服务调用异常: " + e.getMessage(), e);
+            }
+        });
+    }
+    
     /**
      * 检测异常
      */
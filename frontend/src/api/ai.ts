@@ -8,6 +8,10 @@ export async function aiPredict(params: { industry: string; resourceType: string
 	return http.post('/ai/predict', null, { params })
 }
 
+export async function aiPredictBatch(items: { industry: string; resourceType: string; timePeriod: number }[]) {
+	return http.post('/ai/predict/batch', items)
+}
+
 export async function aiAnomalies(params: { industry: string; timeRange: number }) {
 	return http.post('/ai/anomalies', null, { params })
 }
@@ -1,12 +1,17 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request, Query, WebSocket, WebSocketDisconnect, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse, Response
 import uvicorn
 from loguru import logger
 import os
 import sys
+import io
+import json
+import asyncio
+import pandas as pd
 from pathlib import Path
-from datetime import datetime
+from datetime import date, datetime
+from typing import List, Optional
 
 # 确保可以以项目根为基准导入 models 和 services
 CURRENT_FILE_DIR = Path(__file__).resolve().parent
@@ -16,13 +21,22 @@ if str(PROJECT_ROOT) not in sys.path:
 
 from services.data_collector import DataCollector
 from services.ai_predictor import AIPredictor
-from services.anomaly_detector import AnomalyDetector
-from services.carbon_cycle import CarbonCycleModel
+from services.anomaly_detector import AnomalyDetector, ModelNotReadyError
+from services.anomaly_store import AnomalyStore, TREND_BUCKETS
+from services.artifact_store import ArtifactStore
+from services.carbon_cycle import CarbonCycleModel, period_days
+from services.report_writer import ReportPendingError, ReportFailedError
+from services.compute_executor import ComputeExecutor, ExecutorSaturatedError
+from services.stream_detector import StreamingAnomalyDetector
+from services.fleet_detector import FleetAnomalyDetector
+from services.map_layers import encode_geojson
 from models.schemas import (
     PredictionRequest, PredictionResponse, 
-    AnomalyRequest, AnomalyResponse,
-    CarbonCycleRequest, CarbonCycleResponse,
-    DataCollectionRequest, DataCollectionResponse
+    BatchPredictionRequest, BatchPredictionResponse,
+    AnomalyRequest, AnomalyResponse, AnomalySweepRequest, AnomalySweepResponse, FleetDetectionRequest,
+    CarbonCycleRequest, CarbonCycleResponse, CarbonLayersRequest,
+    DataCollectionRequest, DataCollectionResponse,
+    IndustryType, FLEET_MAX_ROWS
 )
 
 # 配置日志
@@ -32,10 +46,124 @@ os.makedirs("data", exist_ok=True)
 os.makedirs("models", exist_ok=True)
 
 # 初始化服务
+# CPU密集型计算在专用线程池中执行，各接口限制并发并在排队过多时返回503
+compute_executor = ComputeExecutor(
+    max_workers=int(os.getenv("AI_COMPUTE_WORKERS")) if os.getenv("AI_COMPUTE_WORKERS") else None,
+    torch_threads=int(os.getenv("AI_TORCH_THREADS")) if os.getenv("AI_TORCH_THREADS") else None,
+    max_queue=int(os.getenv("AI_COMPUTE_QUEUE", "32")),
+    limits={
+        "predict": int(os.getenv("AI_PREDICT_CONCURRENCY", "64")),
+        "predict_batch": int(os.getenv("AI_PREDICT_BATCH_CONCURRENCY", "4")),
+        "anomaly": int(os.getenv("AI_ANOMALY_CONCURRENCY", "2")),
+        "anomaly_stream": int(os.getenv("AI_ANOMALY_STREAM_CONCURRENCY", "16")),
+        "anomaly_sweep": int(os.getenv("AI_ANOMALY_SWEEP_CONCURRENCY", "1")),
+        "fleet": int(os.getenv("AI_FLEET_CONCURRENCY", "1")),
+        "carbon_cycle": int(os.getenv("AI_CARBON_CYCLE_CONCURRENCY", "1")),
+        "carbon_layers": int(os.getenv("AI_CARBON_LAYERS_CONCURRENCY", "8"))
+    }
+)
+
+class SlotStreamingResponse(StreamingResponse):
+    """占用计算名额的流式响应
+
+    名额在返回响应前占用（排队已满时可直接返回503），在响应结束时释放；
+    客户端在响应体开始前断开或发送失败时生成器不会运行，因此不能只在生成器的 finally 中释放。
+    """
+
+    def __init__(self, content, slot: str, **kwargs):
+        super().__init__(content, **kwargs)
+        self.slot = slot
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.respond(scope, receive, send)
+        finally:
+            compute_executor.release(self.slot)
+
+    async def respond(self, scope, receive, send):
+        await super().__call__(scope, receive, send)
+
+class DuplexStreamingResponse(SlotStreamingResponse):
+    """边读请求体边返回的流式响应
+
+    StreamingResponse 会另起任务监听客户端断开，与 request.stream() 争抢请求体消息；
+    这里只发送响应，客户端断开由读取请求体时抛出的 ClientDisconnect 感知。
+    """
+
+    async def respond(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+def saturated(e: ExecutorSaturatedError) -> HTTPException:
+    """计算队列已满时快速返回503"""
+    logger.warning(str(e))
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
 data_collector = DataCollector()
-ai_predictor = AIPredictor()
-anomaly_detector = AnomalyDetector()
-carbon_cycle_model = CarbonCycleModel()
+ai_predictor = AIPredictor(
+    max_cached_models=int(os.getenv("AI_MAX_CACHED_MODELS", "16")),
+    max_cache_bytes=int(os.getenv("AI_MAX_CACHE_BYTES")) if os.getenv("AI_MAX_CACHE_BYTES") else None,
+    batch_max_size=int(os.getenv("AI_BATCH_MAX_SIZE", "32")),
+    batch_max_wait_ms=float(os.getenv("AI_BATCH_MAX_WAIT_MS", "5")),
+    result_cache_size=int(os.getenv("AI_RESULT_CACHE_SIZE", "1024")),
+    result_cache_ttl=float(os.getenv("AI_RESULT_CACHE_TTL", "300")),
+    bundle_path=os.getenv("AI_MODEL_BUNDLE"),
+    executor=compute_executor.pool
+)
+# 指定 AI_SYNTHETIC_SEED 后模拟数据可复现（压测、演示环境）
+SYNTHETIC_SEED = int(os.getenv("AI_SYNTHETIC_SEED")) if os.getenv("AI_SYNTHETIC_SEED") else None
+# 检测到的异常写入本地 SQLite，供历史查询和趋势图使用
+anomaly_store = AnomalyStore(os.getenv("AI_ANOMALY_STORE", "data/anomalies.db"))
+anomaly_detector = AnomalyDetector(
+    bundle_path=os.getenv("AI_MODEL_BUNDLE"),
+    seed=SYNTHETIC_SEED,
+    store=anomaly_store,
+    processes=int(os.getenv("AI_ANOMALY_PROCESSES")) if os.getenv("AI_ANOMALY_PROCESSES") else None,
+    chunk_rows=int(os.getenv("AI_ANOMALY_CHUNK_ROWS", "16384")),
+    # 缺少异常检测模型时在后台拟合（不阻塞启动）；设为0则只记录警告，需运行 train_models.py --anomaly
+    fit_missing=os.getenv("AI_ANOMALY_FIT_MISSING", "1") != "0"
+)
+# 地图和分析报告按内容去重登记，后台按大小/未访问时长回收
+artifact_store = ArtifactStore(
+    os.getenv("AI_ARTIFACT_INDEX", "data/artifacts.db"),
+    max_bytes=int(float(os.getenv("AI_ARTIFACT_MAX_MB", "512")) * 1024 * 1024),
+    max_age=float(os.getenv("AI_ARTIFACT_MAX_AGE_DAYS", "7")) * 86400,
+    gc_interval=float(os.getenv("AI_ARTIFACT_GC_INTERVAL", "600"))
+)
+carbon_cycle_model = CarbonCycleModel(
+    seed=SYNTHETIC_SEED,
+    map_workers=int(os.getenv("AI_MAP_RENDER_WORKERS", "1")),
+    artifact_store=artifact_store,
+    report_max_pending=int(os.getenv("AI_REPORT_MAX_PENDING", "8"))
+)
+# 访问正在渲染的地图时最多等待的秒数
+MAP_WAIT_TIMEOUT = float(os.getenv("AI_MAP_WAIT_TIMEOUT", "30"))
+stream_detector = StreamingAnomalyDetector(anomaly_detector)
+# 流式检测的阈值范围（POST 与 WebSocket 共用）
+STREAM_THRESHOLD_MIN, STREAM_THRESHOLD_MAX = 0.5, 0.99
+fleet_detector = FleetAnomalyDetector(seed=SYNTHETIC_SEED)
+# 设备级检测上传的CSV大小上限
+FLEET_UPLOAD_MAX_BYTES = int(float(os.getenv("AI_FLEET_UPLOAD_MAX_MB", "64")) * 1024 * 1024)
+
+# 模型文件检查间隔（秒），0 表示只通过 /api/models/reload 手动热加载
+MODEL_WATCH_INTERVAL = float(os.getenv("AI_MODEL_WATCH_INTERVAL", "0"))
+
+def reload_all_models(force: bool = False):
+    """热加载有新版本的预测和异常检测模型（在线程中运行，不阻塞事件循环）"""
+    return {
+        "ai_predictor": ai_predictor.reload_models(force=force),
+        "anomaly_detector": anomaly_detector.reload_models(force=force)
+    }
+
+async def watch_models(interval: float):
+    """定期检查模型文件，发现新版本时后台加载并原子替换"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(reload_all_models)
+        except Exception as e:
+            logger.error(f"模型热加载检查失败: {e}")
 
 # Lifespan 上下文管理器替代 startup/shutdown
 from contextlib import asynccontextmanager
@@ -44,14 +172,22 @@ from contextlib import asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("碳排放AI分析服务启动中...")
     try:
-        # 初始化模型（异步）
+        # 初始化模型（同步初始化放到线程中执行）
         await ai_predictor.initialize_models()
-        await anomaly_detector.initialize_models()
-        await carbon_cycle_model.initialize_models()
+        await asyncio.to_thread(anomaly_detector.initialize_models)
+        await asyncio.to_thread(carbon_cycle_model.initialize_models)
         logger.info("AI模型初始化完成")
     except Exception as e:
         logger.error(f"AI模型初始化失败: {e}")
+    watcher = asyncio.create_task(watch_models(MODEL_WATCH_INTERVAL)) if MODEL_WATCH_INTERVAL > 0 else None
+    artifact_store.start_gc()
     yield
+    if watcher is not None:
+        watcher.cancel()
+    anomaly_detector.close()
+    carbon_cycle_model.close()
+    artifact_store.close()
+    compute_executor.shutdown()
     logger.info("应用关闭，Lifespan清理完成")
 
 # 创建 FastAPI 应用
@@ -119,12 +255,16 @@ async def predict_emissions(request: PredictionRequest):
     """碳排放预测接口"""
     try:
         logger.info(f"开始碳排放预测: {request.industry} - {request.resource_type}")
-        prediction_result = await ai_predictor.predict_emissions(
-            industry=request.industry,
-            resource_type=request.resource_type,
-            time_period=request.time_period,
-            features=request.features
-        )
+        # 推理经微批调度器在计算线程池中执行
+        async with compute_executor.limit("predict"):
+            prediction_result = await ai_predictor.predict_emissions(
+                industry=request.industry,
+                resource_type=request.resource_type,
+                time_period=request.time_period,
+                features=request.features,
+                model_type=request.model_type or "lstm",
+                confidence_level=request.confidence_level or 0.95
+            )
         return PredictionResponse(
             success=True,
             predictions=prediction_result["predictions"],
@@ -133,39 +273,299 @@ async def predict_emissions(request: PredictionRequest):
             trend_analysis=prediction_result["trend_analysis"],
             model_performance=prediction_result.get("model_performance")
         )
+    except ExecutorSaturatedError as e:
+        raise saturated(e)
     except Exception as e:
         logger.error(f"碳排放预测失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/predict/emissions/batch", response_model=BatchPredictionResponse)
+async def predict_emissions_batch(request: BatchPredictionRequest):
+    """批量碳排放预测接口（按模型分组批量推理，可选NDJSON流式返回）"""
+    try:
+        logger.info(f"开始批量碳排放预测: {len(request.items)} 项")
+        if request.stream:
+            # 名额在返回响应前占用，响应结束（含客户端断开）时由响应释放
+            await compute_executor.acquire("predict_batch")
+            async def generate():
+                async for group in ai_predictor.iter_batch_predictions(request.items):
+                    yield "".join(json.dumps(r, ensure_ascii=False, default=str) + "\n" for r in group)
+            return SlotStreamingResponse(generate(), slot="predict_batch", media_type="application/x-ndjson")
+        
+        async with compute_executor.limit("predict_batch"):
+            results = await ai_predictor.predict_emissions_batch(request.items)
+        failed = sum(1 for r in results if not r["success"])
+        return BatchPredictionResponse(
+            success=failed == 0,
+            results=results,
+            total=len(results),
+            failed=failed
+        )
+    except ExecutorSaturatedError as e:
+        raise saturated(e)
+    except Exception as e:
+        logger.error(f"批量碳排放预测失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/models/stats")
+async def get_model_stats():
+    """获取预测模型缓存统计（命中/未命中/淘汰次数）和计算执行器负载"""
+    return {
+        "ai_predictor": ai_predictor.get_model_stats(),
+        "compute_executor": compute_executor.get_stats(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.post("/api/models/reload")
+async def reload_models(force: bool = False):
+    """热加载模型：新版本在后台加载并预热后原子替换，正在处理的请求继续使用旧版本"""
+    try:
+        results = await asyncio.to_thread(reload_all_models, force)
+        return {
+            "success": True,
+            **results,
+            "timestamp": datetime.now().isoformat()
+        }
+    except Exception as e:
+        logger.error(f"模型热加载失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/api/detect/anomalies", response_model=AnomalyResponse)
 async def detect_anomalies(request: AnomalyRequest):
     """异常检测接口"""
     try:
         logger.info(f"开始异常检测: {request.industry}")
-        anomaly_result = await anomaly_detector.detect_anomalies(
+        anomaly_result = await compute_executor.run(
+            "anomaly",
+            anomaly_detector.detect_anomalies,
             industry=request.industry,
             time_range=request.time_range,
-            threshold=request.threshold
+            threshold=request.threshold,
+            include_historical=request.include_historical,
+            frequency=request.frequency,
+            max_anomalies=request.max_anomalies
         )
         return AnomalyResponse(
             success=True,
             anomalies=anomaly_result["anomalies"],
             risk_level=anomaly_result["risk_level"],
             recommendations=anomaly_result["recommendations"],
-            statistical_summary=anomaly_result.get("statistical_summary")
+            statistical_summary=anomaly_result.get("statistical_summary"),
+            historical_anomalies=anomaly_result.get("historical_anomalies")
         )
+    except ExecutorSaturatedError as e:
+        raise saturated(e)
+    except ModelNotReadyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
     except Exception as e:
         logger.error(f"异常检测失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/detect/anomalies/sweep", response_model=AnomalySweepResponse)
+async def detect_anomalies_sweep(request: AnomalySweepRequest):
+    """多行业异常巡检接口：一次请求检测全部（或指定）行业，结果按风险排序"""
+    try:
+        logger.info(f"开始多行业异常巡检: {request.industries or '全部行业'}")
+        sweep_result = await compute_executor.run(
+            "anomaly_sweep",
+            anomaly_detector.detect_anomalies_sweep,
+            industries=request.industries,
+            time_range=request.time_range,
+            threshold=request.threshold,
+            include_anomalies=request.include_anomalies
+        )
+        return AnomalySweepResponse(success=True, **sweep_result)
+    except ExecutorSaturatedError as e:
+        raise saturated(e)
+    except Exception as e:
+        logger.error(f"多行业异常巡检失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/detect/anomalies/stream")
+async def detect_anomalies_stream(request: Request, threshold: float = Query(0.95, ge=STREAM_THRESHOLD_MIN, le=STREAM_THRESHOLD_MAX)):
+    """流式异常检测接口：请求体为NDJSON读数（可分块上传），每条读数返回一行NDJSON事件"""
+    if not anomaly_detector.is_ready():
+        raise HTTPException(status_code=503, detail="异常检测模型尚未初始化")
+    try:
+        await compute_executor.acquire("anomaly_stream")
+    except ExecutorSaturatedError as e:
+        raise saturated(e)
+    
+    async def generate():
+        buffer = b""
+        try:
+            # 每收到一块数据就评分其中完整的行，不等待请求体结束
+            async for chunk in request.stream():
+                buffer += chunk
+                *lines, buffer = buffer.split(b"\n")
+                readings = [json.loads(line) for line in lines if line.strip()]
+                if readings:
+                    events = await compute_executor.submit(stream_detector.score_readings, readings, threshold)
+                    yield "".join(json.dumps(e, ensure_ascii=False, default=str) + "\n" for e in events)
+            if buffer.strip():
+                events = await compute_executor.submit(stream_detector.score_readings, [json.loads(buffer)], threshold)
+                yield "".join(json.dumps(e, ensure_ascii=False, default=str) + "\n" for e in events)
+        except json.JSONDecodeError as e:
+            yield json.dumps({"is_anomaly": False, "error": f"无效的JSON行: {e}"}, ensure_ascii=False) + "\n"
+    
+    return DuplexStreamingResponse(generate(), slot="anomaly_stream", media_type="application/x-ndjson")
+
+@app.websocket("/ws/detect/anomalies")
+async def detect_anomalies_ws(websocket: WebSocket, threshold: float = 0.95):
+    """流式异常检测WebSocket：每条消息为一条读数或读数数组，返回对应的事件数组"""
+    await websocket.accept()
+    # 与 POST 接口相同的阈值范围；每个不同阈值都会创建独立的流状态，不能任意取值
+    if not STREAM_THRESHOLD_MIN <= threshold <= STREAM_THRESHOLD_MAX:
+        await websocket.close(code=1008, reason=f"threshold 须在 {STREAM_THRESHOLD_MIN} 到 {STREAM_THRESHOLD_MAX} 之间")
+        return
+    # 连接已建立，不能在这里排队等待名额（客户端会一直挂起），没有空闲名额时立即关闭
+    try:
+        await compute_executor.try_acquire("anomaly_stream")
+    except ExecutorSaturatedError as e:
+        await websocket.close(code=1013, reason=str(e))
+        return
+    
+    try:
+        while True:
+            message = await websocket.receive_text()
+            try:
+                payload = json.loads(message)
+            except json.JSONDecodeError as e:
+                await websocket.send_json([{"is_anomaly": False, "error": f"无效的JSON: {e}"}])
+                continue
+            readings = payload if isinstance(payload, list) else [payload]
+            events = await compute_executor.submit(stream_detector.score_readings, readings, threshold)
+            await websocket.send_text(json.dumps(events, ensure_ascii=False, default=str))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        compute_executor.release("anomaly_stream")
+
+@app.get("/api/detect/anomalies/stream/stats")
+async def get_stream_stats():
+    """获取流式异常检测各行业的运行状态"""
+    return {
+        "streams": stream_detector.get_stats(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+def _detect_fleet(records, devices: int, hours: int, bucket: str, top_k: int, z_threshold: float):
+    data = fleet_detector.simulate(devices, hours) if records is None else records
+    return fleet_detector.detect(data, bucket=bucket, top_k=top_k, z_threshold=z_threshold)
+
+@app.post("/api/detect/fleet")
+async def detect_fleet_anomalies(request: FleetDetectionRequest):
+    """设备级异常检测接口：按设备基线评分，返回每个时间桶的前 top_k 台异常设备"""
+    try:
+        logger.info(f"开始设备级异常检测: {len(request.records) if request.records else request.devices} 条记录/台设备")
+        result = await compute_executor.run(
+            "fleet", _detect_fleet, request.records, request.devices, request.hours,
+            request.bucket, request.top_k, request.z_threshold
+        )
+        return {"success": True, **result}
+    except ExecutorSaturatedError as e:
+        raise saturated(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"设备级异常检测失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/detect/fleet/upload")
+async def detect_fleet_anomalies_upload(
+    file: UploadFile = File(..., description="能源日志CSV（能源日志模板格式）"),
+    bucket: str = Query("1h"),
+    top_k: int = Query(10, ge=1, le=100),
+    z_threshold: float = Query(3.5, ge=2, le=10)
+):
+    """设备级异常检测接口（上传能源日志CSV，大小和行数有上限）"""
+    # 只多读一个字节用于判断是否超限，超大文件不整体读入内存
+    content = await file.read(FLEET_UPLOAD_MAX_BYTES + 1)
+    if len(content) > FLEET_UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"文件超过 {FLEET_UPLOAD_MAX_BYTES // (1024 * 1024)}MB 上限")
+    try:
+        records = await asyncio.to_thread(lambda: pd.read_csv(io.BytesIO(content), nrows=FLEET_MAX_ROWS + 1))
+        if len(records) > FLEET_MAX_ROWS:
+            raise HTTPException(status_code=413, detail=f"记录数超过 {FLEET_MAX_ROWS} 行上限，请分批上传")
+        result = await compute_executor.run("fleet", _detect_fleet, records, 0, 0, bucket, top_k, z_threshold)
+        return {"success": True, "filename": file.filename, **result}
+    except HTTPException:
+        raise
+    except ExecutorSaturatedError as e:
+        raise saturated(e)
+    except (ValueError, pd.errors.ParserError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"设备级异常检测失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/anomalies/history")
+async def query_anomaly_history(
+    industry: Optional[IndustryType] = None,
+    start: Optional[str] = Query(None, description="开始时间（含）"),
+    end: Optional[str] = Query(None, description="结束时间（不含）"),
+    severity: Optional[List[str]] = Query(None, description="严重程度，可多选"),
+    min_score: Optional[float] = Query(None, ge=0, le=1),
+    limit: int = Query(500, ge=1, le=10000),
+    offset: int = Query(0, ge=0)
+):
+    """查询历史异常记录（按时间升序）"""
+    try:
+        records = await asyncio.to_thread(
+            anomaly_store.query,
+            industry=industry.value if industry else None,
+            start=start, end=end, severities=severity, min_score=min_score,
+            limit=limit, offset=offset
+        )
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "success": True,
+        "anomalies": records,
+        "count": len(records),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/api/anomalies/trend")
+async def query_anomaly_trend(
+    industry: Optional[IndustryType] = None,
+    start: Optional[str] = Query(None, description="开始时间（含）"),
+    end: Optional[str] = Query(None, description="结束时间（不含）"),
+    bucket: str = Query("day", description=f"时间粒度: {'/'.join(TREND_BUCKETS)}"),
+    severity: Optional[List[str]] = Query(None, description="严重程度，可多选")
+):
+    """按时间粒度聚合的历史异常趋势"""
+    try:
+        trend = await asyncio.to_thread(
+            anomaly_store.trend,
+            industry=industry.value if industry else None,
+            start=start, end=end, bucket=bucket, severities=severity
+        )
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "success": True,
+        "bucket": bucket,
+        "trend": trend,
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/api/anomalies/stats")
+async def get_anomaly_store_stats():
+    """历史异常存储统计"""
+    return await asyncio.to_thread(anomaly_store.get_stats)
+
 @app.post("/api/analyze/carbon-cycle", response_model=CarbonCycleResponse)
 async def analyze_carbon_cycle(request: CarbonCycleRequest):
     """碳循环分析接口"""
     try:
         logger.info(f"开始碳循环分析: {request.region}")
-        cycle_result = await carbon_cycle_model.analyze_carbon_cycle(
+        cycle_result = await compute_executor.run(
+            "carbon_cycle",
+            carbon_cycle_model.analyze_carbon_cycle,
             region=request.region,
-            time_period=request.time_period,
+            # 接口的分析周期单位为年，分析引擎按天生成逐日序列
+            time_period=period_days(request.time_period),
             include_remote_sensing=request.include_remote_sensing
         )
         return CarbonCycleResponse(
@@ -175,12 +575,106 @@ async def analyze_carbon_cycle(request: CarbonCycleRequest):
             net_emission=cycle_result["net_emission"],
             sequestration_potential=cycle_result["sequestration_potential"],
             map_data=cycle_result.get("map_data"),
-            temporal_trends=cycle_result.get("temporal_trends")
+            temporal_trends=cycle_result.get("temporal_trends"),
+            report_id=cycle_result.get("report_id")
         )
+    except ExecutorSaturatedError as e:
+        raise saturated(e)
     except Exception as e:
         logger.error(f"碳循环分析失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/analyze/carbon-cycle/layers")
+async def analyze_carbon_cycle_layers(request: CarbonLayersRequest, http_request: Request):
+    """碳循环地图图层接口：只返回碳汇/碳源标记、地区边界和净平衡指示的 GeoJSON（坐标量化，按 Accept-Encoding 压缩），
+    前端在同一张缓存的底图上绘制，无需加载完整的 folium HTML 页面"""
+    try:
+        layers = await compute_executor.run(
+            "carbon_layers",
+            carbon_cycle_model.analyze_map_layers,
+            region=request.region,
+            time_period=period_days(request.time_period),
+            precision=request.precision
+        )
+    except ExecutorSaturatedError as e:
+        raise saturated(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"碳循环图层生成失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    # 图层内容由 spec 哈希和量化精度唯一确定
+    etag = f'"{layers["cache_key"]}-{request.precision}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=300", "Vary": "Accept-Encoding"}
+    if http_request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    body, encoding = encode_geojson(layers["geojson"], http_request.headers.get("accept-encoding", ""))
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/geo+json", headers=headers)
+
+@app.get("/api/maps/{filename}/status")
+async def get_map_status(filename: str):
+    """查询地图渲染状态：ready / pending / failed / missing"""
+    return carbon_cycle_model.map_renderer.status(filename)
+
+@app.get("/maps/{filename}")
+async def get_map(filename: str):
+    """获取地图HTML；地图仍在后台渲染时等待其完成"""
+    status = await asyncio.to_thread(carbon_cycle_model.map_renderer.wait, filename, MAP_WAIT_TIMEOUT)
+    if status["status"] == "pending":
+        raise HTTPException(status_code=503, detail="地图正在渲染，请稍后重试", headers={"Retry-After": "2"})
+    if status["status"] != "ready" or not filename.endswith(".html"):
+        raise HTTPException(status_code=404, detail=status.get("error", "地图不存在"))
+    return FileResponse(carbon_cycle_model.map_renderer.path_for(filename), media_type="text/html")
+
+@app.get("/api/carbon-cycle/reports/{report_id}")
+async def get_carbon_cycle_report(
+    report_id: str,
+    columns: Optional[List[str]] = Query(None, description="要读取的列，默认全部"),
+    start: Optional[date] = Query(None, description="开始日期（含）"),
+    end: Optional[date] = Query(None, description="结束日期（不含）")
+):
+    """读取列式分析报告：清单 + 所选列在日期范围内的逐日序列（内存映射读取）"""
+    try:
+        report = await asyncio.to_thread(
+            carbon_cycle_model.load_analysis_report, report_id, columns, start, end
+        )
+    except ReportPendingError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "2"})
+    except ReportFailedError as e:
+        logger.error(str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"success": True, **report}
+
+@app.get("/api/artifacts")
+async def list_artifacts(
+    kind: Optional[str] = Query(None, description="产物类型：map / report"),
+    region: Optional[str] = Query(None, description="地区"),
+    since: Optional[datetime] = Query(None, description="创建时间下限"),
+    limit: int = Query(100, ge=1, le=1000)
+):
+    """按类型/地区/时间查询已登记的产物（地图、分析报告）"""
+    artifacts = await asyncio.to_thread(
+        artifact_store.query, kind, region, since.timestamp() if since else None, limit
+    )
+    return {"success": True, "count": len(artifacts), "artifacts": artifacts}
+
+@app.get("/api/artifacts/stats")
+async def get_artifact_stats():
+    """产物索引统计"""
+    return await asyncio.to_thread(artifact_store.get_stats)
+
+@app.post("/api/artifacts/gc")
+async def collect_artifacts():
+    """立即执行一次产物回收"""
+    return await asyncio.to_thread(artifact_store.gc)
+
 @app.get("/api/download/template/{template_type}")
 async def download_template(template_type: str):
     """下载数据模板"""
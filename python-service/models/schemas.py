@@ -1,6 +1,6 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator, model_validator
 from typing import List, Dict, Optional, Any
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 from enum import Enum
 
 class SourceType(str, Enum):
@@ -31,6 +31,11 @@ class ResourceType(str, Enum):
     RENEWABLE = "renewable"
     NUCLEAR = "nuclear"
 
+class SamplingFrequency(str, Enum):
+    """采样频率"""
+    DAILY = "daily"
+    HOURLY = "hourly"
+
 class RiskLevel(str, Enum):
     """风险等级"""
     LOW = "low"
@@ -66,7 +71,7 @@ class PredictionRequest(BaseModel):
     resource_type: ResourceType = Field(..., description="资源类型")
     time_period: int = Field(..., description="预测时间周期(月)", ge=1, le=60)
     features: Optional[Dict[str, Any]] = Field(None, description="特征参数")
-    model_type: Optional[str] = Field("lstm", description="模型类型")
+    model_type: Optional[str] = Field("lstm", description="模型类型: lstm(组合独立模型) / multitask(共享多任务模型)")
     confidence_level: Optional[float] = Field(0.95, description="置信水平", ge=0.5, le=0.99)
 
     model_config = {
@@ -86,22 +91,101 @@ class PredictionResponse(BaseModel):
         'protected_namespaces': ()  # 清空保护前缀
     }
 
+class BatchPredictionRequest(BaseModel):
+    """批量预测请求"""
+    items: List[PredictionRequest] = Field(..., description="预测请求列表", min_length=1, max_length=500)
+    stream: Optional[bool] = Field(False, description="是否按模型分组以NDJSON流式返回")
+
+class BatchPredictionResponse(BaseModel):
+    """批量预测响应"""
+    success: bool = Field(..., description="是否全部成功")
+    results: List[Dict[str, Any]] = Field(..., description="各请求的预测结果（按请求顺序）")
+    total: int = Field(..., description="请求数量")
+    failed: int = Field(..., description="失败数量")
+
 # 异常检测相关模型
 class AnomalyRequest(BaseModel):
     """异常检测请求"""
     industry: IndustryType = Field(..., description="行业类型")
-    time_range: int = Field(..., description="检测时间范围(天)", ge=7, le=365)
+    time_range: int = Field(..., description="检测时间范围(天)", ge=7, le=3650)
+    frequency: Optional[SamplingFrequency] = Field(SamplingFrequency.DAILY, description="采样频率（小时级用于多年能耗日志）")
     threshold: Optional[float] = Field(0.95, description="异常检测阈值", ge=0.5, le=0.99)
     include_historical: Optional[bool] = Field(True, description="是否包含历史异常")
+    max_anomalies: int = Field(500, description="返回的异常明细条数上限（分数最高者），完整计数见统计摘要", ge=1, le=5000)
     alert_level: Optional[RiskLevel] = Field(RiskLevel.MEDIUM, description="告警等级")
 
 class AnomalyResponse(BaseModel):
     """异常检测响应"""
     success: bool = Field(..., description="是否成功")
-    anomalies: List[Dict[str, Any]] = Field(..., description="检测到的异常")
+    anomalies: List[Dict[str, Any]] = Field(..., description="检测到的异常（最多 max_anomalies 条）")
     risk_level: RiskLevel = Field(..., description="整体风险等级")
     recommendations: List[str] = Field(..., description="建议措施")
     statistical_summary: Optional[Dict[str, Any]] = Field(None, description="统计摘要")
+    historical_anomalies: Optional[List[Dict[str, Any]]] = Field(None, description="检测窗口之前的历史异常（include_historical 时返回）")
+
+class AnomalySweepRequest(BaseModel):
+    """多行业异常巡检请求"""
+    industries: Optional[List[IndustryType]] = Field(None, description="行业列表，为空时巡检全部行业")
+    time_range: int = Field(30, description="检测时间范围(天)", ge=7, le=365)
+    threshold: Optional[float] = Field(0.95, description="异常检测阈值", ge=0.5, le=0.99)
+    include_anomalies: Optional[bool] = Field(True, description="是否返回各行业的异常明细")
+
+class AnomalySweepResponse(BaseModel):
+    """多行业异常巡检响应"""
+    success: bool = Field(..., description="是否成功")
+    results: List[Dict[str, Any]] = Field(..., description="各行业检测结果（按风险从高到低排序）")
+    overall_risk_level: RiskLevel = Field(..., description="整体风险等级")
+    failed: List[Dict[str, Any]] = Field(default_factory=list, description="检测失败的行业")
+
+# 设备级检测单次请求的数据量上限（行数），更大的数据应分批提交
+FLEET_MAX_ROWS = 2_000_000
+FLEET_MAX_RECORDS = 200_000
+
+class FleetDetectionRequest(BaseModel):
+    """设备级（机队）异常检测请求"""
+    records: Optional[List[Dict[str, Any]]] = Field(None, description="能源日志记录（能源日志模板列，中英文列名均可），为空时使用模拟数据",
+                                                    max_length=FLEET_MAX_RECORDS)
+    devices: int = Field(1000, description="模拟设备数量（records 为空时）", ge=1, le=20000)
+    hours: int = Field(168, description="模拟时长(小时)（records 为空时）", ge=24, le=744)
+    bucket: str = Field("1h", description="时间分桶粒度（如 1h、6h、1D）")
+    top_k: int = Field(10, description="每个时间桶返回的异常设备数", ge=1, le=100)
+    z_threshold: float = Field(3.5, description="稳健Z分数阈值", ge=2, le=10)
+
+    @model_validator(mode="after")
+    def check_simulated_rows(self):
+        # 设备数和时长各自在范围内时，乘积仍可能达到上千万行
+        if self.records is None and self.devices * self.hours > FLEET_MAX_ROWS:
+            raise ValueError(f"模拟数据量 devices×hours 不能超过 {FLEET_MAX_ROWS} 行")
+        return self
+
+# 流式读数时间允许超前服务器时间的误差（设备时钟偏差）
+STREAM_CLOCK_SKEW = timedelta(minutes=5)
+
+class StreamReading(BaseModel):
+    """流式异常检测的单条监测读数（缺失的特征按运行均值补齐）"""
+    industry: IndustryType = Field(..., description="行业类型")
+    timestamp: Optional[str] = Field(None, description="读数时间")
+    emission: Optional[float] = Field(None, description="碳排放量")
+    energy_consumption: Optional[float] = Field(None, description="能源消耗")
+    temperature: Optional[float] = Field(None, description="温度")
+    humidity: Optional[float] = Field(None, description="湿度")
+    pressure: Optional[float] = Field(None, description="气压")
+    wind_speed: Optional[float] = Field(None, description="风速")
+    gdp: Optional[float] = Field(None, description="GDP")
+    policy_factor: Optional[float] = Field(None, description="政策因子")
+
+    @field_validator("timestamp")
+    @classmethod
+    def check_timestamp(cls, value: Optional[str]) -> Optional[str]:
+        # 未来时间的读数写入历史存储后会排在所有记录之后，拒绝而不是静默接受
+        if value is None:
+            return value
+        parsed = datetime.fromisoformat(value)
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone().replace(tzinfo=None)
+        if parsed > datetime.now() + STREAM_CLOCK_SKEW:
+            raise ValueError(f"读数时间不能晚于当前时间: {value}")
+        return value
 
 # 碳循环分析相关模型
 class CarbonCycleRequest(BaseModel):
@@ -112,6 +196,12 @@ class CarbonCycleRequest(BaseModel):
     spatial_resolution: Optional[str] = Field("1km", description="空间分辨率")
     vegetation_types: Optional[List[str]] = Field(None, description="植被类型")
 
+class CarbonLayersRequest(BaseModel):
+    """碳循环地图图层（GeoJSON）请求"""
+    region: str = Field(..., description="分析地区")
+    time_period: int = Field(..., description="分析时间周期(年)", ge=1, le=10)
+    precision: int = Field(4, description="坐标保留的小数位数（4位约11米）", ge=0, le=7)
+
 class CarbonCycleResponse(BaseModel):
     """碳循环分析响应"""
     success: bool = Field(..., description="是否成功")
@@ -121,6 +211,7 @@ class CarbonCycleResponse(BaseModel):
     sequestration_potential: Dict[str, Any] = Field(..., description="固碳潜力")
     map_data: Optional[Dict[str, Any]] = Field(None, description="地图数据")
     temporal_trends: Optional[List[Dict[str, Any]]] = Field(None, description="时间趋势")
+    report_id: Optional[str] = Field(None, description="分析报告ID（后台写入，可通过 /api/carbon-cycle/reports/{report_id} 读取）")
 
 # 通用响应模型
 class ErrorResponse(BaseModel):
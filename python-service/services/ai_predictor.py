@@ -1,86 +1,223 @@
+import asyncio
+import functools
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
+from functools import lru_cache
+from concurrent.futures import Executor
 import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional
+from datetime import datetime
+from typing import Dict, List, Any, Optional, AsyncIterator
 from loguru import logger
 import joblib
 import os
+import zlib
+from sklearn.preprocessing import StandardScaler
 
 import sys
 import os
 # 添加父目录到Python路径，确保可以导入models
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from models.schemas import IndustryType, ResourceType
+from models.schemas import IndustryType, ResourceType, PredictionRequest
+from services.model_registry import ModelRegistry
+from services.inference_batcher import InferenceBatcher
+from services.result_cache import ResultCache
+from services.model_bundle import open_bundle
+
+# 模型输入特征（对应 templates/emissions_template.csv 的数值列，外加月份周期编码）
+FEATURE_COLUMNS = [
+    "emission", "energy_consumption", "gdp", "population", "temperature",
+    "humidity", "policy_factor", "technology_factor", "month_sin", "month_cos"
+]
+SEQUENCE_LENGTH = 12  # 输入窗口长度（月）
+MAX_HORIZON = 60  # 多步输出头一次给出的最大预测月数
+MULTITASK_KEY = "multitask"  # 共享多任务模型的检查点键
+HEAD_DROPOUT = 0.2  # 输出头dropout比例（训练正则化，推理时用于MC-dropout预测区间）
+MC_SAMPLES = 100  # MC-dropout采样次数
+
+# 多任务模型中行业/资源嵌入的索引
+INDUSTRY_INDEX = {industry: i for i, industry in enumerate(IndustryType)}
+RESOURCE_INDEX = {resource: i for i, resource in enumerate(ResourceType)}
+
+# 各行业月度基础水平
+INDUSTRY_PROFILES = {
+    IndustryType.MANUFACTURING: {"emission": 800, "energy_consumption": 4000, "gdp": 80000, "population": 2000000, "temperature": 22, "humidity": 50},
+    IndustryType.ENERGY: {"emission": 1000, "energy_consumption": 5000, "gdp": 100000, "population": 2500000, "temperature": 25, "humidity": 60},
+    IndustryType.TRANSPORTATION: {"emission": 600, "energy_consumption": 3000, "gdp": 60000, "population": 1500000, "temperature": 20, "humidity": 55},
+    IndustryType.AGRICULTURE: {"emission": 400, "energy_consumption": 2000, "gdp": 40000, "population": 1800000, "temperature": 18, "humidity": 70},
+    IndustryType.CONSTRUCTION: {"emission": 500, "energy_consumption": 2500, "gdp": 50000, "population": 1600000, "temperature": 24, "humidity": 45},
+    IndustryType.SERVICES: {"emission": 300, "energy_consumption": 1500, "gdp": 30000, "population": 2200000, "temperature": 21, "humidity": 55},
+    IndustryType.MINING: {"emission": 700, "energy_consumption": 3500, "gdp": 70000, "population": 900000, "temperature": 26, "humidity": 40},
+    IndustryType.CHEMICAL: {"emission": 900, "energy_consumption": 4500, "gdp": 90000, "population": 1200000, "temperature": 23, "humidity": 50},
+}
+
+# 各资源类型的排放强度系数
+RESOURCE_FACTORS = {
+    ResourceType.COAL: 1.0,
+    ResourceType.OIL: 0.8,
+    ResourceType.GAS: 0.6,
+    ResourceType.ELECTRICITY: 0.5,
+    ResourceType.RENEWABLE: 0.1,
+    ResourceType.NUCLEAR: 0.05,
+}
+
+
+def generate_baseline_history(industry, resource_type, periods: int,
+                              end_date: Optional[datetime] = None) -> pd.DataFrame:
+    """生成行业/资源组合的月度基线历史（同一组合结果固定，可复现）"""
+    industry = IndustryType(getattr(industry, "value", industry))
+    resource_type = ResourceType(getattr(resource_type, "value", resource_type))
+    profile = INDUSTRY_PROFILES[industry]
+    factor = RESOURCE_FACTORS[resource_type]
+
+    rng = np.random.default_rng(zlib.crc32(f"{industry.value}_{resource_type.value}".encode()))
+    end = pd.Timestamp(end_date or datetime.now()).to_period("M").to_timestamp()
+    dates = pd.date_range(end=end, periods=periods, freq="MS")
+    t = np.arange(periods)
+    months = dates.month.to_numpy()
+    seasonal = np.sin(2 * np.pi * (months - 1) / 12)
+
+    emission = profile["emission"] * factor * (1 + 0.15 * seasonal) * (1 - 0.002 * (periods - 1 - t))
+    return pd.DataFrame({
+        "date": dates,
+        "emission": emission * rng.normal(1.0, 0.05, periods),
+        "energy_consumption": profile["energy_consumption"] * (1 + 0.1 * seasonal) * rng.normal(1.0, 0.05, periods),
+        "gdp": profile["gdp"] * (1 + 0.004 * t) * rng.normal(1.0, 0.02, periods),
+        "population": profile["population"] * (1 + 0.0005 * t),
+        "temperature": profile["temperature"] + 8 * seasonal + rng.normal(0, 1.5, periods),
+        "humidity": profile["humidity"] + 10 * seasonal + rng.normal(0, 3, periods),
+        "policy_factor": rng.normal(1.0, 0.03, periods),
+        "technology_factor": 0.9 + 0.002 * t,
+        "month_sin": np.sin(2 * np.pi * months / 12),
+        "month_cos": np.cos(2 * np.pi * months / 12),
+    })
+
+
+@lru_cache(maxsize=16)
+def _dropout_masks(samples: int, width: int, p: float) -> torch.Tensor:
+    """固定种子的MC-dropout掩码（已按 1/(1-p) 缩放），同一输入的采样结果可复现"""
+    generator = torch.Generator().manual_seed(0)
+    keep = torch.bernoulli(torch.full((samples, width), 1.0 - p), generator=generator)
+    return keep / (1.0 - p)
+
+
+def mc_dropout_head(fc: nn.Linear, features: torch.Tensor, p: float, training: bool,
+                    mc_samples: int = 0) -> torch.Tensor:
+    """带dropout的输出头
+
+    mc_samples 为0时返回 (batch, output)；大于0时在同一次前向中给出关闭dropout的点预测
+    和 mc_samples 个dropout采样，返回 (batch, 1 + mc_samples, output)。
+    LSTM主干只计算一次，采样只作用于输出头。
+    """
+    if training or mc_samples <= 0 or p <= 0:
+        out = fc(F.dropout(features, p, training=training))
+        return out if mc_samples <= 0 else out.unsqueeze(1)
+    masks = _dropout_masks(mc_samples, features.size(1), p).to(features.device)
+    stacked = torch.cat([features.unsqueeze(1), features.unsqueeze(1) * masks], dim=1)
+    return fc(stacked)
+
 
 class LSTMPredictor(nn.Module):
     """LSTM预测模型"""
     
-    def __init__(self, input_size, hidden_size, num_layers, output_size):
+    def __init__(self, input_size, hidden_size, num_layers, output_size, dropout=HEAD_DROPOUT):
         super(LSTMPredictor, self).__init__()
         self.hidden_size = hidden_size
         self.num_layers = num_layers
+        self.dropout = dropout
         
         self.lstm = nn.LSTM(input_size, hidden_size, num_layers, batch_first=True)
         self.fc = nn.Linear(hidden_size, output_size)
     
-    def forward(self, x):
+    def forward(self, x, mc_samples=0):
         h0 = torch.zeros(self.num_layers, x.size(0), self.hidden_size).to(x.device)
         c0 = torch.zeros(self.num_layers, x.size(0), self.hidden_size).to(x.device)
         
         out, _ = self.lstm(x, (h0, c0))
-        out = self.fc(out[:, -1, :])
-        return out
+        return mc_dropout_head(self.fc, out[:, -1, :], self.dropout, self.training, mc_samples)
+
+class MultiTaskLSTMPredictor(nn.Module):
+    """多任务LSTM预测模型：所有行业/资源组合共享一个LSTM主干，以学习到的嵌入区分组合"""
+    
+    def __init__(self, input_size, hidden_size, num_layers, output_size,
+                 num_industries=len(IndustryType), num_resources=len(ResourceType), embedding_dim=4,
+                 dropout=HEAD_DROPOUT):
+        super(MultiTaskLSTMPredictor, self).__init__()
+        self.hidden_size = hidden_size
+        self.num_layers = num_layers
+        self.dropout = dropout
+        
+        self.industry_embedding = nn.Embedding(num_industries, embedding_dim)
+        self.resource_embedding = nn.Embedding(num_resources, embedding_dim)
+        self.lstm = nn.LSTM(input_size + 2 * embedding_dim, hidden_size, num_layers, batch_first=True)
+        self.fc = nn.Linear(hidden_size + 2 * embedding_dim, output_size)
+    
+    def forward(self, x, industry_idx, resource_idx, mc_samples=0):
+        # 嵌入拼接到每个时间步的输入，同一批次可以混合不同组合
+        embedding = torch.cat([self.industry_embedding(industry_idx), self.resource_embedding(resource_idx)], dim=1)
+        x = torch.cat([x, embedding.unsqueeze(1).expand(-1, x.size(1), -1)], dim=2)
+        
+        h0 = torch.zeros(self.num_layers, x.size(0), self.hidden_size).to(x.device)
+        c0 = torch.zeros(self.num_layers, x.size(0), self.hidden_size).to(x.device)
+        
+        out, _ = self.lstm(x, (h0, c0))
+        return mc_dropout_head(self.fc, torch.cat([out[:, -1, :], embedding], dim=1),
+                               self.dropout, self.training, mc_samples)
 
 class AIPredictor:
     """AI预测服务"""
     
-    def __init__(self):
-        self.models = {}
-        self.scalers = {}
+    def __init__(self, max_cached_models: Optional[int] = 16, max_cache_bytes: Optional[int] = None,
+                 batch_max_size: int = 32, batch_max_wait_ms: float = 5.0,
+                 result_cache_size: int = 1024, result_cache_ttl: float = 300.0,
+                 bundle_path: Optional[str] = None, mc_samples: int = MC_SAMPLES,
+                 executor: Optional[Executor] = None):
         self.is_initialized = False
         self.model_dir = "models"
+        self.mc_samples = mc_samples
+        
+        # 打包的模型文件（train_models.py --bundle 导出），存在时优先从内存映射中构建模型
+        self.bundle_path = bundle_path or os.path.join(self.model_dir, "model_bundle.bin")
+        self.bundle = None
+        
+        # 模型按需加载，常驻模型数量/内存由LRU预算限制
+        self.registry = ModelRegistry(
+            loader=self._load_model,
+            max_models=max_cached_models,
+            max_bytes=max_cache_bytes,
+            sizer=self._estimate_model_bytes,
+            version_fn=self._model_version,
+            warmup=self._warmup_model
+        )
+        
+        # 相同请求（含模型版本）直接返回缓存结果，检查点更新时自动失效
+        self.result_cache = ResultCache(max_entries=result_cache_size, ttl_seconds=result_cache_ttl)
+        self.registry.add_listener(self.result_cache.invalidate)
+        
+        # 并发请求在短时间窗口内合并为一次前向计算
+        self.batcher = InferenceBatcher(
+            runner=self._run_inference,
+            max_batch_size=batch_max_size,
+            max_wait_ms=batch_max_wait_ms,
+            executor=executor
+        )
+        
+        # 模型解析、输入构造等同步步骤与推理共用同一计算线程池
+        self.executor = executor
         
         # 确保模型目录存在
         os.makedirs(self.model_dir, exist_ok=True)
     
-    def initialize_models(self):
-        """初始化AI模型"""
+    async def initialize_models(self):
+        """初始化AI模型（模型在首次预测时才加载）"""
         try:
             logger.info("开始初始化AI预测模型...")
-            
-            # 为每个行业和资源类型组合创建模型
-            for industry in IndustryType:
-                for resource in ResourceType:
-                    model_key = f"{industry.value}_{resource.value}"
-                    
-                    # 创建或加载模型
-                    model_path = os.path.join(self.model_dir, f"lstm_{model_key}.pth")
-                    scaler_path = os.path.join(self.model_dir, f"scaler_{model_key}.pkl")
-                    
-                    if os.path.exists(model_path) and os.path.exists(scaler_path):
-                        # 加载已有模型
-                        self.models[model_key] = torch.load(model_path)
-                        self.scalers[model_key] = joblib.load(scaler_path)
-                        logger.info(f"加载模型: {model_key}")
-                    else:
-                        # 创建新模型
-                        self.models[model_key] = LSTMPredictor(
-                            input_size=10,  # 特征数量
-                            hidden_size=64,
-                            num_layers=2,
-                            output_size=1
-                        )
-                        
-                        # 创建标准化器
-                        from sklearn.preprocessing import StandardScaler
-                        self.scalers[model_key] = StandardScaler()
-                        
-                        logger.info(f"创建新模型: {model_key}")
-            
+            self.registry.clear()
+            self.result_cache.clear()
+            self.bundle = open_bundle(self.bundle_path)
             self.is_initialized = True
-            logger.info("AI预测模型初始化完成")
+            logger.info(f"AI预测模型初始化完成，模型将按需加载 (缓存上限: {self.registry.max_models} 个)")
             
         except Exception as e:
             logger.error(f"AI模型初始化失败: {e}")
@@ -88,57 +225,380 @@ class AIPredictor:
     
     def is_ready(self) -> bool:
         """检查模型是否准备就绪"""
-        return self.is_initialized and len(self.models) > 0
+        return self.is_initialized
+    
+    def get_model(self, model_key: str):
+        """获取 (模型, 标准化器, 检查点元数据)，未命中时从磁盘加载"""
+        return self.registry.get(model_key)
     
-    def predict_emissions(self, industry: str, resource_type: str, 
-                               time_period: int, features: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-        """预测碳排放"""
+    def reload_models(self, keys: Optional[List[str]] = None, force: bool = False) -> Dict[str, str]:
+        """检查已加载模型的检查点，有新版本时加载、预热后原子替换（不中断服务）"""
+        return self.registry.refresh(keys, force=force)
+    
+    def get_model_stats(self) -> Dict[str, Any]:
+        """获取模型缓存、批处理和结果缓存统计"""
+        stats = self.registry.get_stats()
+        stats["batching"] = self.batcher.get_stats()
+        stats["result_cache"] = self.result_cache.get_stats()
+        return stats
+    
+    @staticmethod
+    def _model_key(industry, resource_type) -> str:
+        """生成模型键（兼容枚举和字符串参数）"""
+        industry = getattr(industry, "value", industry)
+        resource_type = getattr(resource_type, "value", resource_type)
+        return f"{industry}_{resource_type}"
+    
+    def _current_bundle(self):
+        """获取当前模型包，文件被重新导出（修改时间变化）时重新映射"""
+        try:
+            mtime = os.stat(self.bundle_path).st_mtime_ns
+        except FileNotFoundError:
+            self.bundle = None
+            return None
+        if self.bundle is None or self.bundle.version != mtime:
+            self.bundle = open_bundle(self.bundle_path)
+        return self.bundle
+    
+    def _bundle_has(self, bundle, model_key: str) -> bool:
+        return (bundle is not None and bundle.has_model(f"lstm_{model_key}")
+                and bundle.has_scaler(f"scaler_{model_key}"))
+    
+    def _model_version(self, model_key: str) -> int:
+        """模型版本：模型包或检查点文件中较新者的修改时间，未训练的模型为0"""
+        bundle = self._current_bundle()
+        bundle_version = bundle.version if self._bundle_has(bundle, model_key) else 0
+        try:
+            file_version = os.stat(os.path.join(self.model_dir, f"lstm_{model_key}.pth")).st_mtime_ns
+        except FileNotFoundError:
+            file_version = 0
+        return max(bundle_version, file_version)
+    
+    def _load_model(self, model_key: str):
+        """加载单个行业/资源组合的模型和标准化器
+
+        模型包比单独的检查点文件新时，直接在映射内存上构建参数（不拷贝）。
+        共享多任务模型（MULTITASK_KEY）的标准化器为 {组合键: StandardScaler} 字典。
+        """
+        model_path = os.path.join(self.model_dir, f"lstm_{model_key}.pth")
+        scaler_path = os.path.join(self.model_dir, f"scaler_{model_key}.pkl")
+        
+        bundle = self._current_bundle()
+        file_version = os.stat(model_path).st_mtime_ns if os.path.exists(model_path) else 0
+        
+        if self._bundle_has(bundle, model_key) and bundle.version >= file_version:
+            name = f"lstm_{model_key}"
+            metadata = bundle.model_metadata(name)
+            # 在meta设备上构建模型结构，避免为随后被替换的参数分配内存
+            with torch.device("meta"):
+                model = self._create_model(model_key, **metadata.pop("config", {}))
+            model.load_state_dict(bundle.state_dict(name), assign=True)
+            scaler = bundle.scaler(f"scaler_{model_key}")
+            logger.info(f"从模型包加载模型: {model_key}")
+        elif os.path.exists(model_path) and os.path.exists(scaler_path):
+            # 加载已有模型
+            checkpoint = torch.load(model_path, map_location="cpu")
+            if isinstance(checkpoint, nn.Module):
+                model = checkpoint
+                metadata = {}
+            else:
+                model = self._create_model(model_key, **checkpoint.get("config", {}))
+                model.load_state_dict(checkpoint.get("state_dict", checkpoint))
+                metadata = {k: checkpoint[k] for k in ("metrics", "version", "trained_at") if k in checkpoint}
+            scaler = joblib.load(scaler_path)
+            logger.info(f"加载模型: {model_key}")
+        else:
+            # 创建新模型（未训练）
+            model = self._create_model(model_key)
+            scaler = {} if model_key == MULTITASK_KEY else StandardScaler()
+            metadata = {}
+            logger.info(f"创建新模型: {model_key}")
+        
+        model.eval()
+        return model, scaler, metadata
+    
+    def _warmup_model(self, model_key: str, entry):
+        """用一次空输入前向预热新模型，避免替换后首个请求承担初始化开销"""
+        model = entry[0]
+        x = torch.zeros(1, SEQUENCE_LENGTH, len(FEATURE_COLUMNS))
+        with torch.no_grad():
+            if model_key == MULTITASK_KEY:
+                index = torch.zeros(1, dtype=torch.long)
+                model(x, index, index)
+            else:
+                model(x)
+    
+    def _create_model(self, model_key: str, input_size: int = len(FEATURE_COLUMNS), hidden_size: int = 64,
+                      num_layers: int = 2, output_size: int = MAX_HORIZON, **kwargs) -> nn.Module:
+        # 多输出头：一次前向给出全部预测步
+        if model_key == MULTITASK_KEY:
+            return MultiTaskLSTMPredictor(
+                input_size=input_size,
+                hidden_size=hidden_size,
+                num_layers=num_layers,
+                output_size=output_size,
+                **kwargs
+            )
+        return LSTMPredictor(
+            input_size=input_size,
+            hidden_size=hidden_size,
+            num_layers=num_layers,
+            output_size=output_size,
+            **kwargs
+        )
+    
+    def _run_inference(self, model_key: str, *inputs: torch.Tensor) -> torch.Tensor:
+        """对拼接后的批次执行一次前向计算（在线程池中运行）
+
+        返回 (batch, 1 + mc_samples, MAX_HORIZON)：点预测及MC-dropout采样。
+        """
+        model, _, _ = self.get_model(model_key)
+        with torch.no_grad():
+            output = model(*inputs, mc_samples=self.mc_samples)
+        return output if output.dim() == 3 else output.unsqueeze(1)
+    
+    def _build_input_window(self, industry, resource_type,
+                            features: Optional[Dict[str, Any]] = None) -> np.ndarray:
+        """构造模型输入窗口，features 可覆盖基线特征（标量按均值缩放，列表覆盖最近若干期）"""
+        history = generate_baseline_history(industry, resource_type, SEQUENCE_LENGTH)
+        window = history[FEATURE_COLUMNS].to_numpy(dtype=np.float32, copy=True)
+        
+        for name, value in (features or {}).items():
+            if name not in FEATURE_COLUMNS:
+                continue
+            col = FEATURE_COLUMNS.index(name)
+            if isinstance(value, (list, tuple)):
+                tail = np.asarray(value[-SEQUENCE_LENGTH:], dtype=np.float32)
+                window[-len(tail):, col] = tail
+            elif isinstance(value, (int, float)):
+                mean = window[:, col].mean()
+                window[:, col] = window[:, col] * (value / mean) if mean else value
+        
+        return window
+    
+    @staticmethod
+    def _scaling_params(scaler: StandardScaler, window: np.ndarray):
+        """获取标准化参数；标准化器未拟合时使用窗口自身的统计量"""
+        if hasattr(scaler, "mean_"):
+            return scaler.mean_.astype(np.float32), scaler.scale_.astype(np.float32)
+        mean = window.mean(axis=0)
+        std = window.std(axis=0)
+        std[std == 0] = 1.0
+        return mean, std
+    
+    @staticmethod
+    def _forecast_dates(time_period: int) -> pd.DatetimeIndex:
+        """预测期日期（输入窗口之后的各月月初）"""
+        start = pd.Timestamp(datetime.now()).to_period("M").to_timestamp() + pd.offsets.MonthBegin(1)
+        return pd.date_range(start=start, periods=time_period, freq="MS")
+    
+    @staticmethod
+    def _analyze_trend(values: np.ndarray) -> Dict[str, Any]:
+        """根据预测序列的线性斜率分析趋势，rate为每月变化百分比"""
+        if len(values) < 2 or values.mean() == 0:
+            return {"trend": "stable", "rate": 0.0}
+        slope = np.polyfit(np.arange(len(values)), values, 1)[0]
+        rate = abs(slope) / values.mean() * 100
+        trend = "stable" if rate < 0.1 else ("decreasing" if slope < 0 else "increasing")
+        return {"trend": trend, "rate": round(float(rate), 2)}
+    
+    @staticmethod
+    def _estimate_carbon_neutral_year(values: np.ndarray, dates: pd.DatetimeIndex) -> Optional[int]:
+        """按预测期末的线性下降速度外推排放归零的年份，不下降时返回None"""
+        if len(values) < 2:
+            return None
+        slope = np.polyfit(np.arange(len(values)), values, 1)[0]
+        if slope >= 0:
+            return None
+        months_to_zero = values[-1] / -slope
+        return int(dates[-1].year + (dates[-1].month - 1 + months_to_zero) // 12)
+    
+    @staticmethod
+    def _prediction_interval(point: np.ndarray, samples: np.ndarray, confidence_level: float):
+        """由MC-dropout采样的分位数得到各预测点的区间（保证包含点预测且非负）"""
+        if len(samples) == 0:
+            return point, point
+        alpha = (1.0 - confidence_level) / 2
+        lower, upper = np.quantile(samples, [alpha, 1.0 - alpha], axis=0)
+        return np.maximum(np.minimum(lower, point), 0.0), np.maximum(upper, point)
+    
+    @staticmethod
+    def _interval_confidence(point: np.ndarray, lower: np.ndarray, upper: np.ndarray) -> float:
+        """预测置信度：区间相对宽度越小越高，1/(1+平均相对宽度)"""
+        relative_width = (upper - lower) / np.maximum(point, 1e-6)
+        return round(float(1.0 / (1.0 + relative_width.mean())), 3)
+    
+    @staticmethod
+    def _estimate_model_bytes(entry) -> int:
+        """估算模型参数占用的内存"""
+        model = entry[0]
+        return sum(t.numel() * t.element_size() for t in model.state_dict().values())
+    
+    def _prepare_request(self, industry, resource_type, time_period: int,
+                         features: Optional[Dict[str, Any]], model_type: str,
+                         confidence_level: float) -> Dict[str, Any]:
+        """解析模型并构造标准化后的输入（在计算线程池中运行）
+
+        模型版本检查（stat）、未命中时的磁盘加载和基线历史构造都在这里完成，
+        不占用事件循环。命中结果缓存时只返回 {"cached": 结果}。
+        """
+        model_key = self._model_key(industry, resource_type)
+        registry_key = MULTITASK_KEY if model_type == MULTITASK_KEY else model_key
+        
+        # 结果缓存：键包含模型版本和预测起始月份
+        cache_key = ResultCache.make_key({
+            "model_type": model_type,
+            "model_key": model_key,
+            "version": self.registry.current_version(registry_key),
+            "time_period": time_period,
+            "confidence_level": confidence_level,
+            "features": features,
+            "start": datetime.now().strftime("%Y-%m")
+        })
+        cached = self.result_cache.get(cache_key)
+        if cached is not None:
+            return {"cached": cached}
+        
+        # 构造输入窗口并标准化
+        window = self._build_input_window(industry, resource_type, features)
+        if model_type == MULTITASK_KEY:
+            _, scalers, metadata = self.get_model(MULTITASK_KEY)
+            mean, std = self._scaling_params(scalers.get(model_key, StandardScaler()), window)
+            inputs = (
+                torch.from_numpy((window - mean) / std).unsqueeze(0),
+                torch.tensor([INDUSTRY_INDEX[IndustryType(getattr(industry, "value", industry))]]),
+                torch.tensor([RESOURCE_INDEX[ResourceType(getattr(resource_type, "value", resource_type))]])
+            )
+        else:
+            _, scaler, metadata = self.get_model(model_key)
+            mean, std = self._scaling_params(scaler, window)
+            inputs = (torch.from_numpy((window - mean) / std).unsqueeze(0),)
+        
+        return {
+            "cache_key": cache_key,
+            "registry_key": registry_key,
+            "inputs": inputs,
+            "mean": mean,
+            "std": std,
+            "metadata": metadata
+        }
+    
+    def _finalize_prediction(self, output: torch.Tensor, prepared: Dict[str, Any],
+                             time_period: int, confidence_level: float) -> Dict[str, Any]:
+        """由前向输出生成预测点、区间和趋势分析并写入结果缓存（在计算线程池中运行）"""
+        mean, std = prepared["mean"], prepared["std"]
+        
+        # 一次前向给出全部预测步和MC-dropout采样，按请求的周期截取并反标准化
+        scaled = output[0, :, :time_period].double().numpy() * std[0] + mean[0]
+        values = np.maximum(scaled[0], 0.0)
+        lower, upper = self._prediction_interval(values, scaled[1:], confidence_level)
+        dates = self._forecast_dates(time_period)
+        predictions = [
+            {"date": date, "predicted_emission": value, "lower_bound": low, "upper_bound": high}
+            for date, value, low, high in zip(
+                dates.strftime("%Y-%m-%d").tolist(), np.round(values, 2).tolist(),
+                np.round(lower, 2).tolist(), np.round(upper, 2).tolist()
+            )
+        ]
+        
+        # 置信度由预测区间的相对宽度得出
+        confidence = self._interval_confidence(values, lower, upper)
+        
+        # 趋势分析与碳中和年份估算
+        trend_analysis = self._analyze_trend(values)
+        trend_analysis["confidence"] = confidence
+        carbon_neutral_year = (self._estimate_carbon_neutral_year(values, dates)
+                               if trend_analysis["trend"] == "decreasing" else None)
+        
+        result = {
+            "predictions": predictions,
+            "confidence": confidence,
+            "carbon_neutral_year": carbon_neutral_year,
+            "trend_analysis": trend_analysis,
+            # 未训练的模型没有评估指标
+            "model_performance": prepared["metadata"].get("metrics")
+        }
+        self.result_cache.set(prepared["cache_key"], prepared["registry_key"], result)
+        return result
+    
+    async def predict_emissions(self, industry: str, resource_type: str, 
+                               time_period: int, features: Optional[Dict[str, Any]] = None,
+                               model_type: str = "lstm", confidence_level: float = 0.95) -> Dict[str, Any]:
+        """预测碳排放
+
+        model_type 为 "lstm" 时使用该组合独立的模型，为 "multitask" 时使用共享多任务模型。
+        每个预测点附带 confidence_level 水平的预测区间（MC-dropout采样分位数）。
+        模型解析、输入构造和结果后处理都在计算线程池中执行，事件循环只负责调度。
+        """
         try:
             if not self.is_ready():
                 raise RuntimeError("AI模型尚未初始化")
+            if model_type not in ("lstm", MULTITASK_KEY):
+                raise ValueError(f"不支持的模型类型: {model_type}")
             
-            model_key = f"{industry}_{resource_type}"
-            
-            # 生成模拟预测数据
-            predictions = []
-            base_date = datetime.now()
-            
-            for i in range(time_period):
-                # 模拟预测值（实际应用中应该使用训练好的模型）
-                predicted_value = np.random.normal(1000, 200)  # 基础值1000，标准差200
-                date = base_date + timedelta(days=30*i)
-                
-                predictions.append({
-                    "date": date.strftime("%Y-%m-%d"),
-                    "predicted_emission": round(predicted_value, 2)
-                })
+            loop = asyncio.get_running_loop()
+            prepared = await loop.run_in_executor(self.executor, functools.partial(
+                self._prepare_request, industry, resource_type, time_period,
+                features, model_type, confidence_level
+            ))
+            if "cached" in prepared:
+                return prepared["cached"]
             
-            # 计算置信度
-            confidence = round(np.random.uniform(0.7, 0.95), 3)
+            # 经微批调度器执行推理
+            output = await self.batcher.submit(prepared["registry_key"], *prepared["inputs"])
             
-            # 估算碳中和年份
-            carbon_neutral_year = 2050 + np.random.randint(-5, 10)
-            
-            # 趋势分析
-            trend_analysis = {
-                "trend": "decreasing" if np.random.random() > 0.5 else "increasing",
-                "rate": round(np.random.uniform(0.5, 3.0), 2),
-                "confidence": confidence
-            }
-            
-            return {
-                "predictions": predictions,
-                "confidence": confidence,
-                "carbon_neutral_year": int(carbon_neutral_year),
-                "trend_analysis": trend_analysis,
-                "model_performance": {
-                    "mae": round(np.random.uniform(50, 150), 2),
-                    "rmse": round(np.random.uniform(80, 200), 2),
-                    "r2": round(np.random.uniform(0.6, 0.9), 3)
-                }
-            }
+            return await loop.run_in_executor(self.executor, functools.partial(
+                self._finalize_prediction, output, prepared, time_period, confidence_level
+            ))
             
         except Exception as e:
             logger.error(f"碳排放预测失败: {e}")
             raise
-    
\ No newline at end of file
+    
+    
+    async def predict_emissions_batch(self, items: List[PredictionRequest]) -> List[Dict[str, Any]]:
+        """批量预测，结果按请求顺序返回"""
+        results = []
+        async for group in self.iter_batch_predictions(items):
+            results.extend(group)
+        return sorted(results, key=lambda r: r["index"])
+    
+    async def iter_batch_predictions(self, items: List[PredictionRequest]) -> AsyncIterator[List[Dict[str, Any]]]:
+        """批量预测：按模型分组并发执行，每组完成后立即产出该组结果
+
+        同组请求在同一时刻提交，由微批调度器合并为一次（或少数几次）前向计算。
+        单个请求失败不影响其他请求，失败项带 error 字段。
+        """
+        groups: Dict[str, List[int]] = {}
+        for index, item in enumerate(items):
+            model_type = item.model_type or "lstm"
+            key = MULTITASK_KEY if model_type == MULTITASK_KEY else self._model_key(item.industry, item.resource_type)
+            groups.setdefault(key, []).append(index)
+        
+        async def run_item(index: int) -> Dict[str, Any]:
+            item = items[index]
+            meta = {
+                "index": index,
+                "industry": getattr(item.industry, "value", item.industry),
+                "resource_type": getattr(item.resource_type, "value", item.resource_type),
+                "model_type": item.model_type or "lstm"
+            }
+            try:
+                result = await self.predict_emissions(
+                    industry=item.industry,
+                    resource_type=item.resource_type,
+                    time_period=item.time_period,
+                    features=item.features,
+                    model_type=item.model_type or "lstm",
+                    confidence_level=item.confidence_level or 0.95
+                )
+                # 结果可能来自缓存，复制一层再附加元信息
+                return {**meta, "success": True, **result}
+            except Exception as e:
+                return {**meta, "success": False, "error": str(e)}
+        
+        async def run_group(indices: List[int]) -> List[Dict[str, Any]]:
+            return await asyncio.gather(*(run_item(i) for i in indices))
+        
+        for finished in asyncio.as_completed([run_group(indices) for indices in groups.values()]):
+            yield await finished
@@ -2,11 +2,14 @@ import torch
 import torch.nn as nn
 import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
+from datetime import datetime
 from typing import Dict, List, Any, Optional
 from loguru import logger
 import joblib
 import os
+import itertools
+import pickle
+import threading
 from sklearn.preprocessing import StandardScaler
 from sklearn.ensemble import IsolationForest
 
@@ -14,7 +17,42 @@ import sys
 import os
 # 添加父目录到Python路径，确保可以导入models
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from models.schemas import AnomalyRequest, IndustryType, RiskLevel
+from models.schemas import AnomalyRequest, IndustryType, RiskLevel, SamplingFrequency
+from services.anomaly_store import AnomalyStore
+from services.chunked_scoring import ChunkedScorer, score_spec_inline
+from services.model_bundle import open_bundle
+from services.model_trainer import atomic_save
+from services.synthetic_data import generate_spec_series
+
+# 异常检测使用的特征列
+ANOMALY_FEATURES = ['emission', 'energy_consumption', 'temperature', 'humidity',
+                    'pressure', 'wind_speed', 'gdp', 'policy_factor']
+REFERENCE_DAYS = 365  # 拟合隔离森林/标准化器/自编码器的参考窗口（天）
+AUTOENCODER_EPOCHS = 200  # 自编码器在参考窗口上的训练轮数（全量批次）
+# 检查点/模型包未记录结构时使用的自编码器配置
+DEFAULT_AUTOENCODER_CONFIG = {"input_size": len(ANOMALY_FEATURES), "encoding_dim": 4}
+
+# 异常融合：隔离森林、自编码器、Z-score 三种方法的权重
+FUSION_WEIGHTS = np.array([0.4, 0.4, 0.2])
+# 按命中组合编码（隔离森林=1, 自编码器=2, Z-score=4）查表得到异常原因
+FUSION_REASONS = [
+    [reason for bit, reason in enumerate(["机器学习模型检测到异常模式", "自编码器重构误差异常", "统计指标超出正常范围"])
+     if code & (1 << bit)]
+    for code in range(8)
+]
+# 多行业巡检结果的风险排序
+SEVERITY_LABELS = np.array(["low", "medium", "high", "critical"])
+RISK_RANK = {RiskLevel.CRITICAL: 3, RiskLevel.HIGH: 2, RiskLevel.MEDIUM: 1, RiskLevel.LOW: 0}
+HISTORY_LIMIT = 200  # include_historical 时返回的历史异常条数上限
+# 采样频率 -> (pandas 频率, 每天的点数)
+FREQUENCIES = {SamplingFrequency.DAILY: ("D", 1), SamplingFrequency.HOURLY: ("h", 24)}
+CHUNKED_MIN_ROWS = 50000  # 超过该行数时分块生成并评分（有进程池时多进程）
+REPORT_COLUMNS = ["emission", "energy_consumption", "temperature"]  # 异常记录中返回的原始值列
+MAX_RESPONSE_ANOMALIES = 500  # 单次检测默认返回的异常明细条数上限（按异常分数从高到低）
+STORE_BATCH_ROWS = 5000  # 写入历史存储时每批转换的异常条数
+
+class ModelNotReadyError(RuntimeError):
+    """行业模型尚未拟合完成（启动时在后台拟合），调用方应返回503让客户端稍后重试"""
 
 class AutoEncoder(nn.Module):
     """自编码器异常检测模型"""
@@ -44,12 +82,36 @@ class AutoEncoder(nn.Module):
 class AnomalyDetector:
     """异常检测服务"""
     
-    def __init__(self):
+    def __init__(self, bundle_path: Optional[str] = None, seed: Optional[int] = None,
+                 store: Optional[AnomalyStore] = None,
+                 processes: Optional[int] = None, chunk_rows: int = 16384, fit_missing: bool = True):
         self.models = {}
         self.scalers = {}
         self.isolation_forests = {}
+        self.versions = {}
         self.is_initialized = False
         self.model_dir = "models"
+        self.bundle_path = bundle_path or os.path.join(self.model_dir, "model_bundle.bin")
+        # 模拟数据的随机种子，指定后同一行业/日期的数据可复现
+        self.seed = seed
+        # 历史异常存储（可选），检测结果写入后可按时间范围查询
+        self.store = store
+        # 缺少已保存模型的行业是否在后台线程中拟合（正式环境应由 train_models.py --anomaly 预先拟合）
+        self.fit_missing = fit_missing
+        self._fitting: set = set()
+        
+        # 保护三组模型字典的一致性：热替换与请求取模型时互斥
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        
+        # 超长序列（多年小时级数据）分块评分和多行业巡检的逐行业评分在进程池中执行，单核环境下不启用；
+        # 进程池首次使用时创建，每个工作进程都会加载 torch，默认最多4个
+        self.processes = processes or min(4, os.cpu_count() or 1)
+        self.chunk_rows = chunk_rows
+        self._chunked = ChunkedScorer(self.processes, chunk_rows) if self.processes > 1 else None
+        # 巡检时发往工作进程的 (标准化器, 隔离森林) 序列化结果，按模型对象缓存，热替换后重新序列化
+        self._forest_payloads: Dict[str, tuple] = {}
+        self._payload_ids = itertools.count()
         
         # 确保模型目录存在
         os.makedirs(self.model_dir, exist_ok=True)
@@ -58,127 +120,414 @@ class AnomalyDetector:
         """初始化异常检测模型"""
         try:
             logger.info("开始初始化异常检测模型...")
+            bundle = open_bundle(self.bundle_path)
             
-            # 为每个行业创建模型
+            # 加载各行业已保存的模型；缺失的行业不在启动路径上训练
+            missing = []
             for industry in IndustryType:
                 model_key = industry.value
-                
-                # 创建或加载模型
-                model_path = os.path.join(self.model_dir, f"autoencoder_{model_key}.pth")
-                scaler_path = os.path.join(self.model_dir, f"anomaly_scaler_{model_key}.pkl")
-                if_path = os.path.join(self.model_dir, f"isolation_forest_{model_key}.pkl")
-                
-                if (os.path.exists(model_path) and os.path.exists(scaler_path) and 
-                    os.path.exists(if_path)):
-                    # 加载已有模型
-                    self.models[model_key] = torch.load(model_path)
-                    self.scalers[model_key] = joblib.load(scaler_path)
-                    self.isolation_forests[model_key] = joblib.load(if_path)
-                    logger.info(f"加载异常检测模型: {model_key}")
-                else:
-                    # 创建新模型
-                    self.models[model_key] = AutoEncoder(
-                        input_size=8,  # 特征数量
-                        encoding_dim=4
-                    )
-                    
-                    # 创建标准化器
-                    self.scalers[model_key] = StandardScaler()
-                    
-                    # 创建隔离森林
-                    self.isolation_forests[model_key] = IsolationForest(
-                        contamination=0.1,
-                        random_state=42
-                    )
-                    
-                    logger.info(f"创建新异常检测模型: {model_key}")
+                components = self._load_industry_models(model_key, bundle)
+                if components is None:
+                    missing.append(industry)
+                    continue
+                self._install(model_key, components, self._model_version(model_key, bundle))
             
             self.is_initialized = True
-            logger.info("异常检测模型初始化完成")
+            logger.info(f"异常检测模型初始化完成 ({len(self.models)}/{len(IndustryType)} 个行业)")
+            
+            if missing:
+                logger.warning(f"以下行业缺少异常检测模型: {', '.join(i.value for i in missing)}；"
+                               f"请运行 python train_models.py --anomaly 预先拟合")
+                if self.fit_missing:
+                    self._start_background_fit(missing)
             
         except Exception as e:
             logger.error(f"异常检测模型初始化失败: {e}")
             self.is_initialized = False
     
+    def reload_models(self, force: bool = False) -> Dict[str, str]:
+        """检查模型文件，有新版本的行业在后台加载、预热后原子替换
+
+        替换前请求继续使用旧模型；已取得旧模型引用的请求不受影响。
+        """
+        results = {}
+        with self._reload_lock:
+            bundle = open_bundle(self.bundle_path)
+            for industry in IndustryType:
+                model_key = industry.value
+                version = self._model_version(model_key, bundle)
+                if not force and self.versions.get(model_key) == version:
+                    results[model_key] = "unchanged"
+                    continue
+                try:
+                    components = self._load_industry_models(model_key, bundle)
+                    if components is None:
+                        results[model_key] = "missing"
+                        continue
+                    self._warmup(components)
+                except Exception as e:
+                    logger.error(f"异常检测模型热加载失败，继续使用旧版本: {model_key}, 错误: {e}")
+                    results[model_key] = "failed"
+                    continue
+                self._install(model_key, components, version)
+                logger.info(f"异常检测模型已热替换: {model_key}")
+                results[model_key] = "reloaded"
+        return results
+    
+    def _model_version(self, model_key: str, bundle=None):
+        """模型版本：相关模型文件（含模型包）的修改时间"""
+        paths = [
+            os.path.join(self.model_dir, f"autoencoder_{model_key}.pth"),
+            os.path.join(self.model_dir, f"anomaly_scaler_{model_key}.pkl"),
+            os.path.join(self.model_dir, f"isolation_forest_{model_key}.pkl")
+        ]
+        version = tuple(os.stat(p).st_mtime_ns if os.path.exists(p) else 0 for p in paths)
+        if bundle is not None and bundle.has_model(f"autoencoder_{model_key}"):
+            version += (bundle.version,)
+        return version
+    
+    def _load_industry_models(self, model_key: str, bundle=None):
+        """加载单个行业的 (自编码器, 标准化器, 隔离森林)，没有已保存的模型时返回 None"""
+        model_path = os.path.join(self.model_dir, f"autoencoder_{model_key}.pth")
+        scaler_path = os.path.join(self.model_dir, f"anomaly_scaler_{model_key}.pkl")
+        if_path = os.path.join(self.model_dir, f"isolation_forest_{model_key}.pkl")
+        
+        if (bundle is not None and bundle.has_model(f"autoencoder_{model_key}") and
+                bundle.has_scaler(f"anomaly_scaler_{model_key}") and os.path.exists(if_path)):
+            # 自编码器参数和标准化器直接映射自模型包；隔离森林是树结构，仍单独反序列化
+            # 模型结构取自打包时记录的 config，重新训练改变结构后仍能正确加载
+            config = bundle.model_metadata(f"autoencoder_{model_key}").get("config") or DEFAULT_AUTOENCODER_CONFIG
+            with torch.device("meta"):
+                model = AutoEncoder(**config)
+            model.load_state_dict(bundle.state_dict(f"autoencoder_{model_key}"), assign=True)
+            scaler = bundle.scaler(f"anomaly_scaler_{model_key}")
+            isolation_forest = joblib.load(if_path)
+            logger.info(f"从模型包加载异常检测模型: {model_key}")
+        elif (os.path.exists(model_path) and os.path.exists(scaler_path) and 
+            os.path.exists(if_path)):
+            # 加载已有模型
+            checkpoint = torch.load(model_path, map_location="cpu")
+            if isinstance(checkpoint, nn.Module):
+                model = checkpoint
+            else:
+                model = AutoEncoder(**checkpoint.get("config", DEFAULT_AUTOENCODER_CONFIG))
+                model.load_state_dict(checkpoint.get("state_dict", checkpoint))
+            scaler = joblib.load(scaler_path)
+            isolation_forest = joblib.load(if_path)
+            logger.info(f"加载异常检测模型: {model_key}")
+        else:
+            return None
+        
+        model.eval()
+        return model, scaler, isolation_forest
+    
+    def _start_background_fit(self, industries: List[IndustryType]):
+        """在后台线程中逐个拟合缺失的行业模型，拟合完成一个即投入使用"""
+        with self._lock:
+            industries = [i for i in industries if i.value not in self._fitting]
+            self._fitting.update(i.value for i in industries)
+        if not industries:
+            return
+        
+        def fit_all():
+            for industry in industries:
+                try:
+                    components = self.fit_reference_models(industry)
+                    self._install(industry.value, components, self._model_version(industry.value))
+                except Exception as e:
+                    logger.error(f"异常检测模型后台拟合失败: {industry.value}, 错误: {e}")
+                finally:
+                    with self._lock:
+                        self._fitting.discard(industry.value)
+        
+        threading.Thread(target=fit_all, name="anomaly-fit", daemon=True).start()
+        logger.info(f"已在后台拟合 {len(industries)} 个行业的异常检测模型")
+    
+    def fit_reference_models(self, industry: IndustryType, reference: Optional[pd.DataFrame] = None):
+        """在参考窗口上拟合 (自编码器, 标准化器, 隔离森林) 并保存到模型目录
+
+        reference 默认为该行业最近 REFERENCE_DAYS 天的模拟数据。
+        """
+        model_key = industry.value
+        if reference is None:
+            reference = self._generate_simulation_data(industry, REFERENCE_DAYS)
+        X = reference[ANOMALY_FEATURES].to_numpy(dtype=np.float64)
+        
+        # 标准化器和隔离森林只在这里拟合
+        scaler = StandardScaler().fit(X)
+        isolation_forest = IsolationForest(contamination=0.1, random_state=42).fit(X)
+        
+        # 自编码器在标准化后的参考数据上做短时间全量训练
+        config = dict(DEFAULT_AUTOENCODER_CONFIG)
+        torch.manual_seed(42)
+        model = AutoEncoder(**config)
+        X_tensor = torch.from_numpy(scaler.transform(X)).float()
+        optimizer = torch.optim.Adam(model.parameters(), lr=0.01)
+        model.train()
+        for _ in range(AUTOENCODER_EPOCHS):
+            optimizer.zero_grad()
+            loss = torch.mean((model(X_tensor) - X_tensor) ** 2)
+            loss.backward()
+            optimizer.step()
+        model.eval()
+        
+        atomic_save(lambda path: joblib.dump(scaler, path),
+                    os.path.join(self.model_dir, f"anomaly_scaler_{model_key}.pkl"))
+        atomic_save(lambda path: joblib.dump(isolation_forest, path),
+                    os.path.join(self.model_dir, f"isolation_forest_{model_key}.pkl"))
+        atomic_save(lambda path: torch.save({
+            "state_dict": model.state_dict(),
+            "config": config,
+            "reference_days": len(X),
+            "reconstruction_loss": float(loss.item()),
+            "trained_at": datetime.now().isoformat()
+        }, path), os.path.join(self.model_dir, f"autoencoder_{model_key}.pth"))
+        
+        logger.info(f"异常检测模型已在参考窗口上拟合并保存: {model_key} ({len(X)} 天, 重构误差 {loss.item():.4f})")
+        return model, scaler, isolation_forest
+    
+    @staticmethod
+    def _warmup(components):
+        """用一次空输入前向预热自编码器"""
+        with torch.no_grad():
+            model = components[0]
+            model(torch.zeros(1, model.encoder[0].in_features))
+    
+    def _install(self, model_key: str, components, version):
+        model, scaler, isolation_forest = components
+        with self._lock:
+            self.models[model_key] = model
+            self.scalers[model_key] = scaler
+            self.isolation_forests[model_key] = isolation_forest
+            self.versions[model_key] = version
+    
+    def _get_components(self, model_key: str):
+        """一次性取出同一版本的 (自编码器, 标准化器, 隔离森林)"""
+        with self._lock:
+            if model_key not in self.models:
+                if model_key in self._fitting:
+                    raise ModelNotReadyError(f"异常检测模型正在后台拟合，请稍后重试: {model_key}")
+                raise ValueError(f"未找到模型: {model_key}")
+            return self.models[model_key], self.scalers[model_key], self.isolation_forests[model_key]
+    
     def is_ready(self) -> bool:
         """检查模型是否准备就绪"""
         return self.is_initialized and len(self.models) > 0
     
     def detect_anomalies(self, industry: IndustryType, time_range: int, 
-                              threshold: float = 0.95) -> Dict[str, Any]:
-        """检测异常"""
+                              threshold: float = 0.95, include_historical: bool = False,
+                              frequency: SamplingFrequency = SamplingFrequency.DAILY,
+                              max_anomalies: int = MAX_RESPONSE_ANOMALIES) -> Dict[str, Any]:
+        """检测异常
+
+        返回的异常明细最多 max_anomalies 条（分数最高者，按时间排序），完整计数见 statistical_summary。
+        """
         try:
-            if not self.is_ready():
+            if not self.is_initialized:
                 raise RuntimeError("异常检测模型尚未初始化")
             
             model_key = industry.value
+            components = self._get_components(model_key)
             
-            if model_key not in self.models:
-                raise ValueError(f"未找到模型: {model_key}")
-            
-            # 生成模拟数据用于异常检测
-            data = self._generate_simulation_data(industry, time_range)
-            
-            # 检测异常
-            anomalies = self._detect_anomalies_in_data(data, model_key, threshold)
+            # 生成模拟数据并检测异常（列式结果，风险评估和统计摘要直接在数组上计算）；
+            # 超长序列不整体生成，按块生成并评分
+            spec = self._series_spec(industry, time_range, frequency)
+            if spec["periods"] >= CHUNKED_MIN_ROWS:
+                data, detection = self._detect_in_chunks(spec, components, threshold)
+            else:
+                data = generate_spec_series(spec)
+                detection = self._detect_anomalies_in_data(data, components, threshold)
+            anomalies = self._anomaly_records(self._top_anomalies(detection, max_anomalies))
             
             # 评估风险等级
-            risk_level = self._assess_risk_level(anomalies)
+            risk_level = self._assess_risk_level(detection)
             
             # 生成建议
-            recommendations = self._generate_recommendations(anomalies, risk_level)
+            recommendations = self._generate_recommendations(detection, risk_level)
             
             # 统计摘要
-            statistical_summary = self._generate_statistical_summary(anomalies, data)
+            statistical_summary = self._generate_statistical_summary(detection, len(data))
+            
+            # 全部异常分批写入历史存储（仅可复现的数据），并按需取回本次检测窗口之前的历史异常；
+            # 不写入时不必为全部异常构造记录
+            if self.store is not None and self.seed is not None:
+                for start in range(0, len(detection["scores"]), STORE_BATCH_ROWS):
+                    batch = self._take(detection, slice(start, start + STORE_BATCH_ROWS))
+                    self.record_anomalies(model_key, self._anomaly_records(batch), source="detect", simulated=True)
+            historical_anomalies = (self._historical_anomalies(model_key, before=data["date"].iloc[0])
+                                    if include_historical else None)
             
             return {
                 "anomalies": anomalies,
                 "risk_level": risk_level,
                 "recommendations": recommendations,
-                "statistical_summary": statistical_summary
+                "statistical_summary": statistical_summary,
+                "historical_anomalies": historical_anomalies
             }
             
         except Exception as e:
             logger.error(f"异常检测失败: {e}")
             raise
     
-    def _generate_simulation_data(self, industry: IndustryType, time_range: int) -> pd.DataFrame:
-        """生成模拟数据"""
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=time_range)
+    def detect_anomalies_sweep(self, industries: Optional[List[IndustryType]] = None, time_range: int = 30,
+                               threshold: float = 0.95, include_anomalies: bool = True) -> Dict[str, Any]:
+        """多行业一次巡检
         
-        dates = pd.date_range(start=start_date, end=end_date, freq='D')
+        各行业的数据生成、标准化和隔离森林评分在分块评分的进程池中并行执行（隔离森林逐棵树在
+        Python 中循环，受 GIL 限制，线程无法并行）；单核环境下逐个行业在本进程中执行。
+        各行业自编码器结构相同，参数堆叠后用 vmap 一次前向完成全部行业的重构误差计算。
+        结果按风险等级、异常数量、平均异常分数降序排列。
+        """
+        if not self.is_initialized:
+            raise RuntimeError("异常检测模型尚未初始化")
         
-        # 根据行业生成不同的数据模式
-        base_values = self._get_industry_base_values(industry)
+        industries = list(dict.fromkeys(IndustryType(getattr(i, "value", i)) for i in (industries or IndustryType)))
+        failed = []
+        components = {}
+        for industry in industries:
+            try:
+                components[industry] = self._get_components(industry.value)
+            except (ValueError, ModelNotReadyError) as e:
+                failed.append({"industry": industry.value, "error": str(e)})
+        industries = [i for i in industries if i in components]
+        specs = {industry: self._series_spec(industry, time_range) for industry in industries}
         
-        data = []
-        for i, date in enumerate(dates):
-            # 基础值 + 趋势 + 季节性 + 随机噪声
-            trend = base_values["emission"] * (1 + 0.001 * i)  # 缓慢上升趋势
-            seasonal = base_values["emission"] * 0.2 * np.sin(2 * np.pi * i / 365)  # 年度季节性
-            noise = np.random.normal(0, base_values["emission"] * 0.1)  # 10%的随机噪声
-            
-            # 偶尔添加异常值
-            if np.random.random() < 0.05:  # 5%的概率出现异常
-                anomaly_factor = np.random.choice([0.1, 2.0, 5.0])  # 异常倍数
-                emission = base_values["emission"] * anomaly_factor
-            else:
-                emission = max(0, trend + seasonal + noise)
-            
-            data.append({
-                'date': date,
-                'emission': emission,
-                'energy_consumption': np.random.normal(base_values["energy"], base_values["energy"] * 0.1),
-                'temperature': np.random.normal(base_values["temperature"], 5),
-                'humidity': np.random.normal(base_values["humidity"], 10),
-                'pressure': np.random.normal(base_values["pressure"], 5),
-                'wind_speed': np.random.normal(base_values["wind_speed"], 2),
-                'gdp': np.random.normal(base_values["gdp"], base_values["gdp"] * 0.05),
-                'policy_factor': np.random.normal(1.0, 0.1)
+        # 1. 生成数据、标准化、隔离森林与Z-score评分（多进程）
+        prepared = None
+        if self._chunked is not None and len(industries) > 1:
+            try:
+                jobs = [(specs[i], *self._forest_payload(i.value, components[i])) for i in industries]
+                prepared = dict(zip(industries, self._chunked.prepare_industries(jobs, ANOMALY_FEATURES)))
+            except Exception as e:
+                logger.warning(f"巡检多进程评分失败，改为单进程评分: {e}")
+        if prepared is None:
+            prepared = {}
+            for industry in industries:
+                data = generate_spec_series(specs[industry])
+                X = data[ANOMALY_FEATURES].values
+                _, scaler, isolation_forest = components[industry]
+                X_scaled = scaler.transform(X)
+                prepared[industry] = (data, X_scaled, isolation_forest.score_samples(X) < isolation_forest.offset_,
+                                      self._detect_with_statistics(X_scaled, threshold))
+        
+        # 2. 所有行业的自编码器输入堆叠成一个批次
+        errors = self._batched_reconstruction_errors(
+            [components[i][0] for i in industries], [prepared[i][1] for i in industries]
+        )
+        
+        # 3. 融合与汇总（向量化的数组运算，在本进程中逐个行业执行）
+        results = []
+        for industry, error in zip(industries, errors):
+            data, _, if_flags, statistical_flags = prepared[industry]
+            detection = self._fuse_anomalies(data, if_flags, self._autoencoder_flags(error, threshold), statistical_flags)
+            anomalies = self._anomaly_records(detection)
+            risk_level = self._assess_risk_level(detection)
+            self.record_anomalies(industry.value, anomalies, source="sweep", simulated=True)
+            scores = detection["scores"]
+            results.append({
+                "industry": industry.value,
+                "risk_level": risk_level,
+                "anomaly_count": len(scores),
+                "mean_anomaly_score": round(float(scores.mean()), 3) if len(scores) else 0.0,
+                "anomalies": anomalies if include_anomalies else [],
+                "recommendations": self._generate_recommendations(detection, risk_level),
+                "statistical_summary": self._generate_statistical_summary(detection, len(data))
             })
+        results.sort(key=lambda r: (RISK_RANK[r["risk_level"]], r["anomaly_count"], r["mean_anomaly_score"]), reverse=True)
         
-        return pd.DataFrame(data)
+        overall = max((r["risk_level"] for r in results), key=RISK_RANK.get, default=RiskLevel.LOW)
+        logger.info(f"多行业异常巡检完成: {len(results)} 个行业, 整体风险 {overall.value}")
+        return {
+            "results": results,
+            "overall_risk_level": overall,
+            "failed": failed
+        }
+    
+    def _forest_payload(self, model_key: str, components):
+        """(模型标识, 序列化的 (标准化器, 隔离森林))；同一模型对象只序列化一次，工作进程按标识缓存"""
+        _, scaler, isolation_forest = components
+        with self._lock:
+            cached = self._forest_payloads.get(model_key)
+            if cached is not None and cached[0] is isolation_forest:
+                return cached[1], cached[2]
+        model_id = f"{model_key}:{next(self._payload_ids)}"
+        payload = pickle.dumps((scaler, isolation_forest), protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._forest_payloads[model_key] = (isolation_forest, model_id, payload)
+        return model_id, payload
+    
+    def record_anomalies(self, model_key: str, anomalies: List[Dict[str, Any]], source: str,
+                         simulated: bool = False):
+        """把检测到的异常写入历史存储；写入失败只记录警告，不影响检测结果
+
+        simulated 表示异常来自模拟数据：未指定随机种子时每次生成的数据不同，
+        同一时间段的异常每次都不一样，写入只会不断累积虚构的历史，因此不写入；
+        指定种子时也只追加晚于已有记录的部分（不同窗口重新生成的重叠时段不再合并）。
+        """
+        if self.store is None or not anomalies or (simulated and self.seed is None):
+            return
+        try:
+            self.store.append(model_key, anomalies, source=source, only_newer=simulated)
+        except Exception as e:
+            logger.warning(f"写入历史异常失败 ({model_key}): {e}")
+    
+    def _historical_anomalies(self, model_key: str, before) -> List[Dict[str, Any]]:
+        """本次检测窗口之前的历史异常（最近的在前）"""
+        if self.store is None:
+            return []
+        try:
+            return self.store.query(industry=model_key, end=before, limit=HISTORY_LIMIT, newest_first=True)
+        except Exception as e:
+            logger.warning(f"查询历史异常失败 ({model_key}): {e}")
+            return []
+    
+    def _batched_reconstruction_errors(self, models: List[nn.Module], inputs: List[np.ndarray]) -> List[np.ndarray]:
+        """多个自编码器的重构误差：结构与输入长度一致时堆叠参数用 vmap 一次前向，否则逐个计算"""
+        if not models:
+            return []
+        shapes = [tuple((k, v.shape) for k, v in m.state_dict().items()) for m in models]
+        if len(set(shapes)) == 1 and len({x.shape for x in inputs}) == 1:
+            try:
+                params, buffers = torch.func.stack_module_state(models)
+                X = torch.from_numpy(np.stack(inputs)).float()
+                
+                def reconstruct(p, b, x):
+                    return torch.func.functional_call(models[0], (p, b), (x,))
+                
+                with torch.no_grad():
+                    reconstructed = torch.vmap(reconstruct)(params, buffers, X)
+                return list(torch.mean((X - reconstructed) ** 2, dim=2).numpy())
+            except Exception as e:
+                logger.warning(f"自编码器批量前向失败，改为逐个计算: {e}")
+        return [self._reconstruction_errors(x, m) for m, x in zip(models, inputs)]
+    
+    def close(self):
+        """关闭分块评分进程池"""
+        if self._chunked is not None:
+            self._chunked.close()
+    
+    def _series_spec(self, industry: IndustryType, time_range: int,
+                     frequency: SamplingFrequency = SamplingFrequency.DAILY) -> Dict[str, Any]:
+        """模拟序列的描述（可发往工作进程在本地生成，与本进程生成的数据一致）"""
+        end_date = datetime.now()
+        frequency = SamplingFrequency(getattr(frequency, "value", frequency))
+        freq, points_per_day = FREQUENCIES[frequency]
+        key = ("anomaly", industry.value, time_range, end_date.date())
+        if frequency != SamplingFrequency.DAILY:
+            key += (frequency.value,)
+        return {
+            "base_values": self._get_industry_base_values(industry),
+            "periods": time_range * points_per_day + 1,
+            "end": end_date,
+            "freq": freq,
+            "seed": self.seed,
+            "key": key
+        }
+    
+    def _generate_simulation_data(self, industry: IndustryType, time_range: int,
+                                  frequency: SamplingFrequency = SamplingFrequency.DAILY) -> pd.DataFrame:
+        """生成模拟数据（time_range 天的日/小时粒度序列，所有列一次性生成）"""
+        return generate_spec_series(self._series_spec(industry, time_range, frequency))
     
     def _get_industry_base_values(self, industry: IndustryType) -> Dict[str, float]:
         """获取行业基础值"""
@@ -259,147 +608,152 @@ class AnomalyDetector:
         
         return base_values.get(industry, base_values[IndustryType.MANUFACTURING])
     
-    def _detect_anomalies_in_data(self, data: pd.DataFrame, model_key: str, threshold: float) -> List[Dict[str, Any]]:
-        """在数据中检测异常"""
-        anomalies = []
+    def _detect_in_chunks(self, spec: Dict[str, Any], components, threshold: float):
+        """超长序列逐块生成并评分（有进程池时各块在工作进程中生成和评分），返回 (日期+报告列, 列式结果)
+
+        主进程只保留重构误差、两种标记和报告列；自编码器阈值在完整误差序列上统一计算。
+        """
+        result = None
+        if self._chunked is not None:
+            try:
+                result = self._chunked.score_spec(spec, ANOMALY_FEATURES, REPORT_COLUMNS, components)
+            except Exception as e:
+                logger.warning(f"分块多进程评分失败，改为单进程分块评分: {e}")
+        if result is None:
+            result = score_spec_inline(spec, ANOMALY_FEATURES, REPORT_COLUMNS, components, self.chunk_rows)
+        data, if_flags, errors, statistical_flags = result
+        return data, self._fuse_anomalies(data, if_flags, self._autoencoder_flags(errors, threshold), statistical_flags)
+    
+    def _detect_anomalies_in_data(self, data: pd.DataFrame, components, threshold: float) -> Dict[str, np.ndarray]:
+        """在数据中检测异常，components 为同一版本的 (自编码器, 标准化器, 隔离森林)，返回列式结果"""
+        model, scaler, isolation_forest = components
         
-        # 选择特征列
-        feature_columns = ['emission', 'energy_consumption', 'temperature', 'humidity', 
-                          'pressure', 'wind_speed', 'gdp', 'policy_factor']
+        # 选择特征列，按参考窗口拟合的参数标准化（只做transform，不重新拟合）
+        X = data[ANOMALY_FEATURES].values
         
-        X = data[feature_columns].values
+        X_scaled = scaler.transform(X)
         
-        # 方法1: 使用隔离森林
-        if_anomalies = self.isolation_forests[model_key].fit_predict(X)
+        # 方法1: 使用隔离森林（评分低于拟合时确定的阈值即为异常）
+        if_anomalies = np.where(isolation_forest.score_samples(X) < isolation_forest.offset_, -1, 1)
         
         # 方法2: 使用自编码器重构误差
-        autoencoder_anomalies = self._detect_with_autoencoder(X, model_key, threshold)
+        autoencoder_anomalies = self._detect_with_autoencoder(X_scaled, model, threshold)
         
-        # 方法3: 统计方法（Z-score）
-        statistical_anomalies = self._detect_with_statistics(X, threshold)
+        # 方法3: 统计方法（相对参考窗口的Z-score）
+        statistical_anomalies = self._detect_with_statistics(X_scaled, threshold)
         
-        # 综合多种方法的结果
-        for i, (date, row) in enumerate(data.iterrows()):
-            is_anomaly = False
-            anomaly_score = 0
-            anomaly_reasons = []
-            
-            # 检查隔离森林结果
-            if if_anomalies[i] == -1:
-                is_anomaly = True
-                anomaly_score += 0.4
-                anomaly_reasons.append("机器学习模型检测到异常模式")
-            
-            # 检查自编码器结果
-            if autoencoder_anomalies[i]:
-                is_anomaly = True
-                anomaly_score += 0.4
-                anomaly_reasons.append("自编码器重构误差异常")
-            
-            # 检查统计结果
-            if statistical_anomalies[i]:
-                is_anomaly = True
-                anomaly_score += 0.2
-                anomaly_reasons.append("统计指标超出正常范围")
-            
-            if is_anomaly:
-                # 确保date是日期对象，如果是索引则从row中获取
-                if hasattr(date, 'isoformat'):
-                    date_str = date.isoformat()
-                elif isinstance(date, (int, float)):
-                    # 如果是数字索引，从row中获取实际的日期
-                    date_str = str(row.get('date', date))
-                else:
-                    date_str = str(date)
-                
-                anomalies.append({
-                    "date": date_str,
-                    "anomaly_score": round(anomaly_score, 3),
-                    "reasons": anomaly_reasons,
-                    "emission": row["emission"],
-                    "energy_consumption": row["energy_consumption"],
-                    "temperature": row["temperature"],
-                    "severity": self._calculate_severity(anomaly_score)
-                })
-        
-        return anomalies
-    
-    def _detect_with_autoencoder(self, X: np.ndarray, model_key: str, threshold: float) -> List[bool]:
-        """使用自编码器检测异常"""
+        return self._fuse_anomalies(data, if_anomalies == -1, autoencoder_anomalies, statistical_anomalies)
+    
+    def _fuse_anomalies(self, data: pd.DataFrame, if_flags: np.ndarray, autoencoder_flags: np.ndarray,
+                        statistical_flags: np.ndarray) -> Dict[str, np.ndarray]:
+        """综合多种方法的结果：按方法权重累加得分，返回被标记行的列式结果
+        
+        dates 为 datetime64 数组，scores 为保留3位小数的得分，severity 为严重程度编码（0-3，见 SEVERITY_LABELS），
+        codes 为方法命中组合编码，另含 emission/energy_consumption/temperature 三列。
+        """
+        flags = np.column_stack([if_flags, autoencoder_flags, statistical_flags])
+        scores = flags @ FUSION_WEIGHTS
+        flagged = np.flatnonzero(flags.any(axis=1))
+        
+        if "date" in data.columns:
+            dates = data["date"].to_numpy()[flagged]
+        elif isinstance(data.index, pd.DatetimeIndex):
+            dates = data.index.to_numpy()[flagged]
+        else:
+            dates = pd.to_datetime(data.index[flagged], errors="coerce").to_numpy()
+        
+        return {
+            "dates": dates.astype("datetime64[ns]"),
+            "scores": np.round(scores[flagged], 3),
+            # 三个方法的命中组合编码为0-7，原因列表按组合查表
+            "codes": flags[flagged] @ np.array([1, 2, 4]),
+            "severity": self._severity_codes(scores[flagged]),
+            **{name: data[name].to_numpy()[flagged] for name in REPORT_COLUMNS}
+        }
+    
+    @staticmethod
+    def _take(detection: Dict[str, np.ndarray], index) -> Dict[str, np.ndarray]:
+        """按下标（切片或下标数组）选取列式结果中的部分异常"""
+        return {name: values[index] for name, values in detection.items()}
+    
+    @classmethod
+    def _top_anomalies(cls, detection: Dict[str, np.ndarray], limit: int) -> Dict[str, np.ndarray]:
+        """异常分数最高的 limit 条（保持时间顺序）"""
+        if len(detection["scores"]) <= limit:
+            return detection
+        # 稳定排序：同分时保留较早的异常
+        keep = np.sort(np.argsort(-detection["scores"], kind="stable")[:limit])
+        return cls._take(detection, keep)
+    
+    @staticmethod
+    def _anomaly_records(detection: Dict[str, np.ndarray]) -> List[Dict[str, Any]]:
+        """列式检测结果转换为接口返回的异常记录列表"""
+        if len(detection["scores"]) == 0:
+            return []
+        return [
+            {
+                "date": date,
+                "anomaly_score": score,
+                "reasons": list(FUSION_REASONS[code]),
+                "emission": emission,
+                "energy_consumption": energy,
+                "temperature": temperature,
+                "severity": severity
+            }
+            for date, score, code, emission, energy, temperature, severity in zip(
+                pd.DatetimeIndex(detection["dates"]).astype(str).tolist(),
+                detection["scores"].tolist(), detection["codes"].tolist(),
+                detection["emission"].tolist(), detection["energy_consumption"].tolist(),
+                detection["temperature"].tolist(), SEVERITY_LABELS[detection["severity"]].tolist()
+            )
+        ]
+    
+    def _detect_with_autoencoder(self, X_scaled: np.ndarray, model: nn.Module, threshold: float) -> np.ndarray:
+        """使用自编码器检测异常（输入为已标准化的数据）"""
         try:
-            model = self.models[model_key]
-            model.eval()
-            
-            # 数据标准化
-            X_scaled = self.scalers[model_key].fit_transform(X)
-            X_tensor = torch.FloatTensor(X_scaled)
-            
-            # 重构
-            with torch.no_grad():
-                reconstructed = model(X_tensor)
-            
-            # 计算重构误差
-            mse = torch.mean((X_tensor - reconstructed) ** 2, dim=1)
-            
-            # 计算异常阈值
-            error_threshold = torch.quantile(mse, threshold)
-            
-            # 标记异常
-            anomalies = (mse > error_threshold).numpy()
-            
-            return anomalies.tolist()
-            
+            return self._autoencoder_flags(self._reconstruction_errors(X_scaled, model), threshold)
         except Exception as e:
             logger.warning(f"自编码器异常检测失败: {e}")
-            return [False] * len(X)
+            return np.zeros(len(X_scaled), dtype=bool)
     
-    def _detect_with_statistics(self, X: np.ndarray, threshold: float) -> List[bool]:
-        """使用统计方法检测异常"""
-        anomalies = []
-        
-        for i in range(X.shape[1]):
-            column = X[:, i]
-            mean = np.mean(column)
-            std = np.std(column)
-            
-            if std == 0:
-                continue
-            
-            # 计算Z-score
-            z_scores = np.abs((column - mean) / std)
-            
-            # 标记异常（Z-score > 2.5）
-            column_anomalies = z_scores > 2.5
-            
-            if i == 0:  # 第一列
-                anomalies = column_anomalies
-            else:
-                anomalies = anomalies | column_anomalies
-        
-        return anomalies.tolist()
-    
-    def _calculate_severity(self, anomaly_score: float) -> str:
-        """计算异常严重程度"""
-        if anomaly_score >= 0.8:
-            return "critical"
-        elif anomaly_score >= 0.6:
-            return "high"
-        elif anomaly_score >= 0.4:
-            return "medium"
-        else:
-            return "low"
+    @staticmethod
+    def _reconstruction_errors(X_scaled: np.ndarray, model: nn.Module) -> np.ndarray:
+        """逐行重构误差（MSE）"""
+        X_tensor = torch.FloatTensor(X_scaled)
+        with torch.no_grad():
+            reconstructed = model(X_tensor)
+        return torch.mean((X_tensor - reconstructed) ** 2, dim=1).numpy()
+    
+    @staticmethod
+    def _autoencoder_flags(errors: np.ndarray, threshold: float) -> np.ndarray:
+        """重构误差超过本批次 threshold 分位数即为异常"""
+        mse = torch.from_numpy(np.asarray(errors))
+        return (mse > torch.quantile(mse, threshold)).numpy()
     
-    def _assess_risk_level(self, anomalies: List[Dict[str, Any]]) -> RiskLevel:
-        """评估整体风险等级"""
-        if not anomalies:
+    def _detect_with_statistics(self, X_scaled: np.ndarray, threshold: float) -> np.ndarray:
+        """使用统计方法检测异常：任一特征相对参考窗口的Z-score超过2.5"""
+        return (np.abs(X_scaled) > 2.5).any(axis=1)
+    
+    @staticmethod
+    def _severity_codes(scores: np.ndarray) -> np.ndarray:
+        """按异常得分批量划分严重程度编码（0=low ... 3=critical）"""
+        return np.select([scores >= 0.8, scores >= 0.6, scores >= 0.4], [3, 2, 1], default=0)
+    
+    @staticmethod
+    def _severity_labels(scores: np.ndarray) -> List[str]:
+        """按异常得分批量划分严重程度"""
+        return SEVERITY_LABELS[AnomalyDetector._severity_codes(scores)].tolist()
+    
+    def _assess_risk_level(self, detection: Dict[str, np.ndarray]) -> RiskLevel:
+        """评估整体风险等级（基于列式检测结果）"""
+        scores = detection["scores"]
+        if len(scores) == 0:
             return RiskLevel.LOW
         
-        # 计算平均异常分数
-        avg_score = np.mean([a["anomaly_score"] for a in anomalies])
-        
-        # 计算严重异常的数量
-        critical_count = sum(1 for a in anomalies if a["severity"] == "critical")
-        high_count = sum(1 for a in anomalies if a["severity"] == "high")
+        # 平均异常分数与各严重程度数量
+        avg_score = scores.mean()
+        counts = np.bincount(detection["severity"], minlength=len(SEVERITY_LABELS))
+        critical_count, high_count = counts[3], counts[2]
         
         # 风险等级判断
         if critical_count > 0 or avg_score > 0.8:
@@ -411,7 +765,7 @@ class AnomalyDetector:
         else:
             return RiskLevel.LOW
     
-    def _generate_recommendations(self, anomalies: List[Dict[str, Any]], risk_level: RiskLevel) -> List[str]:
+    def _generate_recommendations(self, detection: Dict[str, np.ndarray], risk_level: RiskLevel) -> List[str]:
         """生成建议措施"""
         recommendations = []
         
@@ -442,67 +796,35 @@ class AnomalyDetector:
             ])
         
         # 根据具体异常类型添加特定建议
-        emission_anomalies = [a for a in anomalies if a.get("emission", 0) > 1000]
-        if emission_anomalies:
+        if np.any(detection["emission"] > 1000):
             recommendations.append("检查排放控制设备运行状态")
         
-        energy_anomalies = [a for a in anomalies if a.get("energy_consumption", 0) > 5000]
-        if energy_anomalies:
+        if np.any(detection["energy_consumption"] > 5000):
             recommendations.append("优化能源使用效率")
         
         return recommendations
     
-    def _generate_statistical_summary(self, anomalies: List[Dict[str, Any]], data: pd.DataFrame) -> Dict[str, Any]:
-        """生成统计摘要"""
-        if not anomalies:
+    def _generate_statistical_summary(self, detection: Dict[str, np.ndarray], total_points: int) -> Dict[str, Any]:
+        """生成统计摘要（严重程度/月份分组计数和时间范围直接在列式结果上计算）"""
+        dates = detection["dates"]
+        if len(dates) == 0:
             return {"message": "未检测到异常"}
         
         # 异常统计
-        severity_counts = {}
-        for anomaly in anomalies:
-            severity = anomaly["severity"]
-            severity_counts[severity] = severity_counts.get(severity, 0) + 1
-        
-        # 时间分布
-        anomaly_dates = []
-        for anomaly in anomalies:
-            date_str = anomaly["date"]
-            try:
-                if isinstance(date_str, str):
-                    # 尝试解析ISO格式日期
-                    if 'T' in date_str or '-' in date_str:
-                        parsed_date = datetime.fromisoformat(date_str)
-                    else:
-                        # 如果不是标准格式，使用当前时间
-                        parsed_date = datetime.now()
-                elif hasattr(date_str, 'isoformat'):
-                    parsed_date = date_str
-                elif isinstance(date_str, (int, float)):
-                    # 如果是数字，使用当前时间
-                    parsed_date = datetime.now()
-                else:
-                    parsed_date = datetime.now()
-                anomaly_dates.append(parsed_date)
-            except (ValueError, TypeError):
-                # 如果解析失败，使用当前时间
-                anomaly_dates.append(datetime.now())
-        
-        if not anomaly_dates:
-            anomaly_dates = [datetime.now()]
+        counts = np.bincount(detection["severity"], minlength=len(SEVERITY_LABELS))
+        severity_counts = {label: int(count) for label, count in zip(SEVERITY_LABELS, counts) if count}
         
         # 按月份统计
-        monthly_counts = {}
-        for date in anomaly_dates:
-            month_key = date.strftime("%Y-%m")
-            monthly_counts[month_key] = monthly_counts.get(month_key, 0) + 1
+        months, month_counts = np.unique(dates.astype("datetime64[M]"), return_counts=True)
+        monthly_counts = dict(zip(np.datetime_as_string(months).tolist(), month_counts.tolist()))
         
         return {
-            "total_anomalies": len(anomalies),
+            "total_anomalies": len(dates),
             "severity_distribution": severity_counts,
             "monthly_distribution": monthly_counts,
-            "anomaly_rate": len(anomalies) / len(data) * 100,
+            "anomaly_rate": len(dates) / total_points * 100,
             "date_range": {
-                "start": min(anomaly_dates).isoformat(),
-                "end": max(anomaly_dates).isoformat()
+                "start": pd.Timestamp(dates.min()).isoformat(),
+                "end": pd.Timestamp(dates.max()).isoformat()
             }
-        }
\ No newline at end of file
+        }
@@ -0,0 +1,201 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+import pandas as pd
+from loguru import logger
+
+# 趋势聚合的时间粒度 -> SQLite strftime 格式
+TREND_BUCKETS = {
+    "hour": "%Y-%m-%d %H:00",
+    "day": "%Y-%m-%d",
+    "week": "%Y-W%W",
+    "month": "%Y-%m",
+}
+
+SEVERITIES = ("low", "medium", "high", "critical")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS anomalies (
+    id INTEGER PRIMARY KEY,
+    industry TEXT NOT NULL,
+    ts TEXT NOT NULL,
+    anomaly_score REAL NOT NULL,
+    severity TEXT NOT NULL,
+    emission REAL,
+    energy_consumption REAL,
+    temperature REAL,
+    reasons TEXT,
+    source TEXT NOT NULL,
+    detected_at TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_anomalies_industry_ts ON anomalies (industry, ts);
+CREATE INDEX IF NOT EXISTS idx_anomalies_ts ON anomalies (ts);
+CREATE INDEX IF NOT EXISTS idx_anomalies_severity_ts ON anomalies (severity, ts);
+"""
+
+
+class AnomalyStore:
+    """历史异常存储（SQLite，只追加）
+
+    检测到的异常按 (行业, 时间) 唯一写入，重复检测同一时间段不会产生重复记录（先写入者为准）。
+    时间统一为 "YYYY-MM-DD HH:MM:SS" 文本，按字典序即时间序，范围查询和趋势聚合都走索引。
+    WAL 模式下读写互不阻塞；每个线程使用独立连接，写入串行化。
+    """
+
+    def __init__(self, db_path: str = "data/anomalies.db"):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+
+        conn = self._connect()
+        conn.executescript(_SCHEMA)
+        conn.commit()
+        logger.info(f"历史异常存储已就绪: {db_path}")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _normalize_ts(values: Iterable[Any]) -> List[str]:
+        return pd.to_datetime(list(values)).strftime("%Y-%m-%d %H:%M:%S").tolist()
+
+    def append(self, industry: str, anomalies: List[Dict[str, Any]], source: str = "detect",
+               only_newer: bool = False) -> int:
+        """追加一批异常记录（date/timestamp 任一字段为时间），返回新写入的条数
+
+        only_newer 时只写入晚于该行业同一来源已有最新记录的异常：模拟数据每次重新生成，
+        重叠时间段上的异常各不相同，逐次合并会让历史不断膨胀。只比较同一来源，
+        其他来源（如时间为当前时刻的流式读数）不会挡住后续的写入。
+        """
+        if not anomalies:
+            return 0
+        detected_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        timestamps = self._normalize_ts(a.get("date") or a.get("timestamp") for a in anomalies)
+        rows = [
+            (
+                industry,
+                ts,
+                float(a["anomaly_score"]),
+                a.get("severity") or "low",
+                a.get("emission"),
+                a.get("energy_consumption"),
+                a.get("temperature"),
+                json.dumps(a.get("reasons", []), ensure_ascii=False),
+                source,
+                detected_at
+            )
+            for ts, a in zip(timestamps, anomalies)
+        ]
+        with self._write_lock:
+            conn = self._connect()
+            if only_newer:
+                latest = conn.execute("SELECT MAX(ts) FROM anomalies WHERE industry = ? AND source = ?",
+                                      (industry, source)).fetchone()[0]
+                if latest is not None:
+                    rows = [row for row in rows if row[1] > latest]
+                if not rows:
+                    return 0
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO anomalies (industry, ts, anomaly_score, severity, emission, "
+                "energy_consumption, temperature, reasons, source, detected_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            conn.commit()
+            return conn.total_changes - before
+
+    @staticmethod
+    def _where(industry: Optional[str] = None, start: Optional[Any] = None, end: Optional[Any] = None,
+               severities: Optional[List[str]] = None, min_score: Optional[float] = None):
+        clauses, params = [], []
+        if industry:
+            clauses.append("industry = ?")
+            params.append(industry)
+        if start is not None:
+            clauses.append("ts >= ?")
+            params.append(AnomalyStore._normalize_ts([start])[0])
+        if end is not None:
+            clauses.append("ts < ?")
+            params.append(AnomalyStore._normalize_ts([end])[0])
+        if severities:
+            clauses.append(f"severity IN ({','.join('?' * len(severities))})")
+            params.extend(severities)
+        if min_score is not None:
+            clauses.append("anomaly_score >= ?")
+            params.append(min_score)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def query(self, industry: Optional[str] = None, start: Optional[Any] = None, end: Optional[Any] = None,
+              severities: Optional[List[str]] = None, min_score: Optional[float] = None,
+              limit: int = 1000, offset: int = 0, newest_first: bool = False) -> List[Dict[str, Any]]:
+        """按行业/时间范围 [start, end)/严重程度/最低分数查询异常记录"""
+        where, params = self._where(industry, start, end, severities, min_score)
+        order = "DESC" if newest_first else "ASC"
+        rows = self._connect().execute(
+            f"SELECT industry, ts, anomaly_score, severity, emission, energy_consumption, temperature, reasons, source "
+            f"FROM anomalies{where} ORDER BY ts {order} LIMIT ? OFFSET ?",
+            params + [limit, offset]
+        ).fetchall()
+        return [
+            {
+                "industry": row["industry"],
+                "date": row["ts"],
+                "anomaly_score": row["anomaly_score"],
+                "severity": row["severity"],
+                "emission": row["emission"],
+                "energy_consumption": row["energy_consumption"],
+                "temperature": row["temperature"],
+                "reasons": json.loads(row["reasons"] or "[]"),
+                "source": row["source"]
+            }
+            for row in rows
+        ]
+
+    def trend(self, industry: Optional[str] = None, start: Optional[Any] = None, end: Optional[Any] = None,
+              bucket: str = "day", severities: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """按时间粒度聚合异常数量（总数及各严重程度）、平均/最高分数和平均排放"""
+        if bucket not in TREND_BUCKETS:
+            raise ValueError(f"不支持的时间粒度: {bucket}，可选 {', '.join(TREND_BUCKETS)}")
+        where, params = self._where(industry, start, end, severities)
+        severity_counts = ", ".join(f"SUM(severity = '{s}') AS {s}" for s in SEVERITIES)
+        rows = self._connect().execute(
+            f"SELECT strftime(?, ts) AS period, COUNT(*) AS count, {severity_counts}, "
+            f"AVG(anomaly_score) AS avg_score, MAX(anomaly_score) AS max_score, AVG(emission) AS avg_emission "
+            f"FROM anomalies{where} GROUP BY period ORDER BY period",
+            [TREND_BUCKETS[bucket]] + params
+        ).fetchall()
+        return [
+            {
+                "period": row["period"],
+                "count": row["count"],
+                "by_severity": {s: row[s] for s in SEVERITIES},
+                "avg_score": round(row["avg_score"], 3),
+                "max_score": round(row["max_score"], 3),
+                "avg_emission": None if row["avg_emission"] is None else round(row["avg_emission"], 2)
+            }
+            for row in rows
+        ]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """各行业记录数与时间跨度"""
+        rows = self._connect().execute(
+            "SELECT industry, COUNT(*) AS count, MIN(ts) AS first, MAX(ts) AS last FROM anomalies GROUP BY industry"
+        ).fetchall()
+        return {
+            "db_path": self.db_path,
+            "total": sum(row["count"] for row in rows),
+            "industries": {row["industry"]: {"count": row["count"], "first": row["first"], "last": row["last"]}
+                           for row in rows}
+        }
@@ -0,0 +1,242 @@
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from loguru import logger
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS artifacts (
+    kind TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    region TEXT,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (kind, digest)
+);
+CREATE INDEX IF NOT EXISTS idx_artifacts_kind_region_created ON artifacts (kind, region, created_at);
+CREATE INDEX IF NOT EXISTS idx_artifacts_accessed ON artifacts (accessed_at);
+CREATE INDEX IF NOT EXISTS idx_artifacts_created ON artifacts (created_at);
+"""
+
+
+def _path_size(path: str) -> int:
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, name))
+                   for root, _, names in os.walk(path) for name in names)
+    return os.path.getsize(path)
+
+
+def _remove_path(path: str):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+class ArtifactStore:
+    """生成产物（地图、分析报告）的索引与保留策略
+
+    产物按 (类型, 内容哈希) 唯一登记，内容相同的产物只写一次，重复生成时只更新访问时间。
+    索引（SQLite）按地区和时间查询产物，查找不扫描目录。
+    后台线程定期回收：超过 max_age 未访问的产物删除；总大小超过 max_bytes 时按最久未访问依次删除。
+    只管理登记过的产物，目录中的其他文件不受影响。
+    """
+
+    def __init__(self, index_path: str = "data/artifacts.db", max_bytes: int = 512 * 1024 * 1024,
+                 max_age: float = 7 * 86400, gc_interval: float = 600):
+        self.index_path = index_path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.gc_interval = gc_interval
+        os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._gc_thread: Optional[threading.Thread] = None
+        self.removed = 0
+        self.deduplicated = 0
+
+        conn = self._connect()
+        conn.executescript(_SCHEMA)
+        conn.commit()
+        logger.info(f"产物索引已就绪: {index_path}")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.index_path, timeout=10)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _record(row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            "kind": row["kind"],
+            "digest": row["digest"],
+            "region": row["region"],
+            "path": row["path"],
+            "size": row["size"],
+            "created_at": row["created_at"],
+            "accessed_at": row["accessed_at"],
+            "hits": row["hits"]
+        }
+
+    def register(self, kind: str, digest: str, path: str, region: Optional[str] = None) -> Dict[str, Any]:
+        """登记已写好的产物；已登记时只更新访问时间和命中次数"""
+        now = time.time()
+        with self._write_lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT INTO artifacts (kind, digest, region, path, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (kind, digest) DO UPDATE SET accessed_at = excluded.accessed_at, hits = hits + 1",
+                (kind, digest, region, path, _path_size(path), now, now)
+            )
+            conn.commit()
+            row = conn.execute("SELECT * FROM artifacts WHERE kind = ? AND digest = ?", (kind, digest)).fetchone()
+        return self._record(row)
+
+    def lookup(self, kind: str, digest: str) -> Optional[Dict[str, Any]]:
+        """按内容哈希查找产物并更新访问时间；文件已不存在时删除索引记录"""
+        conn = self._connect()
+        row = conn.execute("SELECT * FROM artifacts WHERE kind = ? AND digest = ?", (kind, digest)).fetchone()
+        if row is None:
+            return None
+        with self._write_lock:
+            conn = self._connect()
+            if not os.path.exists(row["path"]):
+                conn.execute("DELETE FROM artifacts WHERE kind = ? AND digest = ?", (kind, digest))
+                conn.commit()
+                return None
+            conn.execute("UPDATE artifacts SET accessed_at = ?, hits = hits + 1 WHERE kind = ? AND digest = ?",
+                         (time.time(), kind, digest))
+            conn.commit()
+        return self._record(row)
+
+    def put(self, kind: str, digest: str, path: str, writer: Callable[[str], None],
+            region: Optional[str] = None) -> Dict[str, Any]:
+        """内容去重写入：同一哈希已登记时直接返回已有产物，否则由 writer 写入临时路径后原子替换并登记"""
+        record = self.lookup(kind, digest)
+        if record is not None:
+            self.deduplicated += 1
+            return {**record, "deduplicated": True}
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            writer(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            _remove_path(tmp_path)
+        return {**self.register(kind, digest, path, region), "deduplicated": False}
+
+    def query(self, kind: Optional[str] = None, region: Optional[str] = None, since: Optional[float] = None,
+              limit: int = 100) -> List[Dict[str, Any]]:
+        """按类型/地区/创建时间查询产物（最新在前）"""
+        clauses, params = [], []
+        if kind:
+            clauses.append("kind = ?")
+            params.append(kind)
+        if region:
+            clauses.append("region = ?")
+            params.append(region)
+        if since is not None:
+            clauses.append("created_at >= ?")
+            params.append(since)
+        where = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+        rows = self._connect().execute(
+            f"SELECT * FROM artifacts{where} ORDER BY created_at DESC LIMIT ?", params + [limit]
+        ).fetchall()
+        return [self._record(row) for row in rows]
+
+    def gc(self, now: Optional[float] = None) -> Dict[str, Any]:
+        """执行一次回收，返回删除的产物数和释放的字节数
+
+        选取与删除索引记录在同一个写事务中完成（BEGIN IMMEDIATE 同时挡住其他进程的写入），
+        删除时再核对访问时间：选取后被访问过的产物不删除。文件在索引记录删除并提交后才移除，
+        其他进程此后查找不到该产物，会重新生成而不是拿到已删除的路径。
+        """
+        now = time.time() if now is None else now
+        with self._write_lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                expired = conn.execute(
+                    "SELECT kind, digest, path, size, accessed_at FROM artifacts WHERE accessed_at < ?",
+                    (now - self.max_age,)
+                ).fetchall()
+                victims = list(expired)
+
+                total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM artifacts").fetchone()[0]
+                total -= sum(row["size"] for row in expired)
+                if total > self.max_bytes:
+                    expired_keys = {(row["kind"], row["digest"]) for row in expired}
+                    for row in conn.execute("SELECT kind, digest, path, size, accessed_at FROM artifacts "
+                                            "ORDER BY accessed_at"):
+                        if total <= self.max_bytes:
+                            break
+                        if (row["kind"], row["digest"]) in expired_keys:
+                            continue
+                        victims.append(row)
+                        total -= row["size"]
+
+                removed = [
+                    row for row in victims
+                    if conn.execute("DELETE FROM artifacts WHERE kind = ? AND digest = ? AND accessed_at = ?",
+                                    (row["kind"], row["digest"], row["accessed_at"])).rowcount
+                ]
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+        for row in removed:
+            _remove_path(row["path"])
+        freed = sum(row["size"] for row in removed)
+        if removed:
+            self.removed += len(removed)
+            logger.info(f"产物回收: 删除 {len(removed)} 个，释放 {freed} 字节")
+        return {"removed": len(removed), "freed_bytes": freed}
+
+    def _gc_loop(self):
+        while not self._stop.wait(self.gc_interval):
+            try:
+                self.gc()
+            except Exception as e:
+                logger.error(f"产物回收失败: {e}")
+
+    def start_gc(self):
+        """启动后台回收线程（gc_interval <= 0 时只能通过 gc() 手动回收）"""
+        if self.gc_interval <= 0 or self._gc_thread is not None:
+            return
+        self._stop.clear()
+        self._gc_thread = threading.Thread(target=self._gc_loop, name="artifact-gc", daemon=True)
+        self._gc_thread.start()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """各类型产物的数量与大小"""
+        rows = self._connect().execute(
+            "SELECT kind, COUNT(*) AS count, SUM(size) AS size, SUM(hits) AS hits FROM artifacts GROUP BY kind"
+        ).fetchall()
+        return {
+            "index_path": self.index_path,
+            "total_bytes": sum(row["size"] for row in rows),
+            "max_bytes": self.max_bytes,
+            "max_age": self.max_age,
+            "removed": self.removed,
+            "deduplicated": self.deduplicated,
+            "kinds": {row["kind"]: {"count": row["count"], "size": row["size"], "hits": row["hits"]} for row in rows}
+        }
+
+    def close(self):
+        self._stop.set()
+        if self._gc_thread is not None:
+            self._gc_thread.join(timeout=5)
+            self._gc_thread = None
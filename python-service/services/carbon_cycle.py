@@ -4,7 +4,6 @@ from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional
 from loguru import logger
 import os
-import json
 import folium
 from shapely.geometry import Point, Polygon
 import geopandas as gpd
@@ -15,23 +14,53 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from models.schemas import CarbonCycleRequest, CarbonCycleResponse
 from services.data_collector import DataCollector
+from services.synthetic_data import series_rng, generate_seasonal_flux
+from services.map_renderer import MapRenderer
+from services.artifact_store import ArtifactStore
+from services.report_writer import ReportWriter
+from services.map_layers import build_layers
 
 # 添加folium地图生成功能
 import folium
 from folium import plugins
 
+# 碳汇/碳源分量（列名）
+SINK_COMPONENTS = ("forest_sink", "grassland_sink", "wetland_sink")
+SOURCE_COMPONENTS = ("industrial_source", "transportation_source", "agricultural_source")
+
+# 地图标记位置的固定种子
+MAP_LAYOUT_SEED = 0
+
+MAPS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "maps")
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+def period_days(years: int) -> int:
+    """接口中的分析周期（年）换算为引擎使用的逐日序列长度（按日历计算，含闰日）"""
+    today = pd.Timestamp(datetime.now().date())
+    return int((today - (today - pd.DateOffset(years=years))).days)
+
 class CarbonCycleModel:
     """碳循环分析模型"""
 
-    def __init__(self):
+    def __init__(self, seed: Optional[int] = None, map_workers: int = 1,
+                 artifact_store: Optional[ArtifactStore] = None, report_max_pending: int = 8):
         self.is_initialized = False
         self.region_data = {}
         self.vegetation_models = {}
         self.data_collector = DataCollector()  # 集成数据采集器
+        self.seed = seed  # 模拟数据的随机种子，指定后同一地区/日期的结果可复现
+        self.artifact_store = artifact_store  # 地图和报告的去重索引与保留回收（可选）
 
         # 确保数据目录存在
         os.makedirs("data", exist_ok=True)
         os.makedirs("maps", exist_ok=True)
+        
+        # 地图后台渲染与内容寻址缓存
+        self.map_renderer = MapRenderer(MAPS_DIR, url_prefix="/maps", workers=map_workers,
+                                        store=artifact_store, kind="map")
+        # 分析报告的列式后台写入
+        self.report_writer = ReportWriter(DATA_DIR, max_pending=report_max_pending,
+                                          store=artifact_store, kind="report")
 
     def initialize_models(self):
         """初始化碳循环模型"""
@@ -55,6 +84,11 @@ class CarbonCycleModel:
         """检查模型是否准备就绪"""
         return self.is_initialized
 
+    def close(self):
+        """停止地图后台渲染，等待未完成的报告写入"""
+        self.map_renderer.shutdown()
+        self.report_writer.shutdown()
+
     def _initialize_region_data(self):
         """初始化地区数据"""
         # 中国主要地区的基础数据
@@ -183,8 +217,13 @@ class CarbonCycleModel:
             }
         }
     
-    def analyze_carbon_cycle(self, region: str, time_period: int, include_remote_sensing: bool = True) -> Dict[str, Any]:
-        """分析碳循环"""
+    def analyze_carbon_cycle(self, region: str, time_period: int, include_remote_sensing: bool = True,
+                             include_daily: bool = False) -> Dict[str, Any]:
+        """分析碳循环
+
+        time_period 为逐日序列的天数（接口以年为单位，由 period_days 换算）。
+        include_daily 时结果额外包含逐日碳汇/碳源明细（sink/source），多年周期下有数千条，默认不构造。
+        """
         try:
             if not self.is_initialized:
                 return {
@@ -205,80 +244,64 @@ class CarbonCycleModel:
             region_info = self.region_data[region]
             logger.info(f"开始分析地区 {region} 的碳循环，时间周期: {time_period} 天")
             
-            # 生成时间序列
-            time_series = self._generate_time_series(time_period)
-            
-            # 计算碳汇
-            carbon_sink_data = self._calculate_carbon_sink(region_info, time_series)
-            
-            # 计算碳源
-            carbon_source_data = self._calculate_carbon_source(region_info, time_series)
-            
-            # 计算净碳平衡
-            net_carbon_balance = []
-            for i in range(len(time_series)):
-                sink = carbon_sink_data[i]["total_sink"]
-                source = carbon_source_data[i]["total_source"]
-                net_balance = sink - source
-                net_carbon_balance.append({
-                    "date": time_series[i],
-                    "net_balance": net_balance,
-                    "sink": sink,
-                    "source": source,
-                    "balance_status": "positive" if net_balance > 0 else "negative"
-                })
+            dates, sink, source, balance = self._simulate_flux(region, time_period)
+            
+            # 各分量及总量的累计值：按列堆叠后一次归约
+            sink_totals = self._column_totals(sink, SINK_COMPONENTS)
+            source_totals = self._column_totals(source, SOURCE_COMPONENTS)
+            total_sink, total_source = sink_totals["total"], source_totals["total"]
+            net_emission = total_source - total_sink
             
             # 计算碳汇潜力
             sequestration_potential = self._calculate_sequestration_potential(region_info)
             
             # 生成地图数据
-            map_data = self._generate_map_data(region, carbon_sink_data, carbon_source_data, net_carbon_balance)
+            map_data = self._generate_map_data(region, sink, source, balance)
             
             # 分析时间趋势
-            temporal_trends_data = self._analyze_temporal_trends(net_carbon_balance)
+            temporal_trends_data = self._analyze_temporal_trends(balance["net_balance"])
             # 将时间趋势数据包装成列表格式以符合API响应结构
             temporal_trends = [temporal_trends_data] if temporal_trends_data else []
             
-            # 导出分析报告
-            report_path = self.export_analysis_report(region, {
-                "carbon_sink": carbon_sink_data,
-                "carbon_source": carbon_source_data,
-                "net_balance": net_carbon_balance,
+            # 导出分析报告（列式，后台写入）
+            report = self.export_analysis_report(region, {
+                "carbon_sink": sink,
+                "carbon_source": source,
+                "net_balance": balance,
                 "sequestration_potential": sequestration_potential,
                 "temporal_trends": temporal_trends_data
             })
             
-            # 计算汇总数据
-            total_sink = sum(d["total_sink"] for d in carbon_sink_data)
-            total_source = sum(d["total_source"] for d in carbon_source_data)
-            net_emission = total_source - total_sink
-            
             # 构建响应数据，确保与前端期望的结构一致
             response = {
                 "success": True,
                 "carbon_sink": {
                     "total": total_sink,
-                    "forest": sum(d["forest_sink"] for d in carbon_sink_data),
-                    "grassland": sum(d["grassland_sink"] for d in carbon_sink_data),
-                    "wetland": sum(d["wetland_sink"] for d in carbon_sink_data)
+                    "forest": sink_totals["forest_sink"],
+                    "grassland": sink_totals["grassland_sink"],
+                    "wetland": sink_totals["wetland_sink"]
                 },
                 "carbon_source": {
                     "total": total_source,
-                    "industrial": sum(d["industrial_source"] for d in carbon_source_data),
-                    "transportation": sum(d["transportation_source"] for d in carbon_source_data),
-                    "agricultural": sum(d["agricultural_source"] for d in carbon_source_data)
+                    "industrial": source_totals["industrial_source"],
+                    "transportation": source_totals["transportation_source"],
+                    "agricultural": source_totals["agricultural_source"]
                 },
                 "net_emission": net_emission,
                 "sequestration_potential": sequestration_potential,
                 "map_data": map_data,
                 "temporal_trends": temporal_trends,
-                "report_path": report_path,
+                "report_path": report.get("report_path", ""),
+                # 报告ID用于 /api/carbon-cycle/reports/{report_id} 读取
+                "report_id": report.get("report_id"),
                 # 添加前端需要的字段
-                "sink": carbon_sink_data,
-                "source": carbon_source_data,
                 "potential": sequestration_potential,
                 "mapPath": map_data.get("map_path", "") if map_data else ""
             }
+            # 逐日明细记录只在调用方需要时构造
+            if include_daily:
+                response["sink"] = self._flux_records(dates, sink, "total_sink")
+                response["source"] = self._flux_records(dates, source, "total_source")
             
             logger.info(f"碳循环分析完成: {region}, 碳汇: {total_sink:.2f}, 碳源: {total_source:.2f}, 净排放: {net_emission:.2f}")
             return response
@@ -292,109 +315,95 @@ class CarbonCycleModel:
                 "time_period": time_period
             }
     
-    def _generate_time_series(self, time_period: int) -> List[str]:
-        """生成时间序列"""
-        dates = []
-        start_date = datetime.now() - timedelta(days=time_period)
+    def _simulate_flux(self, region: str, time_period: int):
+        """生成逐日碳汇、碳源和净碳平衡（列式：每个分量一个数组，整段序列一次性生成）"""
+        region_info = self.region_data[region]
         
-        # 确保时间周期至少为1天
-        if time_period < 1:
-            time_period = 1
+        # 生成时间序列（datetime64 时间轴）
+        dates = self._generate_time_series(time_period)
         
-        for i in range(time_period):
-            date = start_date + timedelta(days=i)
-            dates.append(date.isoformat())
+        # 计算碳汇和碳源
+        day = dates[0].date()
+        sink = self._calculate_carbon_sink(
+            region_info, dates, series_rng(self.seed, "sink", region, time_period, day))
+        source = self._calculate_carbon_source(
+            region_info, dates, series_rng(self.seed, "source", region, time_period, day))
         
-        return dates
+        # 计算净碳平衡（逐日数组运算）
+        balance = {
+            "dates": dates.to_numpy(),
+            "net_balance": sink["total"] - source["total"],
+            "sink": sink["total"],
+            "source": source["total"]
+        }
+        return dates, sink, source, balance
 
-    def _calculate_carbon_sink(self, region_info: Dict[str, Any], time_series: List[str]) -> List[Dict[str, Any]]:
-        """计算碳汇"""
-        carbon_sink_data = []
-        
-        for i, date_str in enumerate(time_series):
-            try:
-                date = datetime.fromisoformat(date_str)
-                month = date.month
-            except (ValueError, TypeError):
-                # 如果日期解析失败，使用当前时间
-                date = datetime.now()
-                month = date.month
-            
-            # 基础碳汇（万吨/年）
-            forest_sink = (region_info["forest_coverage"] * region_info["area"] * 100 * 
-                          self.vegetation_models["forest"]["carbon_sequestration_rate"] / 10000)
-            
-            grassland_sink = (region_info["grassland_coverage"] * region_info["area"] * 100 * 
-                             self.vegetation_models["grassland"]["carbon_sequestration_rate"] / 10000)
-            
-            wetland_sink = (region_info["wetland_coverage"] * region_info["area"] * 100 * 
-                           self.vegetation_models["wetland"]["carbon_sequestration_rate"] / 10000)
-            
-            # 添加季节性变化（春夏季节碳汇能力更强）
-            seasonal_factor = 1.0 + 0.3 * np.sin(2 * np.pi * (month - 3) / 12)
-            
-            # 添加随机波动
-            random_factor = 1.0 + np.random.normal(0, 0.1)
-            
-            # 计算总碳汇
-            total_sink = (forest_sink + grassland_sink + wetland_sink) * seasonal_factor * random_factor
-            
-            carbon_sink_data.append({
-                "date": date_str,
-                "total_sink": total_sink,
-                "forest_sink": forest_sink * seasonal_factor * random_factor,
-                "grassland_sink": grassland_sink * seasonal_factor * random_factor,
-                "wetland_sink": wetland_sink * seasonal_factor * random_factor,
-                "seasonal_factor": seasonal_factor,
-                "random_factor": random_factor
-            })
+    def analyze_map_layers(self, region: str, time_period: int, precision: int = 4) -> Dict[str, Any]:
+        """只生成地图图层（碳汇/碳源标记、地区边界、净平衡指示）的 GeoJSON，不渲染HTML、不导出报告
+
+        与 HTML 地图使用同一份 spec，cache_key 相同即内容相同，可用作 ETag。
+        """
+        if not self.is_initialized:
+            raise RuntimeError("模型未初始化")
+        if region not in self.region_data:
+            raise ValueError(f"不支持的地区: {region}")
         
-        return carbon_sink_data
+        _, sink, source, balance = self._simulate_flux(region, time_period)
+        spec = self._map_spec(region, sink, source, balance)
+        return {
+            "cache_key": MapRenderer.cache_key(spec),
+            "geojson": build_layers(spec, self._get_region_geojson(region), precision)
+        }
 
-    def _calculate_carbon_source(self, region_info: Dict[str, Any], time_series: List[str]) -> List[Dict[str, Any]]:
-        """计算碳源"""
-        carbon_source_data = []
+    def _generate_time_series(self, time_period: int) -> pd.DatetimeIndex:
+        """生成时间序列（从 time_period 天前开始的逐日时间点，对齐到零点，同一天内的分析结果一致）"""
+        start_date = (datetime.now() - timedelta(days=time_period)).replace(hour=0, minute=0, second=0, microsecond=0)
         
-        for i, date_str in enumerate(time_series):
-            try:
-                date = datetime.fromisoformat(date_str)
-                month = date.month
-            except (ValueError, TypeError):
-                # 如果日期解析失败，使用当前时间
-                date = datetime.now()
-                month = date.month
-            
-            # 基础碳源（万吨/年）
-            industrial_source = (region_info["urban_coverage"] * region_info["area"] * 100 * 
-                               self.vegetation_models["industrial"]["emission_rate"] / 10000)
-            
-            transportation_source = (region_info["urban_coverage"] * region_info["area"] * 50 * 
-                                   self.vegetation_models["transportation"]["emission_rate"] / 10000)
-            
-            agricultural_source = (region_info["grassland_coverage"] * region_info["area"] * 30 * 
-                                 self.vegetation_models["agricultural"]["emission_rate"] / 10000)
-            
-            # 添加季节性变化
-            seasonal_factor = 1.0 + 0.2 * np.sin(2 * np.pi * (month - 1) / 12)
-            
-            # 添加随机波动
-            random_factor = 1.0 + np.random.normal(0, 0.1)
-            
-            # 计算总碳源
-            total_source = (industrial_source + transportation_source + agricultural_source) * seasonal_factor * random_factor
-            
-            carbon_source_data.append({
-                "date": date_str,
-                "total_source": total_source,
-                "industrial_source": industrial_source * seasonal_factor * random_factor,
-                "transportation_source": transportation_source * seasonal_factor * random_factor,
-                "agricultural_source": agricultural_source * seasonal_factor * random_factor,
-                "seasonal_factor": seasonal_factor,
-                "random_factor": random_factor
-            })
+        # 确保时间周期至少为1天
+        if time_period < 1:
+            time_period = 1
         
-        return carbon_source_data
-    
+        return pd.date_range(start=start_date, periods=time_period, freq="D")
+
+    def _calculate_carbon_sink(self, region_info: Dict[str, Any], dates: pd.DatetimeIndex,
+                               rng: Optional[np.random.Generator] = None) -> Dict[str, np.ndarray]:
+        """计算碳汇（春夏季节碳汇能力更强），返回各分量及 total 的逐日数组"""
+        # 基础碳汇（万吨/年）
+        components = {
+            f"{kind}_sink": (region_info[f"{kind}_coverage"] * region_info["area"] * 100 *
+                             self.vegetation_models[kind]["carbon_sequestration_rate"] / 10000)
+            for kind in ("forest", "grassland", "wetland")
+        }
+        return generate_seasonal_flux(dates, components, amplitude=0.3, phase_month=3, rng=rng)
+
+    def _calculate_carbon_source(self, region_info: Dict[str, Any], dates: pd.DatetimeIndex,
+                                 rng: Optional[np.random.Generator] = None) -> Dict[str, np.ndarray]:
+        """计算碳源，返回各分量及 total 的逐日数组"""
+        # 基础碳源（万吨/年）
+        components = {
+            "industrial_source": (region_info["urban_coverage"] * region_info["area"] * 100 *
+                                  self.vegetation_models["industrial"]["emission_rate"] / 10000),
+            "transportation_source": (region_info["urban_coverage"] * region_info["area"] * 50 *
+                                      self.vegetation_models["transportation"]["emission_rate"] / 10000),
+            "agricultural_source": (region_info["grassland_coverage"] * region_info["area"] * 30 *
+                                    self.vegetation_models["agricultural"]["emission_rate"] / 10000)
+        }
+        return generate_seasonal_flux(dates, components, amplitude=0.2, phase_month=1, rng=rng)
+
+    @staticmethod
+    def _column_totals(flux: Dict[str, np.ndarray], components) -> Dict[str, float]:
+        """各分量和 total 的累计值（堆叠为二维数组后一次求和）"""
+        names = list(components) + ["total"]
+        totals = np.vstack([flux[name] for name in names]).sum(axis=1)
+        return dict(zip(names, totals.tolist()))
+
+    @staticmethod
+    def _flux_records(dates: pd.DatetimeIndex, flux: Dict[str, np.ndarray], total_name: str) -> List[Dict[str, Any]]:
+        """将按列生成的通量序列转换为逐日记录"""
+        columns = {total_name if name == "total" else name: values.tolist() for name, values in flux.items()}
+        columns = {"date": np.datetime_as_string(dates.to_numpy(), unit="us").tolist(), **columns}
+        return [dict(zip(columns, row)) for row in zip(*columns.values())]
+
     def _calculate_sequestration_potential(self, region_info: Dict[str, Any]) -> Dict[str, Any]:
         """计算碳汇潜力"""
         try:
@@ -494,177 +503,31 @@ class CarbonCycleModel:
                 "roi": 0
             }
 
-    def _generate_map_data(self, region: str, carbon_sink_data: List[Dict[str, Any]], 
-                          carbon_source_data: List[Dict[str, Any]], 
-                          net_balance_data: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """生成地图数据"""
+    def _generate_map_data(self, region: str, sink: Dict[str, np.ndarray], 
+                          source: Dict[str, np.ndarray], 
+                          balance: Dict[str, np.ndarray]) -> Dict[str, Any]:
+        """生成地图数据（sink/source/balance 为列式逐日数组）
+
+        地图只取决于地区、日期和聚合值：这些输入整理为 spec 后提交后台渲染，
+        按内容哈希命名的地图已存在或正在渲染时不会重复渲染；这里立即返回地图URL和状态。
+        """
         try:
-            center = self._get_region_center(region)
-            
-            # 创建地图
-            m = folium.Map(
-                location=center,
-                zoom_start=6,
-                tiles='OpenStreetMap',
-                control_scale=True
-            )
+            spec = self._map_spec(region, sink, source, balance)
+            center, avg_sink, avg_source = spec["center"], spec["avg_sink"], spec["avg_source"]
             
-            # 添加地区边界
-            region_geojson = self._get_region_geojson(region)
-            if region_geojson:
-                folium.GeoJson(
-                    region_geojson,
-                    name=f"{region}边界",
-                    style_function=lambda x: {
-                        'fillColor': '#35c9ff',
-                        'color': '#35c9ff',
-                        'weight': 2,
-                        'fillOpacity': 0.1
-                    }
-                ).add_to(m)
-            
-            # 计算平均碳汇和碳源用于地图显示
-            avg_sink = np.mean([d["total_sink"] for d in carbon_sink_data]) if carbon_sink_data else 0
-            avg_source = np.mean([d["total_source"] for d in carbon_source_data]) if carbon_source_data else 0
-            
-            # 添加碳汇区域标记
-            sink_locations = self._generate_sink_locations(center, region)
-            for i, location in enumerate(sink_locations):
-                popup_content = f"""
-                <div style="width: 200px;">
-                    <h4>碳汇区域 {i+1}</h4>
-                    <p><strong>平均碳汇:</strong> {avg_sink:.2f}万吨/天</p>
-                    <p><strong>森林碳汇:</strong> {carbon_sink_data[-1]['forest_sink']:.2f}万吨</p>
-                    <p><strong>草地碳汇:</strong> {carbon_sink_data[-1]['grassland_sink']:.2f}万吨</p>
-                    <p><strong>湿地碳汇:</strong> {carbon_sink_data[-1]['wetland_sink']:.2f}万吨</p>
-                </div>
-                """ if carbon_sink_data else "碳汇区域"
-                
-                folium.CircleMarker(
-                    location=location,
-                    radius=15,
-                    popup=folium.Popup(popup_content, max_width=250),
-                    color='green',
-                    fill=True,
-                    fillColor='green',
-                    fillOpacity=0.8,
-                    weight=2
-                ).add_to(m)
-            
-            # 添加碳源区域标记
-            source_locations = self._generate_source_locations(center, region)
-            for i, location in enumerate(source_locations):
-                popup_content = f"""
-                <div style="width: 200px;">
-                    <h4>碳源区域 {i+1}</h4>
-                    <p><strong>平均碳源:</strong> {avg_source:.2f}万吨/天</p>
-                    <p><strong>工业排放:</strong> {carbon_source_data[-1]['industrial_source']:.2f}万吨</p>
-                    <p><strong>交通排放:</strong> {carbon_source_data[-1]['transportation_source']:.2f}万吨</p>
-                    <p><strong>农业排放:</strong> {carbon_source_data[-1]['agricultural_source']:.2f}万吨</p>
-                </div>
-                """ if carbon_source_data else "碳源区域"
-                
-                folium.CircleMarker(
-                    location=location,
-                    radius=12,
-                    popup=folium.Popup(popup_content, max_width=250),
-                    color='red',
-                    fill=True,
-                    fillColor='red',
-                    fillOpacity=0.8,
-                    weight=2
-                ).add_to(m)
-            
-            # 添加净碳平衡标记
-            if net_balance_data:
-                latest_balance = net_balance_data[-1]
-                balance_color = 'green' if latest_balance['net_balance'] > 0 else 'red'
-                balance_icon = 'check-circle' if latest_balance['net_balance'] > 0 else 'times-circle'
-                
-                balance_popup = f"""
-                <div style="width: 200px;">
-                    <h4>净碳平衡</h4>
-                    <p><strong>日期:</strong> {latest_balance['date']}</p>
-                    <p><strong>净平衡:</strong> {latest_balance['net_balance']:.2f}万吨</p>
-                    <p><strong>状态:</strong> {'碳汇>碳源' if latest_balance['net_balance'] > 0 else '碳源>碳汇'}</p>
-                    <p><strong>碳汇总量:</strong> {latest_balance['sink']:.2f}万吨</p>
-                    <p><strong>碳源总量:</strong> {latest_balance['source']:.2f}万吨</p>
-                </div>
-                """
-                
-                folium.Marker(
-                    location=[center[0] + 0.5, center[1] + 0.5],
-                    popup=folium.Popup(balance_popup, max_width=250),
-                    icon=folium.Icon(color=balance_color, icon=balance_icon, prefix='fa')
-                ).add_to(m)
-            
-            # 添加详细的图例
-            legend_html = f'''
-            <div style="position: fixed; 
-                        bottom: 50px; left: 50px; width: 220px; height: 220px; 
-                        background-color: white; border:2px solid grey; z-index:9999; 
-                        font-size:12px; padding: 10px; border-radius: 5px; box-shadow: 0 2px 10px rgba(0,0,0,0.1);">
-            <h4 style="margin: 0 0 10px 0; color: #333;">{region}碳循环图例</h4>
-            <p style="margin: 2px 0;"><span style="color:green; font-size: 16px;">●</span> 碳汇区域 (平均: {avg_sink:.1f}万吨/天)</p>
-            <p style="margin: 2px 0;"><span style="color:red; font-size: 16px;">●</span> 碳源区域 (平均: {avg_source:.1f}万吨/天)</p>
-            <p style="margin: 2px 0;"><span style="color:blue; font-size: 16px;">■</span> 地区边界</p>
-            <p style="margin: 2px 0;"><span style="color:green; font-size: 16px;">✓</span> 碳汇>碳源</p>
-            <p style="margin: 2px 0;"><span style="color:red; font-size: 16px;">✗</span> 碳源>碳汇</p>
-            <p style="margin: 5px 0; font-size: 10px; color: #666;">点击标记查看详细信息</p>
-            </div>
-            '''
-            m.get_root().html.add_child(folium.Element(legend_html))
-            
-            # 添加图层控制
-            folium.LayerControl().add_to(m)
-            
-            # 保存地图 - 使用绝对路径
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            map_filename = f"carbon_cycle_{region}_{timestamp}.html"
-            
-            # 确保maps目录存在
-            maps_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "maps")
-            os.makedirs(maps_dir, exist_ok=True)
-            
-            map_path = os.path.join(maps_dir, map_filename)
-            
-            # 保存地图文件
-            m.save(map_path)
-            
-            # 验证文件是否成功保存
-            if os.path.exists(map_path):
-                file_size = os.path.getsize(map_path)
-                logger.info(f"地图已保存: {map_path} (大小: {file_size} 字节)")
-                
-                # 生成相对路径用于前端访问
-                relative_path = f"/maps/{map_filename}"
-                logger.info(f"相对路径: {relative_path}")
-                
-                # 验证HTML文件内容
-                with open(map_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    if len(content) > 1000:  # 确保文件有足够的内容
-                        logger.info(f"地图HTML文件生成成功，内容长度: {len(content)} 字符")
-                    else:
-                        logger.warning(f"地图HTML文件内容可能不完整，长度: {len(content)} 字符")
-                
-            else:
-                logger.error(f"地图文件保存失败: {map_path}")
-                relative_path = ""
-                file_size = 0
+            rendered = self.map_renderer.submit(f"carbon_cycle_{region}", spec, self._render_map, region=region)
+            logger.info(f"地图{'已缓存' if rendered['status'] == 'ready' else '已提交渲染'}: {rendered['map_path']}")
             
             return {
-                "map_path": relative_path,
-                "map_filename": map_filename,
-                "absolute_path": map_path,
+                **rendered,
                 "center": center,
                 "zoom_level": 6,
                 "layers_count": 4,
-                "file_size": file_size,
-                "sink_count": len(sink_locations),
-                "source_count": len(source_locations),
-                "avg_sink": round(avg_sink, 2),
-                "avg_source": round(avg_source, 2)
+                "file_size": os.path.getsize(rendered["absolute_path"]) if rendered["status"] == "ready" else None,
+                "sink_count": len(spec["sink_locations"]),
+                "source_count": len(spec["source_locations"]),
+                "avg_sink": avg_sink,
+                "avg_source": avg_source
             }
             
         except Exception as e:
@@ -677,6 +540,149 @@ class CarbonCycleModel:
                 "zoom_level": 6
             }
     
+    def _map_spec(self, region: str, sink: Dict[str, np.ndarray],
+                  source: Dict[str, np.ndarray], balance: Dict[str, np.ndarray]) -> Dict[str, Any]:
+        """地图的全部输入：地区、标记位置、日期和聚合值（按展示精度取整后参与缓存键）"""
+        center = self._get_region_center(region)
+        
+        # 平均碳汇和碳源用于地图显示，弹窗展示最后一天的各分量
+        has_data = len(balance["net_balance"]) > 0
+        return {
+            "region": region,
+            "center": center,
+            "sink_locations": self._generate_sink_locations(center, region),
+            "source_locations": self._generate_source_locations(center, region),
+            "avg_sink": round(float(sink["total"].mean()), 2) if has_data else 0,
+            "avg_source": round(float(source["total"].mean()), 2) if has_data else 0,
+            "latest_sink": {name: round(float(values[-1]), 2) for name, values in sink.items()} if has_data else None,
+            "latest_source": {name: round(float(values[-1]), 2) for name, values in source.items()} if has_data else None,
+            "latest_balance": {
+                "date": np.datetime_as_string(balance["dates"][-1], unit="D"),
+                "net_balance": round(float(balance["net_balance"][-1]), 2),
+                "sink": round(float(balance["sink"][-1]), 2),
+                "source": round(float(balance["source"][-1]), 2)
+            } if has_data else None
+        }
+    
+    def _render_map(self, spec: Dict[str, Any], map_path: str):
+        """按 spec 渲染folium地图并保存到 map_path（在后台渲染线程中执行）"""
+        region, center = spec["region"], spec["center"]
+        avg_sink, avg_source = spec["avg_sink"], spec["avg_source"]
+        latest_sink, latest_source = spec["latest_sink"], spec["latest_source"]
+        latest_balance = spec["latest_balance"]
+        
+        # 创建地图
+        m = folium.Map(
+            location=center,
+            zoom_start=6,
+            tiles='OpenStreetMap',
+            control_scale=True
+        )
+        
+        # 添加地区边界
+        region_geojson = self._get_region_geojson(region)
+        if region_geojson:
+            folium.GeoJson(
+                region_geojson,
+                name=f"{region}边界",
+                style_function=lambda x: {
+                    'fillColor': '#35c9ff',
+                    'color': '#35c9ff',
+                    'weight': 2,
+                    'fillOpacity': 0.1
+                }
+            ).add_to(m)
+        
+        # 添加碳汇区域标记
+        for i, location in enumerate(spec["sink_locations"]):
+            popup_content = f"""
+            <div style="width: 200px;">
+                <h4>碳汇区域 {i+1}</h4>
+                <p><strong>平均碳汇:</strong> {avg_sink:.2f}万吨/天</p>
+                <p><strong>森林碳汇:</strong> {latest_sink['forest_sink']:.2f}万吨</p>
+                <p><strong>草地碳汇:</strong> {latest_sink['grassland_sink']:.2f}万吨</p>
+                <p><strong>湿地碳汇:</strong> {latest_sink['wetland_sink']:.2f}万吨</p>
+            </div>
+            """ if latest_sink else "碳汇区域"
+            
+            folium.CircleMarker(
+                location=location,
+                radius=15,
+                popup=folium.Popup(popup_content, max_width=250),
+                color='green',
+                fill=True,
+                fillColor='green',
+                fillOpacity=0.8,
+                weight=2
+            ).add_to(m)
+        
+        # 添加碳源区域标记
+        for i, location in enumerate(spec["source_locations"]):
+            popup_content = f"""
+            <div style="width: 200px;">
+                <h4>碳源区域 {i+1}</h4>
+                <p><strong>平均碳源:</strong> {avg_source:.2f}万吨/天</p>
+                <p><strong>工业排放:</strong> {latest_source['industrial_source']:.2f}万吨</p>
+                <p><strong>交通排放:</strong> {latest_source['transportation_source']:.2f}万吨</p>
+                <p><strong>农业排放:</strong> {latest_source['agricultural_source']:.2f}万吨</p>
+            </div>
+            """ if latest_source else "碳源区域"
+            
+            folium.CircleMarker(
+                location=location,
+                radius=12,
+                popup=folium.Popup(popup_content, max_width=250),
+                color='red',
+                fill=True,
+                fillColor='red',
+                fillOpacity=0.8,
+                weight=2
+            ).add_to(m)
+        
+        # 添加净碳平衡标记
+        if latest_balance:
+            balance_color = 'green' if latest_balance['net_balance'] > 0 else 'red'
+            balance_icon = 'check-circle' if latest_balance['net_balance'] > 0 else 'times-circle'
+            
+            balance_popup = f"""
+            <div style="width: 200px;">
+                <h4>净碳平衡</h4>
+                <p><strong>日期:</strong> {latest_balance['date']}</p>
+                <p><strong>净平衡:</strong> {latest_balance['net_balance']:.2f}万吨</p>
+                <p><strong>状态:</strong> {'碳汇>碳源' if latest_balance['net_balance'] > 0 else '碳源>碳汇'}</p>
+                <p><strong>碳汇总量:</strong> {latest_balance['sink']:.2f}万吨</p>
+                <p><strong>碳源总量:</strong> {latest_balance['source']:.2f}万吨</p>
+            </div>
+            """
+            
+            folium.Marker(
+                location=[center[0] + 0.5, center[1] + 0.5],
+                popup=folium.Popup(balance_popup, max_width=250),
+                icon=folium.Icon(color=balance_color, icon=balance_icon, prefix='fa')
+            ).add_to(m)
+        
+        # 添加详细的图例
+        legend_html = f'''
+        <div style="position: fixed; 
+                    bottom: 50px; left: 50px; width: 220px; height: 220px; 
+                    background-color: white; border:2px solid grey; z-index:9999; 
+                    font-size:12px; padding: 10px; border-radius: 5px; box-shadow: 0 2px 10px rgba(0,0,0,0.1);">
+        <h4 style="margin: 0 0 10px 0; color: #333;">{region}碳循环图例</h4>
+        <p style="margin: 2px 0;"><span style="color:green; font-size: 16px;">●</span> 碳汇区域 (平均: {avg_sink:.1f}万吨/天)</p>
+        <p style="margin: 2px 0;"><span style="color:red; font-size: 16px;">●</span> 碳源区域 (平均: {avg_source:.1f}万吨/天)</p>
+        <p style="margin: 2px 0;"><span style="color:blue; font-size: 16px;">■</span> 地区边界</p>
+        <p style="margin: 2px 0;"><span style="color:green; font-size: 16px;">✓</span> 碳汇>碳源</p>
+        <p style="margin: 2px 0;"><span style="color:red; font-size: 16px;">✗</span> 碳源>碳汇</p>
+        <p style="margin: 5px 0; font-size: 10px; color: #666;">点击标记查看详细信息</p>
+        </div>
+        '''
+        m.get_root().html.add_child(folium.Element(legend_html))
+        
+        # 添加图层控制
+        folium.LayerControl().add_to(m)
+        
+        m.save(map_path)
+    
     def _get_region_center(self, region: str) -> List[float]:
         """获取地区中心点"""
         if region in self.region_data:
@@ -748,12 +754,14 @@ class CarbonCycleModel:
             "东北": 3
         }.get(region, 3)
         
+        # 位置按地区固定（与模拟数据种子无关），同一地区的地图内容只随聚合值变化
+        rng = series_rng(MAP_LAYOUT_SEED, "sink_locations", region)
         for i in range(num_locations):
             # 在中心点周围生成位置
-            lat_offset = np.random.uniform(-1.0, 1.0)
-            lng_offset = np.random.uniform(-1.0, 1.0)
+            lat_offset = rng.uniform(-1.0, 1.0)
+            lng_offset = rng.uniform(-1.0, 1.0)
             
-            locations.append([base_lat + lat_offset, base_lng + lng_offset])
+            locations.append([round(base_lat + lat_offset, 6), round(base_lng + lng_offset, 6)])
         
         return locations
     
@@ -774,23 +782,22 @@ class CarbonCycleModel:
             "东北": 2
         }.get(region, 2)
         
+        rng = series_rng(MAP_LAYOUT_SEED, "source_locations", region)
         for i in range(num_locations):
             # 在中心点周围生成位置，与碳汇位置错开
-            lat_offset = np.random.uniform(-0.8, 0.8) + 0.5 * (i % 2)
-            lng_offset = np.random.uniform(-0.8, 0.8) + 0.5 * ((i + 1) % 2)
+            lat_offset = rng.uniform(-0.8, 0.8) + 0.5 * (i % 2)
+            lng_offset = rng.uniform(-0.8, 0.8) + 0.5 * ((i + 1) % 2)
             
-            locations.append([base_lat + lat_offset, base_lng + lng_offset])
+            locations.append([round(base_lat + lat_offset, 6), round(base_lng + lng_offset, 6)])
         
         return locations
     
-    def _analyze_temporal_trends(self, net_balance_data: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """分析时间趋势"""
+    def _analyze_temporal_trends(self, balances: np.ndarray) -> Dict[str, Any]:
+        """分析时间趋势（balances 为逐日净碳平衡数组）"""
         try:
-            if not net_balance_data:
+            if len(balances) == 0:
                 return {"trend": "unknown", "description": "无数据"}
             
-            balances = [d["net_balance"] for d in net_balance_data]
-            
             if len(balances) < 2:
                 return {"trend": "stable", "description": "数据不足"}
             
@@ -812,8 +819,8 @@ class CarbonCycleModel:
             # 计算统计信息
             mean_balance = np.mean(balances)
             std_balance = np.std(balances)
-            positive_days = sum(1 for b in balances if b > 0)
-            negative_days = sum(1 for b in balances if b < 0)
+            positive_days = np.count_nonzero(balances > 0)
+            negative_days = np.count_nonzero(balances < 0)
             
             return {
                 "trend": trend,
@@ -841,41 +848,58 @@ class CarbonCycleModel:
                 "improvement_rate": 0.0
             }
 
-    def export_analysis_report(self, region: str, analysis_data: Dict[str, Any]) -> str:
-        """导出分析报告"""
+    def export_analysis_report(self, region: str, analysis_data: Dict[str, Any]) -> Dict[str, Any]:
+        """导出分析报告，返回 {report_id, report_path（清单路径）, status}，导出失败时返回空字典
+
+        analysis_data 中 carbon_sink/carbon_source/net_balance 为列式逐日数组，
+        逐日序列写为可内存映射的列式文件，汇总、碳汇潜力和趋势写入清单；写入在后台进行。
+        """
         try:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            report_filename = f"carbon_cycle_report_{region}_{timestamp}.json"
+            sink = analysis_data.get("carbon_sink") or {}
+            source = analysis_data.get("carbon_source") or {}
+            balance = analysis_data.get("net_balance") or {}
+            net_balance = balance.get("net_balance", np.empty(0))
+            has_data = len(net_balance) > 0
             
-            # 确保data目录存在
-            data_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
-            os.makedirs(data_dir, exist_ok=True)
-            
-            report_path = os.path.join(data_dir, report_filename)
-            
-            # 准备报告数据
-            report = {
+            meta = {
                 "region": region,
-                "analysis_date": datetime.now().isoformat(),
                 "summary": {
-                    "total_days": len(analysis_data.get("net_balance", [])),
-                    "average_sink": np.mean([d["total_sink"] for d in analysis_data.get("carbon_sink", [])]) if analysis_data.get("carbon_sink") else 0,
-                    "average_source": np.mean([d["total_source"] for d in analysis_data.get("carbon_source", [])]) if analysis_data.get("carbon_source") else 0,
-                    "net_balance_trend": analysis_data.get("temporal_trends", {}).get("trend", "unknown")
+                    "total_days": len(net_balance),
+                    "average_sink": float(sink["total"].mean()) if has_data else 0,
+                    "average_source": float(source["total"].mean()) if has_data else 0,
+                    "net_balance_trend": (analysis_data.get("temporal_trends") or {}).get("trend", "unknown")
                 },
-                "detailed_data": analysis_data
+                "sequestration_potential": analysis_data.get("sequestration_potential"),
+                "temporal_trends": analysis_data.get("temporal_trends")
+            }
+            columns = {
+                "total_sink": sink.get("total", np.empty(0)),
+                **{name: sink.get(name, np.empty(0)) for name in SINK_COMPONENTS},
+                "total_source": source.get("total", np.empty(0)),
+                **{name: source.get(name, np.empty(0)) for name in SOURCE_COMPONENTS},
+                "net_balance": net_balance
             }
             
-            # 保存报告
-            with open(report_path, 'w', encoding='utf-8') as f:
-                json.dump(report, f, ensure_ascii=False, indent=2, default=str)
-            
-            logger.info(f"分析报告已导出: {report_path}")
-            return report_path
+            report = self.report_writer.submit(
+                f"carbon_cycle_report_{region}", meta, balance.get("dates", np.empty(0, dtype="datetime64[D]")),
+                columns, region=region
+            )
+            logger.info(f"分析报告{'已存在' if report['status'] == 'ready' else '已提交写入'}: {report['report_path']}")
+            return report
             
         except Exception as e:
             logger.error(f"报告导出失败: {e}")
-            return ""
+            return {}
+
+    def load_analysis_report(self, report_id: str, columns: Optional[List[str]] = None,
+                             start: Optional[Any] = None, end: Optional[Any] = None) -> Dict[str, Any]:
+        """读取列式分析报告（内存映射），按列和日期范围 [start, end) 切片"""
+        report = self.report_writer.load(report_id, columns=columns, start=start, end=end)
+        return {
+            **report["manifest"],
+            "dates": np.datetime_as_string(report["dates"], unit="D").tolist(),
+            "series": {name: np.round(values, 2).tolist() for name, values in report["columns"].items()}
+        }
 
 
 # ----------------------
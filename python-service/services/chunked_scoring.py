@@ -0,0 +1,203 @@
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+import torch
+
+from services.synthetic_data import generate_spec_series, spec_dates
+
+# 工作进程内缓存：模型负载共享内存名 -> 反序列化后的 (自编码器, 标准化器, 隔离森林)
+_worker_components = {}
+# 工作进程内缓存：巡检模型标识 -> 反序列化后的 (标准化器, 隔离森林)，模型版本变化时标识随之变化
+_worker_forests = {}
+MAX_WORKER_FORESTS = 32
+
+
+def _init_worker():
+    # 每个工作进程单线程计算，并行度由进程数决定，避免线程超额订阅
+    torch.set_num_threads(1)
+
+
+def _load_components(payload_name: str, payload_size: int):
+    components = _worker_components.get(payload_name)
+    if components is None:
+        shm = SharedMemory(name=payload_name)
+        try:
+            components = pickle.loads(bytes(shm.buf[:payload_size]))
+        finally:
+            shm.close()
+        # 只保留当前一次检测的模型，内存不随请求数增长
+        _worker_components.clear()
+        _worker_components[payload_name] = components
+    return components
+
+
+def score_spec_chunk(spec: Dict[str, Any], columns: List[str], report_columns: List[str], components,
+                     chunk: int, start: int, stop: int, z_threshold: float):
+    """生成并评分序列的 [start, stop) 行
+
+    返回 (报告列, 隔离森林标记, Z-score标记, 重构误差)；报告列为融合结果需要的原始值，
+    其余特征用完即弃，内存只与块大小有关。
+    """
+    model, scaler, isolation_forest = components
+    data = generate_spec_series(spec, start, stop, chunk)
+    X = data[columns].to_numpy(dtype=np.float64)
+    X_scaled = scaler.transform(X)
+    if_flags = isolation_forest.score_samples(X) < isolation_forest.offset_
+    z_flags = (np.abs(X_scaled) > z_threshold).any(axis=1)
+    X_tensor = torch.FloatTensor(X_scaled)
+    with torch.no_grad():
+        errors = torch.mean((X_tensor - model(X_tensor)) ** 2, dim=1).numpy()
+    return data[report_columns].to_numpy(dtype=np.float64), if_flags, z_flags, errors
+
+
+def _output_arrays(buffer, n_rows: int, n_report: int):
+    """输出缓冲区布局：报告列 float64 [n, k]、重构误差 float32 [n]、(隔离森林, Z-score) 标记 bool [n, 2]"""
+    report = np.ndarray((n_rows, n_report), dtype=np.float64, buffer=buffer)
+    errors = np.ndarray((n_rows,), dtype=np.float32, buffer=buffer, offset=n_rows * n_report * 8)
+    flags = np.ndarray((n_rows, 2), dtype=np.bool_, buffer=buffer, offset=n_rows * (n_report * 8 + 4))
+    return report, errors, flags
+
+
+def _output_size(n_rows: int, n_report: int) -> int:
+    return max(1, n_rows * (n_report * 8 + 4 + 2))
+
+
+def _score_chunk(out_name: str, payload_name: str, payload_size: int, spec, columns, report_columns,
+                 chunk: int, start: int, stop: int, z_threshold: float):
+    """在工作进程中生成并评分一块，结果直接写回共享内存"""
+    components = _load_components(payload_name, payload_size)
+    report_chunk, if_flags, z_flags, errors_chunk = score_spec_chunk(
+        spec, columns, report_columns, components, chunk, start, stop, z_threshold
+    )
+    out_shm = SharedMemory(name=out_name)
+    try:
+        report, errors, flags = _output_arrays(out_shm.buf, spec["periods"], len(report_columns))
+        report[start:stop] = report_chunk
+        errors[start:stop] = errors_chunk
+        flags[start:stop, 0] = if_flags
+        flags[start:stop, 1] = z_flags
+        del report, errors, flags
+    finally:
+        out_shm.close()
+
+
+def _collect(spec, report_columns, buffer) -> Tuple[pd.DataFrame, np.ndarray, np.ndarray, np.ndarray]:
+    report, errors, flags = _output_arrays(buffer, spec["periods"], len(report_columns))
+    data = pd.DataFrame(report.copy(), columns=report_columns)
+    data.insert(0, "date", spec_dates(spec))
+    result = data, flags[:, 0].copy(), errors.copy(), flags[:, 1].copy()
+    del report, errors, flags
+    return result
+
+
+def score_spec_inline(spec: Dict[str, Any], columns: List[str], report_columns: List[str], components,
+                      chunk_rows: int, z_threshold: float = 2.5):
+    """在本进程中逐块生成并评分（无进程池或进程池失败时使用），结果与 ChunkedScorer.score_spec 一致"""
+    n_rows = spec["periods"]
+    buffer = bytearray(_output_size(n_rows, len(report_columns)))
+    report, errors, flags = _output_arrays(buffer, n_rows, len(report_columns))
+    for chunk, start in enumerate(range(0, n_rows, chunk_rows)):
+        stop = min(start + chunk_rows, n_rows)
+        report[start:stop], flags[start:stop, 0], flags[start:stop, 1], errors[start:stop] = score_spec_chunk(
+            spec, columns, report_columns, components, chunk, start, stop, z_threshold
+        )
+    return _collect(spec, report_columns, buffer)
+
+
+def _prepare_industry(spec, columns, model_id: str, payload: bytes, z_threshold: float):
+    """在工作进程中生成一个行业的数据并完成标准化、隔离森林和Z-score评分
+
+    隔离森林逐棵树在 Python 中循环评分，受 GIL 限制，只有放到独立进程才能真正并行。
+    """
+    forest = _worker_forests.get(model_id)
+    if forest is None:
+        if len(_worker_forests) >= MAX_WORKER_FORESTS:
+            _worker_forests.clear()
+        forest = _worker_forests[model_id] = pickle.loads(payload)
+    scaler, isolation_forest = forest
+
+    data = generate_spec_series(spec)
+    X = data[columns].to_numpy(dtype=np.float64)
+    X_scaled = scaler.transform(X)
+    if_flags = isolation_forest.score_samples(X) < isolation_forest.offset_
+    return data, X_scaled, if_flags, (np.abs(X_scaled) > z_threshold).any(axis=1)
+
+
+class ChunkedScorer:
+    """超长序列的分块多进程评分
+
+    序列不在主进程中生成：各工作进程按序列描述（spec）生成自己负责的块，完成隔离森林、
+    自编码器重构误差、Z-score评分后，只把重构误差、两种标记和融合需要的报告列写回共享输出数组，
+    不经过进程间管道传输；模型负载放入共享内存，每个进程只反序列化一次。
+    三种方法都是逐行评分，不依赖相邻行，因此分块之间不需要重叠；
+    自编码器的分位数阈值由调用方在拼接后的完整误差序列上统一计算。
+    """
+
+    def __init__(self, processes: int, chunk_rows: int = 16384):
+        self.processes = processes
+        self.chunk_rows = chunk_rows
+        self._pool = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.processes, mp_context=get_context("spawn"), initializer=_init_worker
+            )
+        return self._pool
+
+    def score_spec(self, spec: Dict[str, Any], columns: List[str], report_columns: List[str], components,
+                   z_threshold: float = 2.5) -> Tuple[pd.DataFrame, np.ndarray, np.ndarray, np.ndarray]:
+        """返回 (日期+报告列, 隔离森林标记, 重构误差, Z-score标记)"""
+        n_rows = spec["periods"]
+        payload = pickle.dumps(components, protocol=pickle.HIGHEST_PROTOCOL)
+
+        out_shm = SharedMemory(create=True, size=_output_size(n_rows, len(report_columns)))
+        payload_shm = SharedMemory(create=True, size=len(payload))
+        try:
+            payload_shm.buf[:len(payload)] = payload
+
+            pool = self._get_pool()
+            futures = [
+                pool.submit(_score_chunk, out_shm.name, payload_shm.name, len(payload), spec, columns,
+                            report_columns, chunk, start, min(start + self.chunk_rows, n_rows), z_threshold)
+                for chunk, start in enumerate(range(0, n_rows, self.chunk_rows))
+            ]
+            try:
+                for future in futures:
+                    future.result()
+            except BrokenProcessPool:
+                # 工作进程异常退出后进程池不可再用，下次调用时重建
+                self.close()
+                raise
+
+            return _collect(spec, report_columns, out_shm.buf)
+        finally:
+            for shm in (out_shm, payload_shm):
+                shm.close()
+                shm.unlink()
+
+    def prepare_industries(self, jobs, columns, z_threshold: float = 2.5):
+        """多行业巡检：各行业的数据生成、标准化、隔离森林和Z-score评分分派到进程池并行执行
+
+        jobs 为 (序列描述, 模型标识, 序列化的 (标准化器, 隔离森林)) 列表，
+        按顺序返回 (数据, 标准化后的特征, 隔离森林标记, Z-score标记)。
+        """
+        pool = self._get_pool()
+        futures = [pool.submit(_prepare_industry, spec, columns, model_id, payload, z_threshold)
+                   for spec, model_id, payload in jobs]
+        try:
+            return [future.result() for future in futures]
+        except BrokenProcessPool:
+            self.close()
+            raise
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,120 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, Optional
+
+import torch
+from loguru import logger
+
+
+class ExecutorSaturatedError(RuntimeError):
+    """计算任务排队已满，调用方应返回503让客户端稍后重试"""
+
+
+class ComputeExecutor:
+    """CPU密集型计算的专用执行器
+
+    计算在独立线程池中运行，事件循环只负责调度，/health 等轻量接口不受阻塞。
+    每个接口有独立的并发上限（limits）和等待队列上限（max_queue），
+    队列已满时立即抛出 ExecutorSaturatedError，而不是让请求无限堆积。
+    torch 的算子线程数按工作线程数划分，避免多个推理同时运行时线程超额订阅。
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, torch_threads: Optional[int] = None,
+                 max_queue: int = 32, limits: Optional[Dict[str, int]] = None, default_limit: int = 2):
+        cpu_count = os.cpu_count() or 1
+        self.max_workers = max_workers or min(4, cpu_count)
+        self.torch_threads = torch_threads or max(1, cpu_count // self.max_workers)
+        self.max_queue = max_queue
+        self.limits = dict(limits or {})
+        self.default_limit = default_limit
+
+        torch.set_num_threads(self.torch_threads)
+        self.pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="compute")
+
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._waiting: Dict[str, int] = {}
+        self._running: Dict[str, int] = {}
+        self._rejected: Dict[str, int] = {}
+        self._completed: Dict[str, int] = {}
+
+        logger.info(f"计算执行器已启动: {self.max_workers} 个工作线程, torch线程数 {self.torch_threads}")
+
+    async def acquire(self, endpoint: str):
+        """占用一个接口并发名额；等待者已达上限时立即拒绝"""
+        if self._waiting.get(endpoint, 0) >= self.max_queue:
+            self._rejected[endpoint] = self._rejected.get(endpoint, 0) + 1
+            raise ExecutorSaturatedError(f"服务繁忙，{endpoint} 排队请求已达上限 ({self.max_queue})，请稍后重试")
+
+        semaphore = self._semaphore(endpoint)
+        self._waiting[endpoint] = self._waiting.get(endpoint, 0) + 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self._waiting[endpoint] -= 1
+        self._running[endpoint] = self._running.get(endpoint, 0) + 1
+
+    async def try_acquire(self, endpoint: str):
+        """不排队地占用一个接口并发名额，没有空闲名额时立即拒绝（用于长连接）"""
+        semaphore = self._semaphore(endpoint)
+        if semaphore.locked():
+            self._rejected[endpoint] = self._rejected.get(endpoint, 0) + 1
+            raise ExecutorSaturatedError(f"服务繁忙，{endpoint} 并发已达上限，请稍后重试")
+        # 有空闲名额时 acquire 不会挂起
+        await semaphore.acquire()
+        self._running[endpoint] = self._running.get(endpoint, 0) + 1
+
+    def release(self, endpoint: str):
+        """释放接口并发名额"""
+        self._running[endpoint] -= 1
+        self._completed[endpoint] = self._completed.get(endpoint, 0) + 1
+        self._semaphores[endpoint].release()
+
+    @asynccontextmanager
+    async def limit(self, endpoint: str):
+        """在接口并发名额内执行（计算本身可以在别处调度，例如推理微批）"""
+        await self.acquire(endpoint)
+        try:
+            yield
+        finally:
+            self.release(endpoint)
+
+    async def run(self, endpoint: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """在接口并发名额内，于计算线程池中执行同步函数"""
+        async with self.limit(endpoint):
+            return await self.submit(fn, *args, **kwargs)
+
+    async def submit(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """于计算线程池中执行同步函数（调用方已通过 acquire/limit 占用名额，如长连接）"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.pool, functools.partial(fn, *args, **kwargs))
+
+    def _semaphore(self, endpoint: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(endpoint)
+        if semaphore is None:
+            semaphore = self._semaphores[endpoint] = asyncio.Semaphore(self.limits.get(endpoint, self.default_limit))
+        return semaphore
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取各接口的运行/排队/拒绝统计"""
+        endpoints = set(self._semaphores) | set(self._rejected)
+        return {
+            "max_workers": self.max_workers,
+            "torch_threads": self.torch_threads,
+            "max_queue": self.max_queue,
+            "endpoints": {
+                name: {
+                    "limit": self.limits.get(name, self.default_limit),
+                    "running": self._running.get(name, 0),
+                    "waiting": self._waiting.get(name, 0),
+                    "completed": self._completed.get(name, 0),
+                    "rejected": self._rejected.get(name, 0)
+                }
+                for name in sorted(endpoints)
+            }
+        }
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,266 @@
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+import sys
+import os
+# 添加父目录到Python路径，确保可以导入services
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.synthetic_data import series_rng, generate_energy_logs
+
+# 能源日志模板（templates/energy_logs_template.csv）列名 -> 内部列名
+ENERGY_LOG_COLUMNS = {
+    "时间戳": "timestamp",
+    "设备ID": "device_id",
+    "设备类型": "device_type",
+    "能源类型": "energy_type",
+    "消耗量": "consumption",
+    "单位": "unit",
+    "排放因子": "emission_factor",
+    "行业": "industry",
+    "地区": "region",
+    "操作员": "operator",
+    "备注": "note",
+}
+REQUIRED_COLUMNS = ("timestamp", "device_id", "consumption")
+
+MAD_SCALE = 1.4826  # MAD 换算为正态标准差的系数
+MIN_RELATIVE_SCALE = 0.01  # 相对残差尺度下限（1%），避免读数恒定的设备被微小波动触发
+FACTOR_TOLERANCE = 0.2  # 排放因子相对设备基线偏离超过20%视为异常
+# 按命中组合编码（消耗偏高=1, 消耗偏低=2, 排放因子偏离=4）查表得到异常原因
+FLEET_REASONS = [
+    [reason for bit, reason in enumerate(["能耗显著高于设备基线", "能耗显著低于设备基线", "排放因子偏离设备基线"])
+     if code & (1 << bit)]
+    for code in range(8)
+]
+SEVERITY_LABELS = np.array(["low", "medium", "high", "critical"])
+
+
+def _group_median(codes: np.ndarray, values: np.ndarray, n_groups: int) -> np.ndarray:
+    """按整数分组编码求中位数（忽略NaN，空组为NaN）
+
+    先按值排序，再按分组编码稳定排序（编码位数小时 numpy 使用基数排序），比 lexsort 快数倍。
+    """
+    valid = ~np.isnan(values)
+    codes, values = codes[valid], values[valid]
+    by_value = np.argsort(values)
+    code_dtype = np.int16 if n_groups <= np.iinfo(np.int16).max else np.int32
+    values = values[by_value[np.argsort(codes[by_value].astype(code_dtype), kind="stable")]]
+    counts = np.bincount(codes, minlength=n_groups)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    medians = np.full(n_groups, np.nan)
+    present = counts > 0
+    lower = starts[present] + (counts[present] - 1) // 2
+    upper = starts[present] + counts[present] // 2
+    medians[present] = (values[lower] + values[upper]) / 2
+    return medians
+
+
+def _label(value) -> str:
+    # 含空值的整数列会被读成浮点数，整数值去掉多余的 ".0"
+    if isinstance(value, (float, np.floating)) and float(value).is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _labels(values) -> np.ndarray:
+    """CSV 文本列转换为可序列化的标签：空值为 None，其余为 str
+
+    上传的 CSV 中空单元格读为 NaN（JSON 不允许），数值列读为 numpy 标量。
+    只对去重后的取值做转换，百万行级别的列也只需一次分组编码。
+    """
+    codes, uniques = pd.factorize(values)
+    labels = np.array([None] + [_label(value) for value in uniques], dtype=object)
+    return labels[codes + 1]
+
+
+class FleetAnomalyDetector:
+    """设备级（机队）能耗异常检测
+
+    一个共享模型 + 每台设备的稳健基线，全部以分组向量化运算完成：
+    - 设备基线：每台设备消耗量的中位数
+    - 共享日内曲线：同类设备在每个小时相对自身基线的中位比值
+    - 期望消耗 = 设备基线 × 同类设备该小时比值；相对残差按设备 MAD 标准化为稳健Z分数，
+      数据点不足或 MAD 为0的设备改用同类设备的 MAD
+    - 排放因子相对设备中位数偏离超过 FACTOR_TOLERANCE 也视为异常
+    每个时间桶内按异常分数取前 top_k 台设备。
+    """
+
+    def __init__(self, z_threshold: float = 3.5, min_device_points: int = 8, seed: Optional[int] = None):
+        self.z_threshold = z_threshold
+        self.min_device_points = min_device_points
+        # 模拟数据的随机种子
+        self.seed = seed
+    
+    def simulate(self, devices: int, hours: int) -> pd.DataFrame:
+        """生成 devices 台设备最近 hours 小时的模拟能源日志（未上传数据时使用）"""
+        end = datetime.now()
+        rng = series_rng(self.seed, "fleet", devices, hours, end.date(), end.hour)
+        return generate_energy_logs(devices, hours, end=end, freq="h", rng=rng)
+
+    @staticmethod
+    def normalize(records: Union[pd.DataFrame, List[Dict[str, Any]]]) -> pd.DataFrame:
+        """能源日志记录（模板中文列名或内部英文列名）转换为内部列名的 DataFrame"""
+        data = records if isinstance(records, pd.DataFrame) else pd.DataFrame.from_records(records)
+        data = data.rename(columns=ENERGY_LOG_COLUMNS)
+        missing = [name for name in REQUIRED_COLUMNS if name not in data.columns]
+        if missing:
+            raise ValueError(f"能源日志缺少必要列: {', '.join(missing)}")
+        return data
+
+    def detect(self, records: Union[pd.DataFrame, List[Dict[str, Any]]], bucket: str = "1h",
+               top_k: int = 10, z_threshold: Optional[float] = None) -> Dict[str, Any]:
+        """检测设备异常，返回各时间桶的前 top_k 台异常设备和整体统计"""
+        started = time.perf_counter()
+        threshold = z_threshold or self.z_threshold
+        data = self.normalize(records)
+
+        timestamps = pd.to_datetime(data["timestamp"], errors="coerce")
+        consumption = pd.to_numeric(data["consumption"], errors="coerce").to_numpy(dtype=np.float64)
+        device_labels = _labels(data["device_id"].to_numpy())
+        valid = timestamps.notna().to_numpy() & np.isfinite(consumption) & pd.notna(device_labels)
+        invalid_count = int((~valid).sum())
+        if invalid_count:
+            data, timestamps, consumption = data[valid], timestamps[valid], consumption[valid]
+            device_labels = device_labels[valid]
+        if len(data) == 0:
+            raise ValueError("没有有效的能源日志记录")
+
+        device_codes, device_ids = pd.factorize(device_labels)
+        device_types = _labels(data["device_type"].to_numpy()) if "device_type" in data else np.full(len(data), None)
+        type_codes, type_names = pd.factorize(np.where(pd.isna(device_types), "未知", device_types))
+        hours = timestamps.dt.hour.to_numpy()
+        n_devices, n_types = len(device_ids), len(type_names)
+        device_type_codes = np.zeros(n_devices, dtype=np.int64)
+        device_type_codes[device_codes] = type_codes
+
+        # 1. 设备基线与同类设备日内曲线
+        baseline = _group_median(device_codes, consumption, n_devices)
+        device_baseline = baseline[device_codes]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = np.where(device_baseline != 0, consumption / device_baseline, np.nan)
+        type_hour = type_codes * 24 + hours
+        profile = _group_median(type_hour, ratio, n_types * 24)
+        profile = np.where(np.isnan(profile), 1.0, profile)
+        expected = device_baseline * profile[type_hour]
+
+        # 2. 相对残差按设备 MAD 标准化（能耗噪声近似与用量成比例），数据不足时退回同类设备的 MAD
+        with np.errstate(divide="ignore", invalid="ignore"):
+            relative = consumption / np.maximum(np.abs(expected), 1e-9) - 1.0
+        relative = np.where(np.isfinite(relative), relative, 0.0)
+        device_mad = _group_median(device_codes, np.abs(relative), n_devices) * MAD_SCALE
+        type_mad = _group_median(type_codes, np.abs(relative), n_types) * MAD_SCALE
+        points = np.bincount(device_codes, minlength=n_devices)
+        use_device = (points >= self.min_device_points) & (device_mad > 0)
+        scale = np.where(use_device, device_mad, np.nan_to_num(type_mad[device_type_codes]))
+        z_scores = relative / np.maximum(scale, MIN_RELATIVE_SCALE)[device_codes]
+
+        # 3. 排放因子偏离
+        if "emission_factor" in data:
+            factor = pd.to_numeric(data["emission_factor"], errors="coerce").to_numpy(dtype=np.float64)
+            factor_baseline = _group_median(device_codes, factor, n_devices)[device_codes]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                factor_deviation = np.nan_to_num(np.abs(factor - factor_baseline) / np.abs(factor_baseline))
+        else:
+            factor = np.full(len(data), np.nan)
+            factor_deviation = np.zeros(len(data))
+
+        # 4. 融合：异常分数为超出阈值的倍数（≥1 即异常）
+        codes = ((z_scores > threshold) * 1 + (z_scores < -threshold) * 2 +
+                 (factor_deviation > FACTOR_TOLERANCE) * 4)
+        scores = np.maximum(np.abs(z_scores) / threshold, factor_deviation / FACTOR_TOLERANCE)
+        is_anomaly = codes > 0
+        severity = np.select([scores >= 3, scores >= 2, scores >= 1.5], [3, 2, 1], default=0)
+
+        # 5. 按时间桶取前 top_k：异常点按 (桶, -分数) 排序，桶内名次 < top_k
+        bucket_codes, bucket_starts = pd.factorize(timestamps.dt.floor(bucket).to_numpy(), sort=True)
+        n_buckets = len(bucket_starts)
+        flagged = np.flatnonzero(is_anomaly)
+        ranked = flagged[np.lexsort((-scores[flagged], bucket_codes[flagged]))]
+        ranked_buckets = bucket_codes[ranked]
+        group_starts = np.searchsorted(ranked_buckets, ranked_buckets, side="left")
+        top = ranked[np.arange(len(ranked)) - group_starts < top_k]
+
+        devices_per_bucket = np.bincount(bucket_codes, minlength=n_buckets)
+        anomalies_per_bucket = np.bincount(bucket_codes[flagged], minlength=n_buckets)
+        columns = {name: _labels(data[name].to_numpy()[top]) if name in data else np.full(len(top), None)
+                   for name in ("energy_type", "unit", "industry", "region")}
+        emission = consumption * factor
+        top_records = [
+            {
+                "device_id": device_ids[d],
+                "device_type": type_names[t],
+                "energy_type": energy_type,
+                "unit": unit,
+                "industry": industry,
+                "region": region,
+                "timestamp": ts,
+                "consumption": round(c, 3),
+                "expected": round(e, 3),
+                "z_score": round(z, 3),
+                "emission": None if np.isnan(em) else round(em, 3),
+                "anomaly_score": round(s, 3),
+                "severity": sev,
+                "reasons": list(FLEET_REASONS[code])
+            }
+            for d, t, energy_type, unit, industry, region, ts, c, e, z, em, s, sev, code in zip(
+                device_codes[top].tolist(), type_codes[top].tolist(),
+                columns["energy_type"], columns["unit"], columns["industry"], columns["region"],
+                timestamps.to_numpy()[top].astype("datetime64[s]").astype(str).tolist(),
+                consumption[top].tolist(), expected[top].tolist(), z_scores[top].tolist(), emission[top].tolist(),
+                scores[top].tolist(), SEVERITY_LABELS[severity[top]].tolist(), codes[top].tolist()
+            )
+        ]
+        top_per_bucket: List[List[Dict[str, Any]]] = [[] for _ in range(n_buckets)]
+        for bucket_code, record in zip(bucket_codes[top].tolist(), top_records):
+            top_per_bucket[bucket_code].append(record)
+
+        # 6. 异常次数最多的设备
+        device_anomalies = np.bincount(device_codes[flagged], minlength=n_devices)
+        device_max_score = np.zeros(n_devices)
+        np.maximum.at(device_max_score, device_codes[flagged], scores[flagged])
+        worst = np.lexsort((-device_max_score, -device_anomalies))[:top_k]
+        worst = worst[device_anomalies[worst] > 0]
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        logger.info(f"设备级异常检测完成: {n_devices} 台设备, {len(data)} 条记录, {len(flagged)} 个异常, 耗时 {elapsed_ms:.0f}ms")
+        return {
+            "summary": {
+                "records": int(len(data)),
+                "devices": int(n_devices),
+                "buckets": int(n_buckets),
+                "anomalies": int(len(flagged)),
+                "anomaly_rate": round(len(flagged) / len(data) * 100, 3),
+                "severity_distribution": {label: int(count) for label, count in
+                                          zip(SEVERITY_LABELS.tolist(), np.bincount(severity[flagged], minlength=4)) if count},
+                "invalid_records": invalid_count,
+                "z_threshold": threshold,
+                "elapsed_ms": round(elapsed_ms, 1)
+            },
+            "buckets": [
+                {
+                    "bucket": pd.Timestamp(start).isoformat(),
+                    "devices": int(devices),
+                    "anomalies": int(anomalies),
+                    "top": records
+                }
+                for start, devices, anomalies, records in zip(
+                    bucket_starts, devices_per_bucket.tolist(), anomalies_per_bucket.tolist(), top_per_bucket
+                )
+            ],
+            "top_devices": [
+                {
+                    "device_id": device_ids[d],
+                    "device_type": type_names[device_type_codes[d]],
+                    "baseline": round(float(baseline[d]), 3),
+                    "anomalies": int(device_anomalies[d]),
+                    "max_score": round(float(device_max_score[d]), 3)
+                }
+                for d in worst.tolist()
+            ]
+        }
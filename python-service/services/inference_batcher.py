@@ -0,0 +1,90 @@
+import asyncio
+from concurrent.futures import Executor
+from typing import Any, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+import torch
+from loguru import logger
+
+
+class InferenceBatcher:
+    """推理微批调度器
+
+    在 max_wait_ms 时间窗口内（或达到 max_batch_size 时）收集同一分组的推理请求，
+    沿第0维拼接输入张量后执行一次前向计算，再按各请求的batch大小拆分结果返回。
+    每个请求提交的张量第0维为该请求自身的batch大小（通常为1）。
+    """
+
+    def __init__(self, runner: Callable[..., torch.Tensor],
+                 max_batch_size: int = 32,
+                 max_wait_ms: float = 5.0,
+                 executor: Optional[Executor] = None):
+        self.runner = runner
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.executor = executor
+
+        self._pending: Dict[Hashable, List[Tuple[Tuple[torch.Tensor, ...], asyncio.Future]]] = {}
+        self._timers: Dict[Hashable, asyncio.TimerHandle] = {}
+        # 事件循环只弱引用任务，需持有运行中的批次直到完成，否则可能被回收导致等待者挂起
+        self._tasks: Set[asyncio.Task] = set()
+
+        self.total_batches = 0
+        self.total_requests = 0
+
+    async def submit(self, group_key: Hashable, *inputs: torch.Tensor) -> torch.Tensor:
+        """提交一次推理请求，等待所在批次完成后返回本请求对应的输出"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        pending = self._pending.setdefault(group_key, [])
+        pending.append((inputs, future))
+
+        if len(pending) >= self.max_batch_size:
+            self._flush(group_key)
+        elif len(pending) == 1:
+            self._timers[group_key] = loop.call_later(self.max_wait, self._flush, group_key)
+
+        return await future
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取批处理统计"""
+        return {
+            "batches": self.total_batches,
+            "requests": self.total_requests,
+            "avg_batch_size": round(self.total_requests / self.total_batches, 2) if self.total_batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0
+        }
+
+    def _flush(self, group_key: Hashable):
+        timer = self._timers.pop(group_key, None)
+        if timer is not None:
+            timer.cancel()
+
+        items = self._pending.pop(group_key, [])
+        if items:
+            task = asyncio.ensure_future(self._run_batch(group_key, items))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, group_key: Hashable,
+                         items: List[Tuple[Tuple[torch.Tensor, ...], asyncio.Future]]):
+        try:
+            sizes = [inputs[0].shape[0] for inputs, _ in items]
+            batched = [torch.cat(tensors, dim=0) for tensors in zip(*(inputs for inputs, _ in items))]
+
+            loop = asyncio.get_running_loop()
+            output = await loop.run_in_executor(self.executor, self.runner, group_key, *batched)
+
+            self.total_batches += 1
+            self.total_requests += len(items)
+
+            for (_, future), result in zip(items, torch.split(output, sizes, dim=0)):
+                if not future.done():
+                    future.set_result(result)
+
+        except Exception as e:
+            logger.error(f"批量推理失败: {group_key}, 错误: {e}")
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
@@ -0,0 +1,85 @@
+import gzip
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import brotli
+except ImportError:  # brotli 为可选依赖，未安装时只提供 gzip
+    brotli = None
+
+# 小于该字节数的负载不压缩（压缩头开销大于收益）
+MIN_COMPRESS_BYTES = 512
+
+
+def _quantize(coordinates: Any, precision: int) -> List:
+    """坐标量化：保留 precision 位小数（4 位约 11 米）"""
+    return np.round(np.asarray(coordinates, dtype=np.float64), precision).tolist()
+
+
+def _points(locations: List[List[float]], precision: int) -> List[List[float]]:
+    """[纬度, 经度] 列表转为 GeoJSON 的 [经度, 纬度]"""
+    if not locations:
+        return []
+    return _quantize(np.asarray(locations, dtype=np.float64)[:, ::-1], precision)
+
+
+def build_layers(spec: Dict[str, Any], boundary: Optional[Dict[str, Any]], precision: int = 4) -> Dict[str, Any]:
+    """由地图 spec 生成碳汇/碳源标记、地区边界和净平衡指示的 GeoJSON FeatureCollection
+
+    各标记共用的数值（平均值、最后一天的分量）放在集合级 properties 中，不在每个要素上重复。
+    """
+    features = []
+    if boundary:
+        features.append({
+            "type": "Feature",
+            "geometry": {
+                "type": boundary["geometry"]["type"],
+                "coordinates": _quantize(boundary["geometry"]["coordinates"], precision)
+            },
+            "properties": {"layer": "boundary", "name": boundary.get("properties", {}).get("name", spec["region"])}
+        })
+    for layer in ("sink", "source"):
+        for i, point in enumerate(_points(spec[f"{layer}_locations"], precision)):
+            features.append({
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": point},
+                "properties": {"layer": layer, "index": i + 1}
+            })
+
+    balance = spec["latest_balance"]
+    if balance:
+        center = spec["center"]
+        features.append({
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": _quantize([center[1] + 0.5, center[0] + 0.5], precision)},
+            "properties": {"layer": "balance", "status": "sink" if balance["net_balance"] > 0 else "source", **balance}
+        })
+
+    return {
+        "type": "FeatureCollection",
+        "features": features,
+        "properties": {
+            "region": spec["region"],
+            "center": spec["center"],
+            "zoom_level": 6,
+            "avg_sink": spec["avg_sink"],
+            "avg_source": spec["avg_source"],
+            "latest_sink": spec["latest_sink"],
+            "latest_source": spec["latest_source"]
+        }
+    }
+
+
+def encode_geojson(payload: Dict[str, Any], accept_encoding: str = "") -> Tuple[bytes, Optional[str]]:
+    """紧凑序列化并按 Accept-Encoding 压缩（优先 br，其次 gzip），返回 (内容, Content-Encoding)"""
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if len(body) < MIN_COMPRESS_BYTES:
+        return body, None
+    accepted = {item.split(";")[0].strip().lower() for item in accept_encoding.split(",")}
+    if brotli is not None and "br" in accepted:
+        return brotli.compress(body, quality=5), "br"
+    if "gzip" in accepted:
+        return gzip.compress(body, compresslevel=6), "gzip"
+    return body, None
@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Optional
+
+from loguru import logger
+
+import sys
+# 添加父目录到Python路径，确保可以导入services
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.artifact_store import ArtifactStore
+
+
+class MapRenderer:
+    """地图的后台渲染与内容寻址缓存
+
+    文件名由名称前缀和渲染输入（spec）的哈希组成：输入相同则文件名相同，
+    文件已存在或正在渲染时直接返回，同一张地图不会渲染两次。
+    渲染在后台线程中执行并原子写入（先写临时文件再替换），调用方立即拿到地图URL和状态。
+    指定 store 时渲染好的地图登记到产物索引，由其按保留策略回收；被回收的地图下次请求时重新渲染。
+    """
+
+    def __init__(self, output_dir: str, url_prefix: str = "/maps", workers: int = 1,
+                 store: Optional[ArtifactStore] = None, kind: str = "map"):
+        self.output_dir = output_dir
+        self.url_prefix = url_prefix.rstrip("/")
+        self.store = store
+        self.kind = kind
+        os.makedirs(output_dir, exist_ok=True)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="map-render")
+        self._jobs: Dict[str, Future] = {}
+        self._failed: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.rendered = 0
+        self.cache_hits = 0
+
+    @staticmethod
+    def cache_key(spec: Dict[str, Any]) -> str:
+        payload = json.dumps(spec, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+    def path_for(self, filename: str) -> str:
+        return os.path.join(self.output_dir, os.path.basename(filename))
+
+    def submit(self, name: str, spec: Dict[str, Any], render_fn: Callable[[Dict[str, Any], str], None],
+               region: Optional[str] = None) -> Dict[str, Any]:
+        """提交渲染任务，返回 {map_path, map_filename, absolute_path, cache_key, status}"""
+        key = self.cache_key(spec)
+        filename = f"{name}_{key}.html"
+        path = self.path_for(filename)
+
+        register = False
+        future = None
+        with self._lock:
+            if os.path.exists(path):
+                self.cache_hits += 1
+                status = "ready"
+                register = self.store is not None
+            elif filename in self._jobs:
+                self.cache_hits += 1
+                status = "pending"
+            else:
+                self._failed.pop(filename, None)
+                future = self._pool.submit(self._render, render_fn, spec, path)
+                self._jobs[filename] = future
+                status = "pending"
+
+        # 在锁外挂回调：渲染已完成时回调会在当前线程立即执行，而 _finish 需要获取同一把锁
+        if future is not None:
+            future.add_done_callback(
+                lambda f, filename=filename, key=key, region=region: self._finish(filename, f, key, region))
+
+        # 登记（SQLite写入）不占用渲染锁；检查之后文件刚好被回收时重新提交渲染
+        if register:
+            try:
+                self.store.register(self.kind, key, path, region)
+            except FileNotFoundError:
+                return self.submit(name, spec, render_fn, region)
+
+        return {
+            "map_path": f"{self.url_prefix}/{filename}",
+            "map_filename": filename,
+            "absolute_path": path,
+            "cache_key": key,
+            "status": status
+        }
+
+    @staticmethod
+    def _render(render_fn: Callable[[Dict[str, Any], str], None], spec: Dict[str, Any], path: str):
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            render_fn(spec, tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _finish(self, filename: str, future: Future, key: str, region: Optional[str]):
+        error = future.exception() if not future.cancelled() else RuntimeError("渲染已取消")
+        if error is None and self.store is not None:
+            try:
+                self.store.register(self.kind, key, self.path_for(filename), region)
+            except Exception as e:
+                logger.error(f"地图登记失败: {filename}: {e}")
+        with self._lock:
+            self._jobs.pop(filename, None)
+            if error is None:
+                self.rendered += 1
+            else:
+                self._failed[filename] = str(error)
+        if error is None:
+            logger.info(f"地图已渲染: {filename}")
+        else:
+            logger.error(f"地图渲染失败: {filename}: {error}")
+
+    def status(self, filename: str) -> Dict[str, Any]:
+        """查询地图状态：ready / pending / failed / missing"""
+        filename = os.path.basename(filename)
+        path = self.path_for(filename)
+        with self._lock:
+            future = self._jobs.get(filename)
+            error = self._failed.get(filename)
+        if future is not None:
+            if not future.done():
+                return {"map_filename": filename, "status": "pending"}
+            # 渲染已结束但完成回调还未执行（wait 返回时可能处于这一刻）
+            if future.cancelled() or future.exception() is not None:
+                error = "渲染已取消" if future.cancelled() else str(future.exception())
+        if error is not None:
+            return {"map_filename": filename, "status": "failed", "error": error}
+        if os.path.exists(path):
+            return {"map_filename": filename, "status": "ready", "file_size": os.path.getsize(path)}
+        return {"map_filename": filename, "status": "missing"}
+
+    def wait(self, filename: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """等待正在渲染的地图完成（超时后返回当前状态）"""
+        filename = os.path.basename(filename)
+        with self._lock:
+            future = self._jobs.get(filename)
+        if future is not None:
+            try:
+                future.result(timeout=timeout)
+            except FutureTimeoutError:
+                pass
+            except Exception:
+                pass
+        return self.status(filename)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "output_dir": self.output_dir,
+                "pending": len(self._jobs),
+                "failed": len(self._failed),
+                "rendered": self.rendered,
+                "cache_hits": self.cache_hits
+            }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
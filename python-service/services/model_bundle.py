@@ -0,0 +1,182 @@
+import glob
+import json
+import mmap
+import os
+import struct
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import joblib
+import numpy as np
+import torch
+from loguru import logger
+from sklearn.preprocessing import StandardScaler
+
+# 文件格式: MAGIC | 头部长度(uint64) | JSON索引 | 对齐后的原始张量数据
+MAGIC = b"CBNDL001"
+ALIGNMENT = 64
+SCALER_FIELDS = ("mean_", "scale_", "var_")
+
+
+def _tensor_dtype(name: str) -> torch.dtype:
+    return getattr(torch, name)
+
+
+def export_bundle(model_dir: str = "models", bundle_path: Optional[str] = None) -> Dict[str, Any]:
+    """将模型目录下的全部检查点和标准化器打包为一个带索引的文件
+
+    包含 lstm_*.pth / autoencoder_*.pth 的 state_dict（及检查点元数据），
+    以及 scaler_*.pkl / anomaly_scaler_*.pkl 中 StandardScaler 的参数。
+    """
+    bundle_path = bundle_path or os.path.join(model_dir, "model_bundle.bin")
+    index: Dict[str, Any] = {"created_at": datetime.now().isoformat(), "models": {}, "scalers": {}}
+    chunks: List[bytes] = []
+    offset = 0
+
+    def add_array(array: np.ndarray) -> Dict[str, Any]:
+        nonlocal offset
+        data = np.ascontiguousarray(array).tobytes()
+        padding = (-offset) % ALIGNMENT
+        chunks.append(b"\0" * padding)
+        offset += padding
+        entry = {"offset": offset, "nbytes": len(data), "shape": list(array.shape)}
+        chunks.append(data)
+        offset += len(data)
+        return entry
+
+    for path in sorted(glob.glob(os.path.join(model_dir, "lstm_*.pth")) + glob.glob(os.path.join(model_dir, "autoencoder_*.pth"))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        checkpoint = torch.load(path, map_location="cpu")
+        if isinstance(checkpoint, torch.nn.Module):
+            checkpoint = {"state_dict": checkpoint.state_dict()}
+        state_dict = checkpoint.get("state_dict", checkpoint)
+
+        tensors = {}
+        for key, tensor in state_dict.items():
+            tensor = tensor.detach().cpu().contiguous()
+            entry = add_array(tensor.numpy())
+            entry["dtype"] = str(tensor.dtype).replace("torch.", "")
+            tensors[key] = entry
+        index["models"][name] = {
+            "tensors": tensors,
+            **{k: checkpoint[k] for k in ("config", "metrics", "version", "trained_at") if k in checkpoint}
+        }
+
+    for path in sorted(glob.glob(os.path.join(model_dir, "scaler_*.pkl")) + glob.glob(os.path.join(model_dir, "anomaly_scaler_*.pkl"))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        scaler = joblib.load(path)
+        # 共享多任务模型的标准化器是 {组合键: StandardScaler} 字典
+        scalers = scaler if isinstance(scaler, dict) else {None: scaler}
+        entries = {}
+        for key, item in scalers.items():
+            if not hasattr(item, "mean_"):
+                continue
+            fields = {f: add_array(np.asarray(getattr(item, f), dtype=np.float64)) for f in SCALER_FIELDS}
+            fields["n_samples_seen_"] = int(np.max(item.n_samples_seen_))
+            entries["" if key is None else key] = fields
+        if entries:
+            index["scalers"][name] = {"is_dict": isinstance(scaler, dict), "entries": entries}
+
+    header = json.dumps(index, ensure_ascii=False, default=str).encode("utf-8")
+    data_start = len(MAGIC) + 8 + len(header)
+    header_padding = (-data_start) % ALIGNMENT
+
+    # 先写临时文件再原子替换，已映射旧文件的进程不受影响
+    tmp_path = f"{bundle_path}.tmp-{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header) + header_padding))
+        f.write(header)
+        f.write(b" " * header_padding)
+        for chunk in chunks:
+            f.write(chunk)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, bundle_path)
+
+    summary = {
+        "bundle_path": bundle_path,
+        "models": len(index["models"]),
+        "scalers": len(index["scalers"]),
+        "bytes": os.path.getsize(bundle_path)
+    }
+    logger.info(f"模型包导出完成: {summary}")
+    return summary
+
+
+class ModelBundle:
+    """内存映射的模型包
+
+    打开时只解析JSON索引；张量和标准化参数按需直接构建在映射内存上，不拷贝数据。
+    映射为写时复制（MAP_PRIVATE），未修改的页面在各工作进程之间共享。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.version = os.stat(path).st_mtime_ns
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_COPY)
+
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"无效的模型包文件: {path}")
+        header_length = struct.unpack("<Q", self._mmap[len(MAGIC):len(MAGIC) + 8])[0]
+        self._data_start = len(MAGIC) + 8 + header_length
+        self.index = json.loads(bytes(self._mmap[len(MAGIC) + 8:self._data_start]).decode("utf-8").rstrip())
+
+    def has_model(self, name: str) -> bool:
+        return name in self.index["models"]
+
+    def has_scaler(self, name: str) -> bool:
+        return name in self.index["scalers"]
+
+    def model_metadata(self, name: str) -> Dict[str, Any]:
+        return {k: v for k, v in self.index["models"][name].items() if k != "tensors"}
+
+    def state_dict(self, name: str) -> Dict[str, torch.Tensor]:
+        """构建零拷贝的 state_dict，配合 load_state_dict(..., assign=True) 使用"""
+        tensors = {}
+        for key, entry in self.index["models"][name]["tensors"].items():
+            dtype = _tensor_dtype(entry["dtype"])
+            count = int(np.prod(entry["shape"])) if entry["shape"] else 1
+            tensor = torch.frombuffer(self._mmap, dtype=dtype, count=count,
+                                      offset=self._data_start + entry["offset"])
+            tensors[key] = tensor.reshape(entry["shape"])
+        return tensors
+
+    def scaler(self, name: str):
+        """重建 StandardScaler（多任务模型返回 {组合键: StandardScaler}）"""
+        spec = self.index["scalers"][name]
+        scalers = {}
+        for key, fields in spec["entries"].items():
+            scaler = StandardScaler()
+            for field in SCALER_FIELDS:
+                entry = fields[field]
+                setattr(scaler, field, np.frombuffer(self._mmap, dtype=np.float64,
+                                                     count=int(np.prod(entry["shape"])),
+                                                     offset=self._data_start + entry["offset"]))
+            scaler.n_samples_seen_ = fields["n_samples_seen_"]
+            scaler.n_features_in_ = len(scaler.mean_)
+            scalers[key] = scaler
+        return scalers if spec["is_dict"] else scalers[""]
+
+    def close(self):
+        # 仍被张量引用时无法立即关闭映射，交给垃圾回收
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass
+        self._file.close()
+
+
+def open_bundle(path: Optional[str]) -> Optional[ModelBundle]:
+    """打开模型包，文件不存在或无效时返回None"""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        bundle = ModelBundle(path)
+        logger.info(f"已映射模型包: {path} ({len(bundle.index['models'])} 个模型)")
+        return bundle
+    except Exception as e:
+        logger.error(f"模型包加载失败: {path}, 错误: {e}")
+        return None
@@ -0,0 +1,241 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from loguru import logger
+
+
+class ModelRegistry:
+    """模型注册表
+
+    按需加载模型（首次访问时调用 loader），常驻内存的模型以LRU方式维护，
+    超出数量或内存预算时淘汰最久未使用的模型，并统计命中/未命中次数。
+    提供 version_fn 时（如检查点文件的修改时间），会定期检查已加载模型的版本，
+    版本变化后在后台线程加载新模型并预热（warmup），完成后原子替换引用并通知
+    监听者（例如使结果缓存失效）。替换前旧模型继续提供服务，已取得旧引用的请求
+    不受影响。
+    """
+
+    def __init__(self, loader: Callable[[str], Any],
+                 max_models: Optional[int] = 16,
+                 max_bytes: Optional[int] = None,
+                 sizer: Optional[Callable[[Any], int]] = None,
+                 version_fn: Optional[Callable[[str], Any]] = None,
+                 version_check_interval: float = 1.0,
+                 warmup: Optional[Callable[[str, Any], None]] = None):
+        self.loader = loader
+        self.max_models = max_models
+        self.max_bytes = max_bytes
+        self.sizer = sizer or (lambda value: 0)
+        self.version_fn = version_fn
+        self.version_check_interval = version_check_interval
+        self.warmup = warmup
+
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._total_bytes = 0
+        self._lock = threading.RLock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self._versions: Dict[str, Any] = {}
+        self._loaded_versions: Dict[str, Any] = {}
+        self._version_checked: Dict[str, float] = {}
+        self._reloading: Set[str] = set()
+        self._listeners: List[Callable[[str], None]] = []
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.reloads = 0
+        self.reload_failures = 0
+
+    def add_listener(self, callback: Callable[[str], None]):
+        """注册模型版本变化的回调，参数为模型键"""
+        self._listeners.append(callback)
+
+    def current_version(self, key: str) -> Any:
+        """获取正在提供服务的模型版本；发现新版本时在后台热加载"""
+        if self.version_fn is None:
+            return None
+
+        now = time.monotonic()
+        with self._lock:
+            if key in self._versions and now - self._version_checked.get(key, 0.0) < self.version_check_interval:
+                return self._served_version(key)
+
+        version = self.version_fn(key)
+        with self._lock:
+            self._version_checked[key] = now
+            self._versions[key] = version
+            stale = key in self._entries and self._loaded_versions.get(key) != version
+
+        if stale:
+            self._schedule_reload(key)
+        with self._lock:
+            return self._served_version(key)
+
+    def get(self, key: str) -> Any:
+        """获取模型，未加载时同步加载"""
+        self.current_version(key)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # 同一个key只加载一次，不同key之间并行加载
+        with key_lock:
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return self._entries[key]
+                self.misses += 1
+
+            try:
+                version = self.version_fn(key) if self.version_fn else None
+                value = self.loader(key)
+                size = int(self.sizer(value))
+            except Exception:
+                # 加载失败时同样移除key锁，否则每个加载失败的key都会留下一个锁
+                with self._lock:
+                    self._key_locks.pop(key, None)
+                raise
+
+            with self._lock:
+                self._entries[key] = value
+                self._sizes[key] = size
+                self._loaded_versions[key] = version
+                self._total_bytes += size
+                self._evict_if_needed()
+                self._key_locks.pop(key, None)
+            return value
+
+    def reload(self, key: str) -> bool:
+        """加载并预热新版本模型，然后原子替换；失败时保留旧模型"""
+        version = self.version_fn(key) if self.version_fn else None
+        try:
+            value = self.loader(key)
+            if self.warmup is not None:
+                self.warmup(key, value)
+        except Exception as e:
+            with self._lock:
+                self.reload_failures += 1
+                self._reloading.discard(key)
+            logger.error(f"模型热加载失败，继续使用旧版本: {key}, 错误: {e}")
+            return False
+
+        size = int(self.sizer(value))
+        with self._lock:
+            if key in self._entries:
+                self._total_bytes -= self._sizes.get(key, 0)
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            self._sizes[key] = size
+            self._total_bytes += size
+            self._loaded_versions[key] = version
+            self._versions[key] = version
+            self._version_checked[key] = time.monotonic()
+            self.reloads += 1
+            self._evict_if_needed()
+            self._reloading.discard(key)
+
+        logger.info(f"模型已热替换: {key}, 版本: {version}")
+        for callback in self._listeners:
+            callback(key)
+        return True
+
+    def refresh(self, keys: Optional[List[str]] = None, force: bool = False) -> Dict[str, str]:
+        """同步检查并热加载模型（默认检查全部已加载模型），返回每个键的处理结果"""
+        results = {}
+        for key in (keys if keys is not None else self.keys()):
+            version = self.version_fn(key) if self.version_fn else None
+            with self._lock:
+                loaded = key in self._entries
+                changed = loaded and self._loaded_versions.get(key) != version
+                if key in self._reloading:
+                    results[key] = "reloading"
+                    continue
+                if not (force or changed):
+                    results[key] = "unchanged" if loaded else "not_loaded"
+                    continue
+                self._reloading.add(key)
+            results[key] = "reloaded" if self.reload(key) else "failed"
+        return results
+
+    def evict(self, key: str) -> bool:
+        """主动淘汰指定模型"""
+        with self._lock:
+            if key not in self._entries:
+                return False
+            self._remove(key)
+            return True
+
+    def clear(self):
+        """清空所有已加载模型"""
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._versions.clear()
+            self._loaded_versions.clear()
+            self._version_checked.clear()
+            self._total_bytes = 0
+
+    def keys(self):
+        with self._lock:
+            return list(self._entries.keys())
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "loaded_models": len(self._entries),
+                "max_models": self.max_models,
+                "memory_bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "reloads": self.reloads,
+                "reload_failures": self.reload_failures,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+    def _served_version(self, key: str) -> Any:
+        if key in self._entries:
+            return self._loaded_versions.get(key)
+        return self._versions.get(key)
+
+    def _schedule_reload(self, key: str):
+        with self._lock:
+            if key in self._reloading:
+                return
+            self._reloading.add(key)
+        logger.info(f"检测到模型更新，后台热加载: {key}")
+        threading.Thread(target=self.reload, args=(key,), daemon=True, name=f"model-reload-{key}").start()
+
+    def _remove(self, key: str):
+        self._entries.pop(key)
+        self._total_bytes -= self._sizes.pop(key, 0)
+        self._loaded_versions.pop(key, None)
+
+    def _evict_if_needed(self):
+        # 至少保留最近加载的一个模型，避免预算过小时反复加载
+        while len(self._entries) > 1 and (
+            (self.max_models is not None and len(self._entries) > self.max_models) or
+            (self.max_bytes is not None and self._total_bytes > self.max_bytes)
+        ):
+            key, _ = next(iter(self._entries.items()))
+            self._remove(key)
+            self.evictions += 1
+            logger.info(f"模型已从缓存淘汰: {key}")
@@ -0,0 +1,431 @@
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import joblib
+import numpy as np
+import pandas as pd
+import torch
+import torch.nn as nn
+from loguru import logger
+from sklearn.preprocessing import StandardScaler
+
+import sys
+# 添加父目录到Python路径，确保可以导入models
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from models.schemas import IndustryType, ResourceType
+from services.ai_predictor import (
+    FEATURE_COLUMNS, HEAD_DROPOUT, INDUSTRY_INDEX, MAX_HORIZON, MULTITASK_KEY, RESOURCE_INDEX, SEQUENCE_LENGTH,
+    LSTMPredictor, MultiTaskLSTMPredictor, generate_baseline_history
+)
+
+# emissions_template.csv 列名与模型特征的对应关系
+CSV_COLUMN_MAP = {
+    "日期": "date",
+    "行业": "industry",
+    "资源类型": "resource_type",
+    "排放量(吨)": "emission",
+    "能源消耗(千瓦时)": "energy_consumption",
+    "GDP(万元)": "gdp",
+    "人口(人)": "population",
+    "温度(摄氏度)": "temperature",
+    "湿度(%)": "humidity",
+    "政策因子": "policy_factor",
+    "技术因子": "technology_factor",
+}
+
+INDUSTRY_NAMES = {
+    "制造业": IndustryType.MANUFACTURING,
+    "能源": IndustryType.ENERGY,
+    "交通": IndustryType.TRANSPORTATION,
+    "交通运输": IndustryType.TRANSPORTATION,
+    "农业": IndustryType.AGRICULTURE,
+    "建筑": IndustryType.CONSTRUCTION,
+    "建筑业": IndustryType.CONSTRUCTION,
+    "服务业": IndustryType.SERVICES,
+    "采矿": IndustryType.MINING,
+    "采矿业": IndustryType.MINING,
+    "化工": IndustryType.CHEMICAL,
+}
+
+RESOURCE_NAMES = {
+    "煤炭": ResourceType.COAL,
+    "石油": ResourceType.OIL,
+    "天然气": ResourceType.GAS,
+    "电力": ResourceType.ELECTRICITY,
+    "可再生能源": ResourceType.RENEWABLE,
+    "核能": ResourceType.NUCLEAR,
+}
+
+# 月度聚合时按总量求和的列，其余列取均值
+SUM_COLUMNS = ["emission", "energy_consumption"]
+
+
+def _parse_enum(value, enum_cls, names: Dict[str, Any]):
+    """解析中文名称或英文枚举值，无法识别时返回None"""
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    value = str(value).strip()
+    if value in names:
+        return names[value]
+    try:
+        return enum_cls(value.lower())
+    except ValueError:
+        return None
+
+
+def load_csv_records(path: str) -> pd.DataFrame:
+    """读取 emissions_template.csv 格式的历史排放数据"""
+    df = pd.read_csv(path).rename(columns=CSV_COLUMN_MAP)
+    df["date"] = pd.to_datetime(df["date"], errors="coerce")
+    df["industry"] = [_parse_enum(v, IndustryType, INDUSTRY_NAMES) for v in df["industry"]]
+    df["resource_type"] = [_parse_enum(v, ResourceType, RESOURCE_NAMES) for v in df["resource_type"]]
+    return df.dropna(subset=["date", "industry", "resource_type", "emission"])
+
+
+def load_json_records(path: str) -> pd.DataFrame:
+    """读取数据采集器保存的JSON数据，只保留能确定行业和资源类型的记录"""
+    with open(path, "r", encoding="utf-8") as f:
+        payload = json.load(f)
+
+    metadata = payload.get("metadata", {})
+    rows = []
+    for record in payload.get("data", []):
+        industry = _parse_enum(record.get("industry", metadata.get("industry")), IndustryType, INDUSTRY_NAMES)
+        resource = _parse_enum(record.get("resource_type", metadata.get("resource_type")), ResourceType, RESOURCE_NAMES)
+        if industry is None or resource is None:
+            continue
+
+        if "emission" in record:
+            emission = record["emission"]
+        elif "value" in record:
+            emission = record["value"]
+        elif "energy_consumption" in record and "emission_factor" in record:
+            emission = record["energy_consumption"] * record["emission_factor"]
+        else:
+            continue
+
+        row = {"date": record.get("timestamp"), "industry": industry, "resource_type": resource, "emission": emission}
+        row.update({k: record[k] for k in FEATURE_COLUMNS[1:8] if k in record})
+        rows.append(row)
+
+    df = pd.DataFrame(rows, columns=["date", "industry", "resource_type"] + FEATURE_COLUMNS[:8])
+    df["date"] = pd.to_datetime(df["date"], errors="coerce")
+    return df.dropna(subset=["date", "emission"])
+
+
+def load_history(csv_paths: List[str], json_dir: Optional[str]) -> pd.DataFrame:
+    """汇总所有历史数据源"""
+    frames = [load_csv_records(p) for p in csv_paths if os.path.exists(p)]
+    if json_dir and os.path.isdir(json_dir):
+        frames.extend(load_json_records(p) for p in sorted(glob.glob(os.path.join(json_dir, "collected_data_*.json"))))
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return pd.DataFrame(columns=["date", "industry", "resource_type"] + FEATURE_COLUMNS[:8])
+    return pd.concat(frames, ignore_index=True)
+
+
+def build_monthly_series(records: pd.DataFrame, industry: IndustryType, resource: ResourceType,
+                         min_periods: int) -> Tuple[pd.DataFrame, int]:
+    """构造某个组合的连续月度特征序列
+
+    真实数据缺失的特征和月份用基线历史补齐；真实历史不足 min_periods 个月时，
+    在前面拼接基线历史，保证每个组合都能训练。返回序列及其中真实月份数。
+    """
+    subset = records[(records["industry"] == industry) & (records["resource_type"] == resource)]
+
+    if subset.empty:
+        return generate_baseline_history(industry, resource, min_periods), 0
+
+    month = subset["date"].dt.to_period("M").dt.to_timestamp()
+    value_columns = [c for c in FEATURE_COLUMNS[:8] if c in subset.columns]
+    aggregations = {c: ("sum" if c in SUM_COLUMNS else "mean") for c in value_columns}
+    monthly = subset[value_columns].groupby(month).agg(aggregations)
+
+    end = monthly.index.max()
+    periods = max(min_periods, (end.year - monthly.index.min().year) * 12 + end.month - monthly.index.min().month + 1)
+    series = generate_baseline_history(industry, resource, periods, end_date=end).set_index("date")
+    series.update(monthly)
+    return series.reset_index(), len(monthly)
+
+
+def make_windows(features: np.ndarray, targets: np.ndarray,
+                 seq_len: int = SEQUENCE_LENGTH, horizon: int = MAX_HORIZON):
+    """切分滑动窗口；超出序列末端的预测步用掩码标记，不参与损失"""
+    n = len(features) - seq_len
+    if n <= 0:
+        raise ValueError("序列长度不足以构造训练窗口")
+
+    idx = np.arange(n)[:, None]
+    X = features[idx + np.arange(seq_len)[None, :]]
+
+    target_idx = seq_len + idx + np.arange(horizon)[None, :]
+    mask = target_idx < len(targets)
+    y = np.where(mask, targets[np.minimum(target_idx, len(targets) - 1)], 0.0)
+    return X.astype(np.float32), y.astype(np.float32), mask
+
+
+def atomic_save(save_fn, path: str):
+    """先写临时文件再原子替换，避免服务读到写了一半的文件"""
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    try:
+        save_fn(tmp_path)
+        with open(tmp_path, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _masked_mse(pred: torch.Tensor, target: torch.Tensor, mask: torch.Tensor) -> torch.Tensor:
+    return ((pred - target) ** 2 * mask).sum() / mask.sum().clamp(min=1)
+
+
+def _regression_metrics(actual: np.ndarray, predicted: np.ndarray) -> Dict[str, float]:
+    residual = actual - predicted
+    ss_tot = float(((actual - actual.mean()) ** 2).sum())
+    return {
+        "mae": round(float(np.abs(residual).mean()), 2),
+        "rmse": round(float(np.sqrt((residual ** 2).mean())), 2),
+        "r2": round(1 - float((residual ** 2).sum()) / ss_tot, 3) if ss_tot > 0 else 0.0
+    }
+
+
+def train_single_model(model_key: str, series: np.ndarray, model_dir: str,
+                       epochs: int = 30, batch_size: int = 64, learning_rate: float = 1e-3,
+                       val_ratio: float = 0.2, num_threads: int = 1, seed: int = 42) -> Dict[str, Any]:
+    """训练单个组合的LSTM模型并保存检查点和标准化器（在工作进程中运行）"""
+    start_time = time.time()
+    torch.set_num_threads(num_threads)
+    torch.manual_seed(seed)
+
+    scaler = StandardScaler().fit(series)
+    scaled = scaler.transform(series).astype(np.float32)
+    X, y, mask = make_windows(scaled, scaled[:, 0])
+
+    n_val = int(len(X) * val_ratio) if len(X) >= 5 else 0
+    X_t, y_t, m_t = torch.from_numpy(X), torch.from_numpy(y), torch.from_numpy(mask.astype(np.float32))
+    train = slice(0, len(X) - n_val)
+    val = slice(len(X) - n_val, len(X))
+
+    model = LSTMPredictor(input_size=len(FEATURE_COLUMNS), hidden_size=64, num_layers=2, output_size=MAX_HORIZON)
+    optimizer = torch.optim.Adam(model.parameters(), lr=learning_rate)
+
+    n_train = len(X) - n_val
+    model.train()
+    for _ in range(epochs):
+        order = torch.randperm(n_train)
+        for i in range(0, n_train, batch_size):
+            batch = order[i:i + batch_size]
+            optimizer.zero_grad()
+            loss = _masked_mse(model(X_t[train][batch]), y_t[train][batch], m_t[train][batch])
+            loss.backward()
+            nn.utils.clip_grad_norm_(model.parameters(), 1.0)
+            optimizer.step()
+
+    # 在验证窗口（没有验证集时用训练窗口）上按原始单位计算指标
+    model.eval()
+    eval_slice = val if n_val > 0 else train
+    with torch.no_grad():
+        pred = model(X_t[eval_slice]).numpy()
+    unscale = lambda v: v * scaler.scale_[0] + scaler.mean_[0]
+    metrics = _regression_metrics(unscale(y[eval_slice])[mask[eval_slice]], unscale(pred)[mask[eval_slice]])
+
+    version = datetime.now().strftime("%Y%m%d%H%M%S")
+    checkpoint = {
+        "state_dict": model.state_dict(),
+        "config": {
+            "input_size": len(FEATURE_COLUMNS),
+            "hidden_size": 64,
+            "num_layers": 2,
+            "output_size": MAX_HORIZON,
+            "dropout": HEAD_DROPOUT
+        },
+        "metrics": metrics,
+        "version": version,
+        "trained_at": datetime.now().isoformat(),
+        "windows": int(len(X))
+    }
+
+    # 先写标准化器再写模型：服务以模型文件为准判断检查点是否更新
+    atomic_save(lambda p: joblib.dump(scaler, p), os.path.join(model_dir, f"scaler_{model_key}.pkl"))
+    atomic_save(lambda p: torch.save(checkpoint, p), os.path.join(model_dir, f"lstm_{model_key}.pth"))
+
+    return {
+        "model_key": model_key,
+        "metrics": metrics,
+        "windows": int(len(X)),
+        "seconds": round(time.time() - start_time, 2)
+    }
+
+
+def train_multitask_model(jobs: List[Tuple[str, np.ndarray]], model_dir: str,
+                          epochs: int = 30, batch_size: int = 64, learning_rate: float = 1e-3,
+                          val_ratio: float = 0.2, num_threads: int = 1, seed: int = 42) -> Dict[str, Any]:
+    """在所有组合的窗口上训练一个共享多任务模型
+
+    每个组合保留自己的标准化器（水平差异很大），模型通过行业/资源嵌入区分组合。
+    """
+    start_time = time.time()
+    torch.set_num_threads(num_threads)
+    torch.manual_seed(seed)
+
+    scalers = {}
+    parts = {"X": [], "y": [], "mask": [], "industry": [], "resource": [], "mean": [], "scale": [], "val": []}
+    for model_key, series in jobs:
+        industry_value, resource_value = model_key.split("_", 1)
+        scaler = StandardScaler().fit(series)
+        scaled = scaler.transform(series).astype(np.float32)
+        X, y, mask = make_windows(scaled, scaled[:, 0])
+        n = len(X)
+        n_val = int(n * val_ratio) if n >= 5 else 0
+
+        scalers[model_key] = scaler
+        parts["X"].append(X)
+        parts["y"].append(y)
+        parts["mask"].append(mask)
+        parts["industry"].append(np.full(n, INDUSTRY_INDEX[IndustryType(industry_value)]))
+        parts["resource"].append(np.full(n, RESOURCE_INDEX[ResourceType(resource_value)]))
+        parts["mean"].append(np.full(n, scaler.mean_[0]))
+        parts["scale"].append(np.full(n, scaler.scale_[0]))
+        parts["val"].append(np.arange(n) >= n - n_val)
+
+    data = {k: np.concatenate(v) for k, v in parts.items()}
+    X_t = torch.from_numpy(data["X"])
+    y_t = torch.from_numpy(data["y"])
+    m_t = torch.from_numpy(data["mask"].astype(np.float32))
+    ind_t = torch.from_numpy(data["industry"]).long()
+    res_t = torch.from_numpy(data["resource"]).long()
+    train_idx = torch.from_numpy(np.flatnonzero(~data["val"]))
+    eval_idx = np.flatnonzero(data["val"]) if data["val"].any() else train_idx.numpy()
+
+    model = MultiTaskLSTMPredictor(input_size=len(FEATURE_COLUMNS), hidden_size=64, num_layers=2, output_size=MAX_HORIZON)
+    optimizer = torch.optim.Adam(model.parameters(), lr=learning_rate)
+
+    model.train()
+    for _ in range(epochs):
+        order = train_idx[torch.randperm(len(train_idx))]
+        for i in range(0, len(order), batch_size):
+            batch = order[i:i + batch_size]
+            optimizer.zero_grad()
+            loss = _masked_mse(model(X_t[batch], ind_t[batch], res_t[batch]), y_t[batch], m_t[batch])
+            loss.backward()
+            nn.utils.clip_grad_norm_(model.parameters(), 1.0)
+            optimizer.step()
+
+    model.eval()
+    with torch.no_grad():
+        pred = model(X_t[eval_idx], ind_t[eval_idx], res_t[eval_idx]).numpy()
+    mean = data["mean"][eval_idx][:, None]
+    scale = data["scale"][eval_idx][:, None]
+    eval_mask = data["mask"][eval_idx]
+    metrics = _regression_metrics((data["y"][eval_idx] * scale + mean)[eval_mask], (pred * scale + mean)[eval_mask])
+
+    checkpoint = {
+        "state_dict": model.state_dict(),
+        "config": {
+            "input_size": len(FEATURE_COLUMNS),
+            "hidden_size": 64,
+            "num_layers": 2,
+            "output_size": MAX_HORIZON,
+            "dropout": HEAD_DROPOUT,
+            "num_industries": len(IndustryType),
+            "num_resources": len(ResourceType)
+        },
+        "metrics": metrics,
+        "version": datetime.now().strftime("%Y%m%d%H%M%S"),
+        "trained_at": datetime.now().isoformat(),
+        "windows": int(len(X_t))
+    }
+
+    atomic_save(lambda p: joblib.dump(scalers, p), os.path.join(model_dir, f"scaler_{MULTITASK_KEY}.pkl"))
+    atomic_save(lambda p: torch.save(checkpoint, p), os.path.join(model_dir, f"lstm_{MULTITASK_KEY}.pth"))
+
+    return {
+        "model_key": MULTITASK_KEY,
+        "metrics": metrics,
+        "windows": int(len(X_t)),
+        "seconds": round(time.time() - start_time, 2)
+    }
+
+
+class ModelTrainer:
+    """离线训练流水线：为所有行业×资源组合并行训练LSTM预测模型"""
+
+    def __init__(self, model_dir: str = "models", workers: Optional[int] = None,
+                 epochs: int = 30, batch_size: int = 64, min_history: int = 120):
+        self.model_dir = model_dir
+        self.workers = workers or os.cpu_count() or 1
+        self.epochs = epochs
+        self.batch_size = batch_size
+        self.min_history = max(min_history, SEQUENCE_LENGTH + 1)
+
+        os.makedirs(self.model_dir, exist_ok=True)
+
+    def train_all(self, csv_paths: List[str], json_dir: Optional[str] = None,
+                  industries: Optional[List[IndustryType]] = None,
+                  resources: Optional[List[ResourceType]] = None,
+                  model_type: str = "lstm") -> Dict[str, Any]:
+        """训练全部（或指定的）组合
+
+        model_type 为 "lstm" 时每个组合训练一个独立模型，为 "multitask" 时训练一个共享模型。
+        """
+        start_time = time.time()
+        records = load_history(csv_paths, json_dir)
+        logger.info(f"读取历史数据 {len(records)} 条")
+
+        jobs = []
+        for industry in industries or list(IndustryType):
+            for resource in resources or list(ResourceType):
+                series, real_months = build_monthly_series(records, industry, resource, self.min_history)
+                if real_months == 0:
+                    logger.warning(f"{industry.value}_{resource.value} 没有历史数据，使用基线历史训练")
+                jobs.append((f"{industry.value}_{resource.value}", series[FEATURE_COLUMNS].to_numpy(dtype=np.float64)))
+
+        results, failed = [], []
+        if model_type == MULTITASK_KEY:
+            # 共享模型只有一个训练任务，直接在当前进程用全部核训练
+            try:
+                result = train_multitask_model(jobs, self.model_dir, self.epochs, self.batch_size,
+                                               num_threads=self.workers)
+                results.append(result)
+                logger.info(f"多任务模型训练完成, 指标: {result['metrics']}, 耗时: {result['seconds']}秒")
+            except Exception as e:
+                failed.append(MULTITASK_KEY)
+                logger.error(f"多任务模型训练失败: {e}")
+            return self._summarize(results, failed, start_time)
+
+        # 每个工作进程使用单线程，避免进程数×线程数超过核数
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(jobs))) as executor:
+            futures = {
+                executor.submit(train_single_model, key, series, self.model_dir,
+                                self.epochs, self.batch_size): key
+                for key, series in jobs
+            }
+            for future in as_completed(futures):
+                key = futures[future]
+                try:
+                    result = future.result()
+                    results.append(result)
+                    logger.info(f"模型训练完成: {key}, 指标: {result['metrics']}, 耗时: {result['seconds']}秒")
+                except Exception as e:
+                    failed.append(key)
+                    logger.error(f"模型训练失败: {key}, 错误: {e}")
+
+        return self._summarize(results, failed, start_time)
+
+    def _summarize(self, results: List[Dict[str, Any]], failed: List[str], start_time: float) -> Dict[str, Any]:
+        summary = {
+            "trained": len(results),
+            "failed": failed,
+            "workers": self.workers,
+            "seconds": round(time.time() - start_time, 2),
+            "results": sorted(results, key=lambda r: r["model_key"])
+        }
+        logger.info(f"训练完成: {summary['trained']} 个模型, 失败 {len(failed)} 个, 总耗时 {summary['seconds']}秒")
+        return summary
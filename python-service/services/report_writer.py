@@ -0,0 +1,216 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from loguru import logger
+
+import sys
+# 添加父目录到Python路径，确保可以导入services
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.artifact_store import ArtifactStore
+
+REPORT_FORMAT = "columnar-npy/v1"
+MANIFEST_FILE = "manifest.json"
+DATES_FILE = "dates.npy"
+SERIES_FILE = "series.npy"
+MAX_FAILED = 256  # 保留写入失败原因的报告数上限
+
+
+class ReportPendingError(RuntimeError):
+    """报告仍在后台写入，调用方应稍后重试"""
+
+
+class ReportFailedError(RuntimeError):
+    """报告后台写入失败"""
+
+
+class ReportWriter:
+    """分析报告的列式存储与后台写入
+
+    每份报告是一个目录：dates.npy（datetime64[D]）、series.npy（float64，形状为 列数×天数，每列连续存放）
+    和小的 manifest.json（列名、汇总、趋势等）。清单最后写入，整个目录原子替换到位。
+    .npy 不压缩，以便读取时直接内存映射、按列/按日期切片而不解析整份文件；
+    逐日序列以浮点数为主，通用压缩收益有限，这里选择零拷贝读取。
+    目录名取内容哈希，相同报告只写一次；写入在有界的后台线程中进行，积压超过 max_pending 时在调用线程中直接写入。
+    """
+
+    def __init__(self, output_dir: str, max_pending: int = 8, store: Optional[ArtifactStore] = None,
+                 kind: str = "report"):
+        self.output_dir = output_dir
+        self.store = store
+        self.kind = kind
+        os.makedirs(output_dir, exist_ok=True)
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="report-writer")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._jobs: Dict[str, Future] = {}
+        # 写入失败的报告 -> 失败原因（读取时据此区分"写入失败"和"不存在"；重新提交成功后清除）
+        self._failed: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.written = 0
+        self.inline_writes = 0
+
+    @staticmethod
+    def _digest(meta: Dict[str, Any], dates: np.ndarray, series: np.ndarray) -> str:
+        h = hashlib.sha256(json.dumps(meta, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8"))
+        h.update(np.ascontiguousarray(dates).tobytes())
+        h.update(np.ascontiguousarray(series).tobytes())
+        return h.hexdigest()
+
+    def path_for(self, report_id: str) -> str:
+        return os.path.join(self.output_dir, os.path.basename(report_id))
+
+    def submit(self, name: str, meta: Dict[str, Any], dates: np.ndarray, columns: Dict[str, np.ndarray],
+               region: Optional[str] = None) -> Dict[str, Any]:
+        """提交报告写入，立即返回 {report_id, report_path（清单路径）, status}"""
+        dates = np.asarray(dates, dtype="datetime64[D]")
+        series = np.vstack([np.asarray(values, dtype=np.float64) for values in columns.values()]) \
+            if columns else np.empty((0, len(dates)))
+        digest = self._digest(meta, dates, series)
+        report_id = f"{name}_{digest[:16]}"
+        path = self.path_for(report_id)
+        result = {"report_id": report_id, "report_path": os.path.join(path, MANIFEST_FILE)}
+
+        with self._lock:
+            if report_id in self._jobs:
+                return {**result, "status": "pending"}
+            exists = self.store.lookup(self.kind, digest) is not None if self.store is not None else os.path.exists(path)
+            if exists:
+                return {**result, "status": "ready"}
+            manifest = {
+                "format": REPORT_FORMAT,
+                "report_id": report_id,
+                "analysis_date": datetime.now().isoformat(),
+                "rows": len(dates),
+                "columns": list(columns),
+                "files": {"dates": DATES_FILE, "series": SERIES_FILE},
+                **meta
+            }
+            inline = not self._slots.acquire(blocking=False)
+            if inline:
+                future = Future()
+            else:
+                future = self._pool.submit(self._write, digest, path, manifest, dates, series, region)
+            self._jobs[report_id] = future
+
+        if not inline:
+            # 在锁外挂回调：任务已完成时回调会在当前线程立即执行，而 _finish 需要获取同一把锁
+            future.add_done_callback(lambda f, report_id=report_id: self._finish(report_id, f))
+            return {**result, "status": "pending"}
+
+        # 后台积压时由调用方承担写入（背压），报告不会丢失
+        self.inline_writes += 1
+        try:
+            self._write(digest, path, manifest, dates, series, region)
+            future.set_result(None)
+            self.written += 1
+            self._done(report_id, None)
+        except Exception as e:
+            future.set_exception(e)
+            self._done(report_id, e)
+            raise
+        return {**result, "status": "ready"}
+
+    def _write(self, digest: str, path: str, manifest: Dict[str, Any], dates: np.ndarray,
+               series: np.ndarray, region: Optional[str]):
+        def write(directory: str):
+            os.makedirs(directory, exist_ok=True)
+            np.save(os.path.join(directory, DATES_FILE), dates)
+            np.save(os.path.join(directory, SERIES_FILE), series)
+            with open(os.path.join(directory, MANIFEST_FILE), "w", encoding="utf-8") as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2, default=str)
+
+        if self.store is not None:
+            self.store.put(self.kind, digest, path, write, region=region)
+        elif not os.path.exists(path):
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            try:
+                write(tmp_path)
+                os.replace(tmp_path, path)
+            finally:
+                shutil.rmtree(tmp_path, ignore_errors=True)
+
+    def _done(self, report_id: str, error: Optional[BaseException]):
+        """移除写入任务并记录结果：失败时保留原因，成功时清除之前的失败记录"""
+        with self._lock:
+            self._jobs.pop(report_id, None)
+            if error is None:
+                self._failed.pop(report_id, None)
+            else:
+                if len(self._failed) >= MAX_FAILED:
+                    self._failed.pop(next(iter(self._failed)))
+                self._failed[report_id] = str(error)
+
+    def _finish(self, report_id: str, future: Future):
+        self._slots.release()
+        error = future.exception() if not future.cancelled() else RuntimeError("写入已取消")
+        self._done(report_id, error)
+        if error is None:
+            self.written += 1
+            logger.info(f"分析报告已写入: {report_id}")
+        else:
+            logger.error(f"分析报告写入失败: {report_id}: {error}")
+
+    def wait(self, report_id: str, timeout: Optional[float] = None):
+        """等待正在写入的报告完成
+
+        超时仍未写完时抛出 ReportPendingError，写入失败时抛出 ReportFailedError。
+        """
+        report_id = os.path.basename(report_id)
+        with self._lock:
+            future = self._jobs.get(report_id)
+            failed = self._failed.get(report_id)
+        if future is not None:
+            try:
+                future.result(timeout=timeout)
+            except FutureTimeoutError:
+                raise ReportPendingError(f"报告正在写入，请稍后重试: {report_id}") from None
+            except Exception as e:
+                raise ReportFailedError(f"报告写入失败: {report_id}: {e}") from e
+        elif failed is not None:
+            raise ReportFailedError(f"报告写入失败: {report_id}: {failed}")
+
+    def load(self, report_id: str, columns: Optional[List[str]] = None, start: Optional[Any] = None,
+             end: Optional[Any] = None, timeout: Optional[float] = 30) -> Dict[str, Any]:
+        """读取报告：序列以内存映射方式打开，只复制所选列和日期范围 [start, end) 的切片"""
+        self.wait(report_id, timeout)
+        path = self.path_for(report_id)
+        manifest_path = os.path.join(path, MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            raise FileNotFoundError(f"报告不存在: {report_id}")
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+
+        dates = np.load(os.path.join(path, manifest["files"]["dates"]), mmap_mode="r")
+        series = np.load(os.path.join(path, manifest["files"]["series"]), mmap_mode="r")
+        lo = int(np.searchsorted(dates, np.datetime64(start, "D"))) if start is not None else 0
+        hi = int(np.searchsorted(dates, np.datetime64(end, "D"))) if end is not None else len(dates)
+
+        names = manifest["columns"]
+        selected = columns or names
+        unknown = [name for name in selected if name not in names]
+        if unknown:
+            raise ValueError(f"未知的列: {', '.join(unknown)}")
+        return {
+            "manifest": manifest,
+            "dates": np.array(dates[lo:hi]),
+            "columns": {name: np.array(series[names.index(name), lo:hi]) for name in selected}
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "output_dir": self.output_dir,
+                "pending": len(self._jobs),
+                "written": self.written,
+                "inline_writes": self.inline_writes
+            }
+
+    def shutdown(self):
+        # 等待已提交的报告写完，避免留下未完成的临时目录
+        self._pool.shutdown(wait=True)
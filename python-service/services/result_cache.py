@@ -0,0 +1,101 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Set, Tuple
+
+
+class ResultCache:
+    """推理结果缓存
+
+    以请求参数（含模型版本）的规范化哈希为键，按TTL过期、按LRU淘汰。
+    每条结果带有所属模型键，并按模型键维护索引，模型检查点更新时只需删除该模型
+    名下的条目，无需扫描整个缓存。
+    缓存的结果会被多个请求共享，调用方不应修改返回值。
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        self._entries: "OrderedDict[str, Tuple[float, Hashable, Any]]" = OrderedDict()
+        self._by_model: Dict[Hashable, Set[str]] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(payload: Dict[str, Any]) -> str:
+        """对请求参数做规范化（键排序）后取SHA-256"""
+        canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, _, value = entry
+            if expires_at < time.monotonic():
+                self._drop(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, model_key: Hashable, value: Any):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, model_key, value)
+            self._by_model.setdefault(model_key, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, model_key: Hashable) -> int:
+        """使某个模型的全部缓存结果失效"""
+        with self._lock:
+            stale = self._by_model.pop(model_key, set())
+            for k in stale:
+                del self._entries[k]
+            self.invalidations += len(stale)
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_model.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+    def _drop(self, key: str):
+        _, model_key, _ = self._entries.pop(key)
+        keys = self._by_model.get(model_key)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_model[model_key]
@@ -0,0 +1,283 @@
+import math
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+from loguru import logger
+
+import sys
+import os
+# 添加父目录到Python路径，确保可以导入models
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from models.schemas import IndustryType, StreamReading
+from services.anomaly_detector import AnomalyDetector, ANOMALY_FEATURES, FUSION_WEIGHTS, FUSION_REASONS
+
+
+class RunningStats:
+    """Welford 在线均值/方差（按特征向量化）"""
+
+    def __init__(self, size: int):
+        self.count = 0
+        self.mean = np.zeros(size)
+        self.m2 = np.zeros(size)
+
+    @classmethod
+    def from_scaler(cls, scaler) -> "RunningStats":
+        """以参考窗口拟合的标准化器作为初始统计量"""
+        stats = cls(len(scaler.mean_))
+        stats.count = int(np.max(scaler.n_samples_seen_))
+        stats.mean = np.array(scaler.mean_, dtype=np.float64)
+        stats.m2 = np.array(scaler.var_, dtype=np.float64) * stats.count
+        return stats
+
+    def update(self, x: np.ndarray):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+
+    @property
+    def std(self) -> np.ndarray:
+        if self.count < 2:
+            return np.ones_like(self.mean)
+        std = np.sqrt(self.m2 / self.count)
+        std[std == 0] = 1.0
+        return std
+
+
+class P2Quantile:
+    """P² 在线分位数估计（Jain & Chlamtac），常数内存、O(1) 更新"""
+
+    def __init__(self, p: float):
+        self.p = p
+        self.count = 0
+        self._initial: List[float] = []
+        self._heights: List[float] = []
+        self._positions = [1.0, 2.0, 3.0, 4.0, 5.0]
+        self._desired = [1.0, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5.0]
+        self._increments = [0.0, p / 2, p, (1 + p) / 2, 1.0]
+
+    def update(self, x: float):
+        self.count += 1
+        if len(self._initial) < 5:
+            self._initial.append(x)
+            if len(self._initial) == 5:
+                self._heights = sorted(self._initial)
+            return
+
+        q, n = self._heights, self._positions
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = next(i for i in range(4) if q[i] <= x < q[i + 1])
+
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self._desired[i] += self._increments[i]
+
+        for i in range(1, 4):
+            d = self._desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1.0 if d > 0 else -1.0
+                # 抛物线插值，越界时退化为线性插值
+                candidate = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+                    (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+                )
+                if not q[i - 1] < candidate < q[i + 1]:
+                    j = i + int(d)
+                    candidate = q[i] + d * (q[j] - q[i]) / (n[j] - n[i])
+                q[i] = candidate
+                n[i] += d
+
+    @property
+    def value(self) -> float:
+        if self.count >= 5:
+            return self._heights[2]
+        if not self._initial:
+            return math.nan
+        return float(np.quantile(self._initial, self.p))
+
+
+class StreamState:
+    """单个行业（及阈值）的流式检测状态"""
+
+    def __init__(self, scaler, quantile: float, window: int):
+        self.stats = RunningStats.from_scaler(scaler) if hasattr(scaler, "mean_") else RunningStats(len(ANOMALY_FEATURES))
+        self.error_quantile = P2Quantile(quantile)
+        self.recent_errors: deque = deque(maxlen=window)
+        self.recent_error_sum = 0.0
+        self.recent_exceed: deque = deque(maxlen=window)
+        self.recent_exceed_count = 0
+        self.points = 0
+        self.anomalies = 0
+        self.lock = threading.Lock()
+
+    def push_error(self, error: float) -> float:
+        """加入滚动窗口并返回窗口平均重构误差"""
+        if len(self.recent_errors) == self.recent_errors.maxlen:
+            self.recent_error_sum -= self.recent_errors[0]
+        self.recent_errors.append(error)
+        self.recent_error_sum += error
+        return self.recent_error_sum / len(self.recent_errors)
+
+    def push_exceed(self, exceeded: bool) -> float:
+        """记录本点是否超过阈值，返回窗口内超阈值的比例（窗口未满时为0）"""
+        if len(self.recent_exceed) == self.recent_exceed.maxlen:
+            self.recent_exceed_count -= self.recent_exceed[0]
+        self.recent_exceed.append(exceeded)
+        self.recent_exceed_count += exceeded
+        if len(self.recent_exceed) < self.recent_exceed.maxlen:
+            return 0.0
+        return self.recent_exceed_count / len(self.recent_exceed)
+
+
+class StreamingAnomalyDetector:
+    """流式异常检测
+
+    逐条评分实时到达的监测读数，不回溯历史：
+    - Z-score：各行业特征的 Welford 在线均值/方差（以参考窗口统计量为初值）
+    - 自编码器：重构误差与 P² 在线分位数阈值比较；滚动窗口内过半读数超阈值（持续偏移）也视为异常
+    - 隔离森林：使用参考窗口拟合的模型评分
+    同一批到达的读数一起做自编码器前向和隔离森林评分，在线统计量再逐条 O(1) 更新。
+    """
+
+    def __init__(self, detector: AnomalyDetector, window: int = 24, warmup: int = 20, z_threshold: float = 2.5):
+        self.detector = detector
+        self.window = window
+        self.warmup = warmup
+        self.z_threshold = z_threshold
+        self._states: Dict[Tuple[str, float], StreamState] = {}
+        self._lock = threading.Lock()
+
+    def score_batch(self, industry: IndustryType, readings: List[Dict[str, Any]],
+                    threshold: float = 0.95) -> List[Dict[str, Any]]:
+        """按到达顺序评分一批读数，每条读数返回一个事件"""
+        if not readings:
+            return []
+        industry = IndustryType(getattr(industry, "value", industry))
+        model, scaler, isolation_forest = self.detector._get_components(industry.value)
+        state = self._state(industry.value, threshold, scaler)
+
+        with state.lock:
+            # 缺失的特征用当前运行均值补齐
+            X = np.array([
+                [np.nan if reading.get(name) is None else reading[name] for name in ANOMALY_FEATURES]
+                for reading in readings
+            ], dtype=np.float64)
+            missing = np.isnan(X)
+            if missing.any():
+                X = np.where(missing, state.stats.mean, X)
+
+            # 与历史无关的部分整批计算
+            X_scaled = scaler.transform(X) if hasattr(scaler, "mean_") else X
+            with torch.no_grad():
+                X_tensor = torch.from_numpy(X_scaled).float()
+                errors = torch.mean((X_tensor - model(X_tensor)) ** 2, dim=1).numpy().astype(np.float64)
+            if_flags = (isolation_forest.score_samples(X) < isolation_forest.offset_
+                        if hasattr(isolation_forest, "offset_") else np.zeros(len(X), dtype=bool))
+
+            events = []
+            for i, reading in enumerate(readings):
+                # 先与历史统计量比较，再更新
+                z = np.abs((X[i] - state.stats.mean) / state.stats.std)
+                z_flag = bool(z.max() > self.z_threshold)
+                state.stats.update(X[i])
+
+                error_threshold = state.error_quantile.value
+                rolling_error = state.push_error(errors[i])
+                ready = state.error_quantile.count >= self.warmup
+                exceeded = ready and errors[i] > error_threshold
+                sustained = state.push_exceed(exceeded) > 0.5
+                ae_flag = exceeded or sustained
+                state.error_quantile.update(errors[i])
+
+                flags = np.array([bool(if_flags[i]), ae_flag, z_flag])
+                score = float(flags @ FUSION_WEIGHTS)
+                is_anomaly = bool(flags.any())
+                state.points += 1
+                state.anomalies += int(is_anomaly)
+
+                events.append({
+                    "industry": industry.value,
+                    "timestamp": reading.get("timestamp") or datetime.now().isoformat(),
+                    "is_anomaly": is_anomaly,
+                    "anomaly_score": round(score, 3),
+                    "severity": self.detector._severity_labels(np.array([score]))[0] if is_anomaly else None,
+                    "reasons": list(FUSION_REASONS[int(flags @ np.array([1, 2, 4]))]),
+                    "emission": float(X[i, 0]),
+                    "reconstruction_error": round(float(errors[i]), 6),
+                    "error_threshold": None if math.isnan(error_threshold) else round(float(error_threshold), 6),
+                    "rolling_error": round(float(rolling_error), 6),
+                    "max_z_score": round(float(z.max()), 3),
+                    "warming_up": not ready
+                })
+        self.detector.record_anomalies(industry.value, [e for e in events if e["is_anomaly"]], source="stream")
+        return events
+
+    def score_readings(self, readings: List[Any], threshold: float = 0.95) -> List[Dict[str, Any]]:
+        """评分一批原始读数（可混合多个行业），按到达顺序返回事件，无效读数返回错误事件"""
+        events: List[Dict[str, Any]] = []
+        run: List[Dict[str, Any]] = []
+        run_industry = None
+
+        def flush():
+            if run:
+                events.extend(self.score_batch(run_industry, run, threshold))
+                run.clear()
+
+        # 连续的同行业读数合并为一批评分，保持事件顺序与到达顺序一致
+        for index, raw in enumerate(readings):
+            try:
+                reading = StreamReading.model_validate(raw).model_dump()
+            except Exception as e:
+                flush()
+                events.append({"index": index, "is_anomaly": False, "error": str(e)})
+                continue
+            if reading["industry"] != run_industry:
+                flush()
+                run_industry = reading["industry"]
+            run.append(reading)
+        flush()
+        return events
+
+    def get_stats(self) -> Dict[str, Any]:
+        """各行业流式检测状态"""
+        with self._lock:
+            states = list(self._states.items())
+        return {
+            f"{industry}@{threshold}": {
+                "points": state.points,
+                "anomalies": state.anomalies,
+                "error_threshold": None if math.isnan(state.error_quantile.value) else round(state.error_quantile.value, 6),
+                "running_mean": dict(zip(ANOMALY_FEATURES, np.round(state.stats.mean, 3).tolist()))
+            }
+            for (industry, threshold), state in states
+        }
+
+    def reset(self, industry: Optional[IndustryType] = None):
+        """清空流式状态（模型重新拟合后可调用）"""
+        with self._lock:
+            if industry is None:
+                self._states.clear()
+            else:
+                value = getattr(industry, "value", industry)
+                for key in [k for k in self._states if k[0] == value]:
+                    del self._states[key]
+        logger.info(f"流式异常检测状态已重置: {industry or '全部行业'}")
+
+    def _state(self, model_key: str, threshold: float, scaler) -> StreamState:
+        key = (model_key, round(threshold, 2))
+        with self._lock:
+            state = self._states.get(key)
+            if state is None:
+                state = self._states[key] = StreamState(scaler, key[1], self.window)
+            return state
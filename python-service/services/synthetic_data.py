@@ -0,0 +1,156 @@
+import zlib
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+
+def series_rng(seed: Optional[int], *key) -> np.random.Generator:
+    """随机数生成器：指定种子时按 (种子, key) 派生，同一key结果可复现；未指定时每次不同"""
+    if seed is None:
+        return np.random.default_rng()
+    return np.random.default_rng([seed, zlib.crc32("|".join(map(str, key)).encode("utf-8"))])
+
+
+def generate_industry_series(base_values: Dict[str, float], periods: int,
+                             end: Optional[datetime] = None, freq: str = "D",
+                             anomaly_rate: float = 0.05,
+                             rng: Optional[np.random.Generator] = None,
+                             start: int = 0, stop: Optional[int] = None) -> pd.DataFrame:
+    """一次性生成行业监测序列的全部列（异常检测使用）
+
+    排放 = 基础值 × 缓慢上升趋势 + 年度季节性 + 10%噪声，并以 anomaly_rate 的概率
+    注入 0.1/2/5 倍的异常值；趋势和季节性按实际经过的天数计算，日/小时粒度通用。
+    start/stop 只生成 periods 个时间点中的 [start, stop) 行（分块生成），趋势和季节性仍以完整序列的起点计算。
+    """
+    rng = rng or np.random.default_rng()
+    # 结束时间按粒度取整（日粒度为当天零点），同一天/小时重复生成的时间点一致
+    all_dates = pd.date_range(end=pd.Timestamp(end or datetime.now()).floor(freq), periods=periods, freq=freq)
+    dates = all_dates[start:stop]
+    elapsed_days = (dates - all_dates[0]) / pd.Timedelta(days=1)
+    elapsed_days = np.asarray(elapsed_days, dtype=np.float64)
+    periods = len(dates)
+
+    emission_base = base_values["emission"]
+    trend = emission_base * (1 + 0.001 * elapsed_days)
+    seasonal = emission_base * 0.2 * np.sin(2 * np.pi * elapsed_days / 365)
+    noise = rng.normal(0, emission_base * 0.1, periods)
+    emission = np.maximum(0, trend + seasonal + noise)
+
+    is_anomaly = rng.random(periods) < anomaly_rate
+    anomaly_factor = rng.choice([0.1, 2.0, 5.0], size=periods)
+    emission = np.where(is_anomaly, emission_base * anomaly_factor, emission)
+
+    return pd.DataFrame({
+        "date": dates,
+        "emission": emission,
+        "energy_consumption": rng.normal(base_values["energy"], base_values["energy"] * 0.1, periods),
+        "temperature": rng.normal(base_values["temperature"], 5, periods),
+        "humidity": rng.normal(base_values["humidity"], 10, periods),
+        "pressure": rng.normal(base_values["pressure"], 5, periods),
+        "wind_speed": rng.normal(base_values["wind_speed"], 2, periods),
+        "gdp": rng.normal(base_values["gdp"], base_values["gdp"] * 0.05, periods),
+        "policy_factor": rng.normal(1.0, 0.1, periods)
+    })
+
+
+def generate_spec_series(spec: Dict[str, Any], start: int = 0, stop: Optional[int] = None,
+                         chunk: Optional[int] = None) -> pd.DataFrame:
+    """按序列描述生成行业监测序列（描述可跨进程传递，工作进程据此在本地生成数据）
+
+    spec 含 base_values/periods/end/freq 以及随机数派生用的 seed/key，
+    同一 spec 在任何进程中生成的数据一致（seed 为 None 时每次不同）。
+    分块生成时每块用 (key, chunk) 单独派生随机数，只生成 [start, stop) 行，各块可在不同进程中独立生成。
+    """
+    key = spec["key"] if chunk is None else (*spec["key"], "chunk", chunk)
+    return generate_industry_series(
+        spec["base_values"],
+        periods=spec["periods"],
+        end=spec["end"],
+        freq=spec["freq"],
+        rng=series_rng(spec["seed"], *key),
+        start=start,
+        stop=stop
+    )
+
+
+def spec_dates(spec: Dict[str, Any]) -> pd.DatetimeIndex:
+    """序列描述对应的完整时间索引（与 generate_industry_series 的时间点一致）"""
+    return pd.date_range(end=pd.Timestamp(spec["end"]).floor(spec["freq"]), periods=spec["periods"], freq=spec["freq"])
+
+
+def generate_seasonal_flux(dates: pd.DatetimeIndex, components: Dict[str, float],
+                           amplitude: float, phase_month: int, noise_std: float = 0.1,
+                           rng: Optional[np.random.Generator] = None) -> Dict[str, np.ndarray]:
+    """按月份季节性和随机波动生成各分量的通量序列（碳汇/碳源使用）
+
+    季节因子 = 1 + amplitude·sin(2π(月份 - phase_month)/12)，随机因子 = 1 + N(0, noise_std)，
+    各分量和 total 均为 基础值 × 季节因子 × 随机因子。
+    """
+    rng = rng or np.random.default_rng()
+    months = dates.month.to_numpy()
+    seasonal_factor = 1.0 + amplitude * np.sin(2 * np.pi * (months - phase_month) / 12)
+    random_factor = 1.0 + rng.normal(0, noise_std, len(dates))
+    factor = seasonal_factor * random_factor
+
+    flux = {name: base * factor for name, base in components.items()}
+    flux["total"] = sum(components.values()) * factor
+    flux["seasonal_factor"] = seasonal_factor
+    flux["random_factor"] = random_factor
+    return flux
+
+
+# 能源日志模板中的设备类别：(设备类型, 能源类型, 单位, 排放因子, 行业, 典型小时消耗量)
+DEVICE_PROFILES = [
+    ("锅炉", "煤炭", "千克", 0.732, "制造业", 500.0),
+    ("发电机", "柴油", "升", 2.68, "能源", 200.0),
+    ("空调", "电力", "千瓦时", 0.583, "服务业", 150.0),
+    ("烘干机", "天然气", "立方米", 1.96, "农业", 80.0),
+    ("运输车", "汽油", "升", 2.31, "交通", 100.0),
+]
+REGIONS = ["华北", "华东", "华南", "华中", "西南", "西北", "东北"]
+
+
+def generate_energy_logs(n_devices: int, periods: int, end: Optional[datetime] = None, freq: str = "h",
+                         anomaly_rate: float = 0.005,
+                         rng: Optional[np.random.Generator] = None) -> pd.DataFrame:
+    """生成能源日志模板格式（中文列名）的设备级模拟数据，按时间、设备顺序排列
+
+    每台设备的基础消耗在同类典型值附近对数正态分布，叠加日内曲线和5%噪声，
+    并以 anomaly_rate 的概率注入 2-4 倍的尖峰或 0.1 倍的骤降。
+    """
+    rng = rng or np.random.default_rng()
+    dates = pd.date_range(end=pd.Timestamp(end or datetime.now()).floor(freq), periods=periods, freq=freq)
+    kinds = rng.integers(0, len(DEVICE_PROFILES), n_devices)
+    profiles = list(zip(*DEVICE_PROFILES))
+    device_base = np.array(profiles[5])[kinds] * rng.lognormal(0, 0.3, n_devices)
+    width = len(str(n_devices))
+    device_ids = np.array([f"DEV{i + 1:0{max(3, width)}d}" for i in range(n_devices)], dtype=object)
+
+    # 时间在外层、设备在内层
+    hour = np.repeat(dates.hour.to_numpy(), n_devices)
+    kind = np.tile(kinds, periods)
+    daily = 1.0 + 0.3 * np.sin(2 * np.pi * (hour - 8 - 2 * kind) / 24)
+    consumption = np.tile(device_base, periods) * daily * (1 + rng.normal(0, 0.05, len(hour)))
+
+    is_anomaly = rng.random(len(hour)) < anomaly_rate
+    factor = np.where(rng.random(len(hour)) < 0.8, rng.uniform(2, 4, len(hour)), 0.1)
+    consumption = np.round(np.where(is_anomaly, consumption * factor, consumption), 3)
+
+    def column(values):
+        return np.tile(np.array(values, dtype=object)[kinds], periods)
+
+    return pd.DataFrame({
+        "时间戳": np.repeat(dates.to_numpy(), n_devices),
+        "设备ID": np.tile(device_ids, periods),
+        "设备类型": column(profiles[0]),
+        "能源类型": column(profiles[1]),
+        "消耗量": consumption,
+        "单位": column(profiles[2]),
+        "排放因子": np.tile(np.array(profiles[3])[kinds], periods),
+        "行业": column(profiles[4]),
+        "地区": np.tile(np.array(REGIONS, dtype=object)[rng.integers(0, len(REGIONS), n_devices)], periods),
+        "操作员": "系统",
+        "备注": "模拟数据"
+    })
@@ -3,57 +3,515 @@
 测试异常检测功能
 """
 
+import atexit
 import sys
 import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from services.anomaly_detector import AnomalyDetector
-from models.schemas import IndustryType
+import numpy as np
+import pandas as pd
 
-async def test_anomaly_detection():
+from services.anomaly_detector import AnomalyDetector, ANOMALY_FEATURES, FUSION_REASONS, REPORT_COLUMNS
+from services.chunked_scoring import ChunkedScorer, score_spec_inline
+from services.stream_detector import P2Quantile, RunningStats, StreamingAnomalyDetector
+from services.anomaly_store import AnomalyStore
+from services.model_bundle import export_bundle
+from models.schemas import IndustryType, SamplingFrequency
+
+
+# 各行业的参考模型只拟合一次（固定种子），模型文件保存在这个目录中，各测试复制后加载
+REFERENCE_MODEL_DIR = tempfile.mkdtemp(prefix="anomaly-models-")
+atexit.register(shutil.rmtree, REFERENCE_MODEL_DIR, True)
+
+
+def reference_model_files(industry):
+    """该行业已拟合的参考模型文件（首次调用时拟合）"""
+    names = [f"{prefix}_{industry.value}.{ext}" for prefix, ext in
+             (("autoencoder", "pth"), ("anomaly_scaler", "pkl"), ("isolation_forest", "pkl"))]
+    if not all(os.path.exists(os.path.join(REFERENCE_MODEL_DIR, name)) for name in names):
+        fitter = AnomalyDetector(seed=42, processes=1, fit_missing=False)
+        fitter.model_dir = REFERENCE_MODEL_DIR
+        fitter.fit_reference_models(industry)
+    return [os.path.join(REFERENCE_MODEL_DIR, name) for name in names]
+
+
+def fitted_detector(model_dir, industries, **kwargs):
+    """在临时模型目录中加载指定行业参考模型的检测器（模型只拟合一次，不写入 models/）"""
+    kwargs.setdefault("seed", 42)
+    detector = AnomalyDetector(fit_missing=False, **kwargs)
+    detector.model_dir = model_dir
+    for industry in industries:
+        for path in reference_model_files(industry):
+            shutil.copy2(path, model_dir)
+        detector._install(industry.value, detector._load_industry_models(industry.value),
+                          detector._model_version(industry.value))
+    detector.is_initialized = True
+    return detector
+
+
+def test_anomaly_detection():
     """测试异常检测功能"""
     print("🧪 开始测试异常检测功能...")
-    
-    try:
-        # 创建异常检测器实例
-        detector = AnomalyDetector()
-        
-        # 初始化模型
-        await detector.initialize_models()
-        print("✅ 模型初始化成功")
-        
-        # 测试异常检测
-        print("🔍 测试异常检测...")
-        result = await detector.detect_anomalies(IndustryType.ENERGY, 30)
-        
+
+    try:
+        with tempfile.TemporaryDirectory() as model_dir:
+            # 创建异常检测器实例并拟合模型
+            detector = fitted_detector(model_dir, [IndustryType.ENERGY], processes=1)
+            print("✅ 模型初始化成功")
+
+            # 测试异常检测
+            print("🔍 测试异常检测...")
+            result = detector.detect_anomalies(IndustryType.ENERGY, 30)
+            detector.close()
+
         print("📊 检测结果:")
         print(f"   - 异常数量: {len(result.get('anomalies', []))}")
         print(f"   - 风险等级: {result.get('risk_level', 'unknown')}")
         print(f"   - 建议数量: {len(result.get('recommendations', []))}")
-        
+
         if 'anomalies' in result and result['anomalies']:
             print("   - 第一个异常:")
             first_anomaly = result['anomalies'][0]
             print(f"     日期: {first_anomaly.get('date', 'N/A')}")
             print(f"     分数: {first_anomaly.get('anomaly_score', 'N/A')}")
             print(f"     原因: {first_anomaly.get('reasons', [])}")
-        
+
         print("🎉 异常检测测试通过！")
         return True
-        
+
     except Exception as e:
         print(f"❌ 测试失败: {e}")
         import traceback
         traceback.print_exc()
         return False
 
+
+def test_fusion_matches_row_loop():
+    """向量化融合与逐行累加的结果一致"""
+    print("\n🔍 测试异常融合...")
+
+    try:
+        rng = np.random.default_rng(0)
+        n = 500
+        data = pd.DataFrame({
+            "date": pd.date_range("2024-01-01", periods=n, freq="D"),
+            "emission": rng.normal(800, 80, n),
+            "energy_consumption": rng.normal(4000, 400, n),
+            "temperature": rng.normal(22, 5, n)
+        })
+        flags = rng.random((n, 3)) < 0.15
+
+        detector = AnomalyDetector(processes=1, fit_missing=False)
+        records = detector._anomaly_records(detector._fuse_anomalies(data, flags[:, 0], flags[:, 1], flags[:, 2]))
+
+        # 参考实现：逐行按方法权重累加得分
+        expected = []
+        for i, row in data.iterrows():
+            score, reasons = 0.0, []
+            for hit, weight, reason in zip(flags[i], (0.4, 0.4, 0.2), FUSION_REASONS[7]):
+                if hit:
+                    score += weight
+                    reasons.append(reason)
+            if not reasons:
+                continue
+            severity = ("critical" if score >= 0.8 else "high" if score >= 0.6
+                        else "medium" if score >= 0.4 else "low")
+            expected.append({
+                "date": row["date"],
+                "anomaly_score": round(score, 3),
+                "reasons": reasons,
+                "emission": row["emission"],
+                "energy_consumption": row["energy_consumption"],
+                "temperature": row["temperature"],
+                "severity": severity
+            })
+
+        assert len(records) == len(expected), f"异常数量不一致: {len(records)} != {len(expected)}"
+        for record, reference in zip(records, expected):
+            assert pd.Timestamp(record["date"]) == reference["date"], record
+            for name in ("anomaly_score", "reasons", "emission", "energy_consumption", "temperature", "severity"):
+                assert record[name] == reference[name], f"{name}: {record[name]} != {reference[name]}"
+
+        print(f"✅ 融合结果一致（{len(records)} 条异常）")
+        return True
+
+    except Exception as e:
+        print(f"❌ 异常融合测试失败: {e}")
+        return False
+
+
+def test_risk_and_summary_match_records():
+    """列式风险评估与统计摘要与基于异常记录列表的计算一致"""
+    print("\n🔍 测试风险评估与统计摘要...")
+
+    try:
+        rng = np.random.default_rng(2)
+        n = 400
+        data = pd.DataFrame({
+            "date": pd.date_range("2024-01-15", periods=n, freq="D"),
+            "emission": rng.normal(800, 80, n),
+            "energy_consumption": rng.normal(4000, 400, n),
+            "temperature": rng.normal(22, 5, n)
+        })
+        detector = AnomalyDetector(processes=1, fit_missing=False)
+
+        # 各方法命中概率不同的组合，覆盖无异常及 low/medium/high/critical 各风险等级
+        rates = [(0, 0, 0), (0, 0, 0.05), (0.05, 0, 0), (0.01, 0, 0.01), (0.1, 0.1, 0.05), (0.3, 0.3, 0.3)]
+        for rate in rates:
+            flags = rng.random((n, 3)) < np.array(rate)
+            detection = detector._fuse_anomalies(data, flags[:, 0], flags[:, 1], flags[:, 2])
+            records = detector._anomaly_records(detection)
+
+            # 参考实现：在记录列表上逐条统计
+            if records:
+                avg_score = np.mean([a["anomaly_score"] for a in records])
+                critical = sum(1 for a in records if a["severity"] == "critical")
+                high = sum(1 for a in records if a["severity"] == "high")
+                if critical > 0 or avg_score > 0.8:
+                    expected_risk = "critical"
+                elif high > 2 or avg_score > 0.6:
+                    expected_risk = "high"
+                elif high > 0 or avg_score > 0.4:
+                    expected_risk = "medium"
+                else:
+                    expected_risk = "low"
+
+                severity_counts, monthly_counts = {}, {}
+                dates = [datetime.fromisoformat(a["date"]) for a in records]
+                for anomaly, date in zip(records, dates):
+                    severity_counts[anomaly["severity"]] = severity_counts.get(anomaly["severity"], 0) + 1
+                    monthly_counts[date.strftime("%Y-%m")] = monthly_counts.get(date.strftime("%Y-%m"), 0) + 1
+                expected_summary = {
+                    "total_anomalies": len(records),
+                    "severity_distribution": severity_counts,
+                    "monthly_distribution": monthly_counts,
+                    "anomaly_rate": len(records) / n * 100,
+                    "date_range": {"start": min(dates).isoformat(), "end": max(dates).isoformat()}
+                }
+            else:
+                expected_risk = "low"
+                expected_summary = {"message": "未检测到异常"}
+
+            risk_level = detector._assess_risk_level(detection)
+            summary = detector._generate_statistical_summary(detection, n)
+            assert risk_level.value == expected_risk, f"{rate}: {risk_level.value} != {expected_risk}"
+            assert summary == expected_summary, f"{rate}: {summary} != {expected_summary}"
+
+        print(f"✅ 风险评估与统计摘要一致（{len(rates)} 组）")
+        return True
+
+    except Exception as e:
+        print(f"❌ 风险评估与统计摘要测试失败: {e}")
+        return False
+
+
+def test_chunked_scoring():
+    """超长序列分块评分：进程池与本进程逐块评分一致，返回的异常明细按上限截断"""
+    print("\n🔍 测试分块评分...")
+
+    try:
+        with tempfile.TemporaryDirectory() as model_dir:
+            detector = fitted_detector(model_dir, [IndustryType.ENERGY], processes=1)
+            components = detector._get_components(IndustryType.ENERGY.value)
+            spec = detector._series_spec(IndustryType.ENERGY, 200, SamplingFrequency.HOURLY)
+
+            scorer = ChunkedScorer(2, chunk_rows=1000)
+            try:
+                pooled = scorer.score_spec(spec, ANOMALY_FEATURES, REPORT_COLUMNS, components)
+            finally:
+                scorer.close()
+            inline = score_spec_inline(spec, ANOMALY_FEATURES, REPORT_COLUMNS, components, 1000)
+
+            assert len(pooled[0]) == spec["periods"], f"行数不一致: {len(pooled[0])}"
+            assert pooled[0].equals(inline[0]), "报告列不一致"
+            assert np.array_equal(pooled[1], inline[1]), "隔离森林标记不一致"
+            assert np.array_equal(pooled[3], inline[3]), "Z-score标记不一致"
+            # 重构误差在不同线程数下的矩阵运算可能有末位差异
+            assert np.allclose(pooled[2], inline[2], rtol=1e-5), "重构误差不一致"
+
+            # 返回的异常明细不超过上限，且为分数最高者
+            result = detector.detect_anomalies(IndustryType.ENERGY, 200, frequency=SamplingFrequency.HOURLY,
+                                               max_anomalies=20)
+            full = detector.detect_anomalies(IndustryType.ENERGY, 200, frequency=SamplingFrequency.HOURLY,
+                                             max_anomalies=5000)
+            total = result["statistical_summary"]["total_anomalies"]
+            assert total > 20 and len(result["anomalies"]) == 20, f"截断失败: {len(result['anomalies'])}/{total}"
+            top_scores = sorted((a["anomaly_score"] for a in full["anomalies"]), reverse=True)[:20]
+            assert sorted((a["anomaly_score"] for a in result["anomalies"]), reverse=True) == top_scores
+            dates = [a["date"] for a in result["anomalies"]]
+            assert dates == sorted(dates), "截断后的异常未按时间排序"
+
+        print(f"✅ 分块评分一致（{spec['periods']} 行）")
+        return True
+
+    except Exception as e:
+        print(f"❌ 分块评分测试失败: {e}")
+        return False
+
+
+def test_streaming_statistics():
+    """流式检测的在线统计量：P² 分位数与 Welford 均值/标准差"""
+    print("\n🔍 测试流式统计量...")
+
+    try:
+        from sklearn.preprocessing import StandardScaler
+
+        rng = np.random.default_rng(1)
+        samples = {
+            "正态": rng.normal(10, 2, 20000),
+            "指数": rng.exponential(1.0, 20000)
+        }
+        for name, values in samples.items():
+            for p in (0.5, 0.95, 0.99):
+                estimator = P2Quantile(p)
+                for x in values:
+                    estimator.update(float(x))
+                expected = np.quantile(values, p)
+                error = abs(estimator.value - expected) / expected
+                assert error < 0.03, f"{name}分布 p={p}: {estimator.value:.4f} vs {expected:.4f}"
+
+        # 以前半段拟合的标准化器为初始统计量，逐点追加后半段
+        X = rng.normal([800, 4000, 22], [80, 400, 5], size=(4000, 3))
+        stats = RunningStats.from_scaler(StandardScaler().fit(X[:1000]))
+        for row in X[1000:]:
+            stats.update(row)
+        assert stats.count == len(X)
+        assert np.allclose(stats.mean, X.mean(axis=0), rtol=1e-9), stats.mean
+        assert np.allclose(stats.std, X.std(axis=0), rtol=1e-9), stats.std
+
+        print("✅ P² 分位数与 Welford 统计量正确")
+        return True
+
+    except Exception as e:
+        print(f"❌ 流式统计量测试失败: {e}")
+        return False
+
+
+def test_sweep_matches_detect():
+    """多行业巡检（进程池评分与单进程评分）与逐行业检测的结果一致"""
+    print("\n🔍 测试多行业巡检...")
+
+    industries = [IndustryType.ENERGY, IndustryType.MANUFACTURING]
+    try:
+        with tempfile.TemporaryDirectory() as model_dir:
+            pooled = fitted_detector(model_dir, industries, processes=2)
+            # 单进程检测器直接安装同一组模型
+            inline = AnomalyDetector(seed=42, processes=1, fit_missing=False)
+            for industry in industries:
+                key = industry.value
+                inline._install(key, pooled._get_components(key), pooled.versions[key])
+            inline.is_initialized = True
+
+            try:
+                pooled_sweep = pooled.detect_anomalies_sweep(industries, time_range=90)
+                inline_sweep = inline.detect_anomalies_sweep(industries, time_range=90)
+                detected = {industry.value: inline.detect_anomalies(industry, 90, max_anomalies=5000)
+                            for industry in industries}
+            finally:
+                pooled.close()
+
+        assert not pooled_sweep["failed"], pooled_sweep["failed"]
+        assert pooled_sweep == inline_sweep, "进程池巡检与单进程巡检结果不一致"
+        for result in pooled_sweep["results"]:
+            expected = detected[result["industry"]]
+            assert result["anomalies"] == expected["anomalies"], f"{result['industry']} 异常明细不一致"
+            assert result["risk_level"] == expected["risk_level"]
+            assert result["statistical_summary"] == expected["statistical_summary"]
+
+        print(f"✅ 巡检结果一致（{len(industries)} 个行业）")
+        return True
+
+    except Exception as e:
+        print(f"❌ 多行业巡检测试失败: {e}")
+        return False
+
+
+def test_store_dedup():
+    """历史异常存储去重：重复写入与重复检测同一窗口不会增加记录"""
+    print("\n🔍 测试历史异常存储...")
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            store = AnomalyStore(os.path.join(tmp, "anomalies.db"))
+            anomalies = [
+                {"date": "2024-01-01", "anomaly_score": 0.6, "severity": "high", "reasons": ["统计指标超出正常范围"]},
+                {"date": "2024-01-02", "anomaly_score": 0.4, "severity": "medium", "reasons": ["自编码器重构误差异常"]}
+            ]
+            assert store.append("energy", anomalies) == 2
+            assert store.append("energy", anomalies) == 0, "同一 (行业, 时间) 被重复写入"
+
+            # 固定种子的模拟检测：重复检测同一窗口、或检测覆盖已有时段的更长窗口，记录数都不变
+            detector = fitted_detector(tmp, [IndustryType.ENERGY], processes=1, store=store)
+            detector.detect_anomalies(IndustryType.ENERGY, 30)
+            total = store.get_stats()["total"]
+            assert total > 2, "检测结果未写入历史存储"
+            detector.detect_anomalies(IndustryType.ENERGY, 30)
+            detector.detect_anomalies(IndustryType.ENERGY, 60)
+            assert store.get_stats()["total"] == total, "重复检测使历史记录膨胀"
+
+            # 未指定种子时模拟数据不可复现，不写入
+            unseeded = AnomalyStore(os.path.join(tmp, "unseeded.db"))
+            detector = fitted_detector(tmp, [IndustryType.ENERGY], processes=1, store=unseeded, seed=None)
+            detector.detect_anomalies(IndustryType.ENERGY, 30)
+            assert unseeded.get_stats()["total"] == 0, "未指定种子的模拟异常被写入"
+
+        print("✅ 历史异常存储去重正确")
+        return True
+
+    except Exception as e:
+        print(f"❌ 历史异常存储测试失败: {e}")
+        return False
+
+
+def test_store_sources():
+    """历史存储按来源判断新记录：流式读数不挡住检测写入，未来时间的读数被拒绝"""
+    print("\n🔍 测试历史异常来源...")
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            store = AnomalyStore(os.path.join(tmp, "anomalies.db"))
+            detector = fitted_detector(tmp, [IndustryType.ENERGY], processes=1, store=store)
+            stream = StreamingAnomalyDetector(detector)
+
+            # 时间为当前时刻的流式异常先写入，之后的检测结果仍按检测来源自身的最新时间追加
+            now = datetime.now().replace(microsecond=0)
+            store.append("energy", [{"timestamp": now.isoformat(), "anomaly_score": 0.9, "severity": "high"}],
+                         source="stream")
+            detector.detect_anomalies(IndustryType.ENERGY, 30)
+            assert store.get_stats()["total"] > 1, "流式记录挡住了检测结果的写入"
+
+            # 未来时间的读数返回错误事件，不写入存储
+            total = store.get_stats()["total"]
+            events = stream.score_readings([
+                {"industry": "energy", "timestamp": (now + timedelta(days=1)).isoformat(), "emission": 1e6},
+                {"industry": "energy", "timestamp": (now - timedelta(hours=1)).isoformat(), "emission": 800}
+            ])
+            assert "error" in events[0] and "error" not in events[1], events
+            assert store.get_stats()["total"] <= total + 1
+
+            # 不写入存储时不调用 record_anomalies
+            calls = []
+            unseeded = fitted_detector(tmp, [IndustryType.ENERGY], processes=1, store=store, seed=None)
+            unseeded.record_anomalies = lambda *args, **kwargs: calls.append(args)
+            unseeded.detect_anomalies(IndustryType.ENERGY, 30)
+            assert not calls, "未指定种子时仍构造了待写入的异常记录"
+            detector.close()
+            unseeded.close()
+
+        print("✅ 历史异常来源处理正确")
+        return True
+
+    except Exception as e:
+        print(f"❌ 历史异常来源测试失败: {e}")
+        return False
+
+
+def test_bundle_matches_files():
+    """模型包：导出后从内存映射加载的自编码器和标准化器与单独文件的检测结果一致"""
+    print("\n🔍 测试模型包加载...")
+
+    try:
+        with tempfile.TemporaryDirectory() as model_dir:
+            detector = fitted_detector(model_dir, [IndustryType.ENERGY], processes=1)
+            expected = detector.detect_anomalies(IndustryType.ENERGY, 60)
+            detector.close()
+
+            export_bundle(model_dir)
+            bundled = AnomalyDetector(bundle_path=os.path.join(model_dir, "model_bundle.bin"),
+                                      seed=42, processes=1, fit_missing=False)
+            bundled.model_dir = model_dir
+            bundled.initialize_models()
+            assert len(bundled.versions[IndustryType.ENERGY.value]) == 4, "未从模型包加载"
+            actual = bundled.detect_anomalies(IndustryType.ENERGY, 60)
+            bundled.close()
+
+        assert actual["anomalies"] == expected["anomalies"], "模型包与单独文件的检测结果不一致"
+        assert actual["risk_level"] == expected["risk_level"]
+        print(f"✅ 模型包加载结果一致 ({len(actual['anomalies'])} 个异常)")
+        return True
+
+    except Exception as e:
+        print(f"❌ 模型包加载测试失败: {e}")
+        return False
+
+
+def test_hot_reload():
+    """模型热替换：模型文件更新后重新加载并替换，文件损坏时继续使用旧模型"""
+    print("\n🔍 测试异常检测模型热替换...")
+
+    try:
+        with tempfile.TemporaryDirectory() as model_dir:
+            detector = fitted_detector(model_dir, [IndustryType.ENERGY], processes=1)
+            key = IndustryType.ENERGY.value
+            expected = detector.detect_anomalies(IndustryType.ENERGY, 60)
+
+            results = detector.reload_models()
+            assert results[key] == "unchanged", results
+            assert results[IndustryType.MINING.value] == "missing", results
+
+            # 更新标准化器文件的修改时间即视为新版本
+            scaler_path = os.path.join(model_dir, f"anomaly_scaler_{key}.pkl")
+            mtime = os.stat(scaler_path).st_mtime_ns + 10 ** 9
+            os.utime(scaler_path, ns=(mtime, mtime))
+            old_model = detector.models[key]
+            assert detector.reload_models()[key] == "reloaded"
+            assert detector.models[key] is not old_model, "模型引用未替换"
+            assert detector.detect_anomalies(IndustryType.ENERGY, 60)["anomalies"] == expected["anomalies"]
+
+            # 损坏的自编码器文件：加载失败，保留旧模型和旧版本
+            model_path = os.path.join(model_dir, f"autoencoder_{key}.pth")
+            with open(model_path, "wb") as f:
+                f.write(b"not a checkpoint")
+            os.utime(model_path, ns=(mtime + 10 ** 9, mtime + 10 ** 9))
+            served, version = detector.models[key], detector.versions[key]
+            assert detector.reload_models()[key] == "failed"
+            assert detector.models[key] is served and detector.versions[key] == version
+            actual = detector.detect_anomalies(IndustryType.ENERGY, 60)
+            detector.close()
+
+        assert actual["anomalies"] == expected["anomalies"], "加载失败后检测结果变化"
+        print("✅ 新版本替换后结果一致，损坏的模型文件不影响正在服务的模型")
+        return True
+
+    except Exception as e:
+        print(f"❌ 模型热替换测试失败: {e}")
+        return False
+
+
+def main():
+    """主测试函数"""
+    tests = [
+        ("异常检测", test_anomaly_detection),
+        ("异常融合", test_fusion_matches_row_loop),
+        ("风险评估与统计摘要", test_risk_and_summary_match_records),
+        ("分块评分", test_chunked_scoring),
+        ("流式统计量", test_streaming_statistics),
+        ("多行业巡检", test_sweep_matches_detect),
+        ("历史异常存储", test_store_dedup),
+        ("历史异常来源", test_store_sources),
+        ("模型包加载", test_bundle_matches_files),
+        ("模型热替换", test_hot_reload)
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        if test_func():
+            passed += 1
+        else:
+            print(f"❌ {test_name} 失败")
+
+    print(f"\n📊 测试结果: {passed}/{len(tests)} 通过")
+    return passed == len(tests)
+
+
 if __name__ == "__main__":
-    import asyncio
-    
-    # 运行测试
-    success = asyncio.run(test_anomaly_detection())
-    
+    success = main()
+
     if success:
         print("\n✅ 所有测试通过！异常检测功能正常工作")
     else:
-        print("\n❌ 测试失败，请检查错误信息") 
\ No newline at end of file
+        print("\n❌ 测试失败，请检查错误信息")
+    sys.exit(0 if success else 1)
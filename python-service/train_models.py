@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+离线训练碳排放预测模型
+
+为每个行业×资源组合训练LSTM模型，生成服务加载的
+models/lstm_{key}.pth 和 models/scaler_{key}.pkl。适合作为夜间定时任务运行：
+
+    python train_models.py --csv templates/emissions_template.csv --json-dir data
+
+--anomaly 额外在参考窗口上重新拟合各行业的异常检测模型（隔离森林、标准化器、自编码器）。
+加 --bundle 会在训练后把全部模型打包为 models/model_bundle.bin，服务启动时
+以内存映射方式加载；只打包已有模型可使用 --export-only。
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+current_dir = Path(__file__).resolve().parent
+if str(current_dir) not in sys.path:
+    sys.path.insert(0, str(current_dir))
+
+from models.schemas import IndustryType, ResourceType
+from services.model_trainer import ModelTrainer
+from services.model_bundle import export_bundle
+from services.anomaly_detector import AnomalyDetector
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="训练碳排放LSTM预测模型")
+    parser.add_argument("--csv", action="append", default=None,
+                        help="历史排放数据CSV（emissions_template.csv格式），可重复指定")
+    parser.add_argument("--json-dir", default="data", help="数据采集JSON所在目录")
+    parser.add_argument("--model-dir", default="models", help="模型输出目录")
+    parser.add_argument("--workers", type=int, default=None, help="并行进程数，默认等于CPU核数")
+    parser.add_argument("--epochs", type=int, default=30, help="训练轮数")
+    parser.add_argument("--batch-size", type=int, default=64, help="批大小")
+    parser.add_argument("--model-type", choices=["lstm", "multitask"], default="lstm",
+                        help="lstm: 每个组合一个模型; multitask: 所有组合共享一个模型")
+    parser.add_argument("--industry", action="append", choices=[i.value for i in IndustryType],
+                        help="只训练指定行业，可重复指定")
+    parser.add_argument("--resource", action="append", choices=[r.value for r in ResourceType],
+                        help="只训练指定资源类型，可重复指定")
+    parser.add_argument("--anomaly", action="store_true", help="同时重新拟合异常检测模型")
+    parser.add_argument("--bundle", action="store_true", help="训练完成后导出内存映射模型包")
+    parser.add_argument("--bundle-path", default=None, help="模型包路径，默认 {model-dir}/model_bundle.bin")
+    parser.add_argument("--export-only", action="store_true", help="跳过训练，只打包已有模型")
+    args = parser.parse_args()
+
+    if args.export_only:
+        print(json.dumps(export_bundle(args.model_dir, args.bundle_path), ensure_ascii=False, indent=2))
+        return
+
+    trainer = ModelTrainer(
+        model_dir=args.model_dir,
+        workers=args.workers,
+        epochs=args.epochs,
+        batch_size=args.batch_size
+    )
+    summary = trainer.train_all(
+        csv_paths=args.csv or ["templates/emissions_template.csv"],
+        json_dir=args.json_dir,
+        industries=[IndustryType(i) for i in args.industry] if args.industry else None,
+        resources=[ResourceType(r) for r in args.resource] if args.resource else None,
+        model_type=args.model_type
+    )
+
+    if args.anomaly:
+        detector = AnomalyDetector()
+        detector.model_dir = args.model_dir
+        industries = [IndustryType(i) for i in args.industry] if args.industry else list(IndustryType)
+        for industry in industries:
+            detector.fit_reference_models(industry)
+        summary["anomaly_models"] = [i.value for i in industries]
+
+    if args.bundle:
+        summary["bundle"] = export_bundle(args.model_dir, args.bundle_path)
+
+    print(json.dumps({k: v for k, v in summary.items() if k != "results"}, ensure_ascii=False, indent=2))
+    sys.exit(1 if summary["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()